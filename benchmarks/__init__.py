@@ -0,0 +1,12 @@
+"""
+Benchmarks for the auth and organisation endpoints.
+
+Run from the repo root, e.g.
+
+    python -m benchmarks.bench_api --users 2000 --orgs 500 --out results.json
+    python -m benchmarks.bench_api --db-uri postgresql://localhost/bench
+
+Everything runs in process against a local database (a temporary
+SQLite file by default). Results are written as JSON so runs can be
+compared across commits.
+"""
@@ -0,0 +1,122 @@
+"""
+Benchmarks for registration, login, organisation listing, user
+visibility and email validation, run against a seeded database.
+
+    python -m benchmarks.bench_api [--db-uri URI] [--users N] [--orgs M]
+        [--distribution powerlaw|uniform] [--alpha A] [--max-members K]
+        [--repeat R] [--out FILE]
+"""
+import argparse
+import os
+import tempfile
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db-uri", help="database to seed (default: a temporary SQLite file)")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--orgs", type=int, default=500)
+    parser.add_argument("--distribution", choices=("powerlaw", "uniform"), default="powerlaw")
+    parser.add_argument("--alpha", type=float, default=1.2, help="power-law exponent")
+    parser.add_argument("--mean-members", type=int, default=5, help="uniform mean org size")
+    parser.add_argument("--max-members", type=int, help="power-law largest org size")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="JSON results file (default: stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    tmpdir = None
+    if args.db_uri is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        args.db_uri = f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+
+    # The testing config reads these at import time
+    os.environ["HNG11_T2_TEST_POSTGRESQL_DATABASE_URI"] = args.db_uri
+    os.environ.setdefault("JWT_SECRET_KEY", "benchmark")
+    os.environ.setdefault("APP_SECRET_KEY", "benchmark")
+
+    from flask_jwt_extended import create_access_token
+    from sqlalchemy import func, select
+
+    from maincode import create_app, db
+    from maincode.mainapp import routes
+    from maincode.mainapp import utils as au
+    from maincode.mainapi.accounts import auth_user
+    from maincode.mainapp.model import User, users_organisations_table
+
+    from benchmarks.harness import bench, write_results
+    from benchmarks.seed import PASSWORD, seed
+
+    app = create_app(config_type="testing")
+    app.config.update(BCRYPT_LOG_ROUNDS=args.bcrypt_rounds, QUERY_BUDGET_RAISE=False)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user_ids, org_ids, sizes = seed(
+            args.users, args.orgs, args.distribution, args.alpha, args.mean_members, args.max_members, args.seed)
+
+        # The busiest member, and users they can and can't see
+        uo = users_organisations_table
+        heavy = db.session.scalar(
+            select(uo.c.users_id).group_by(uo.c.users_id).order_by(func.count().desc()).limit(1))
+        heavy_orgs = select(uo.c.organisations_id).where(uo.c.users_id == heavy)
+        co_members = select(uo.c.users_id).where(uo.c.organisations_id.in_(heavy_orgs))
+        visible = db.session.scalar(select(User.id).where(User.id.in_(co_members), User.id != heavy).limit(1))
+        hidden = db.session.scalar(select(User.id).where(User.id.not_in(co_members)).limit(1))
+        heavy_user = db.session.get(User, heavy)
+        client = app.test_client()
+
+        results = []
+        with app.test_request_context():
+            headers = {"Authorization": f"Bearer {create_access_token(heavy)}"}
+
+            # Benchmark working requests only
+            assert client.get("/api/organisations", headers=headers).status_code == 200
+            assert client.get(f"/api/users/{visible}", headers=headers).status_code == 200
+
+            counter = iter(range(10 ** 9))
+            results.append(bench("register_user", routes.register_user, repeat=max(1, args.repeat // 10),
+                                 warmup=1, setup=lambda: {
+                                     "firstName": "New", "lastName": "User", "phone": None,
+                                     "password": PASSWORD,
+                                     "email": f"new{next(counter)}@bench.example.com"}))
+            results.append(bench("auth_user", lambda: auth_user(heavy_user, PASSWORD),
+                                 repeat=max(1, args.repeat // 10), warmup=1))
+            results.append(bench("list_orgs", lambda: client.get("/api/organisations", headers=headers),
+                                 repeat=args.repeat))
+            results.append(bench("get_user_visible", lambda: client.get(f"/api/users/{visible}", headers=headers),
+                                 repeat=args.repeat))
+            if hidden is not None:
+                results.append(bench("get_user_hidden", lambda: client.get(f"/api/users/{hidden}", headers=headers),
+                                     repeat=args.repeat))
+            emails = [f"user{i}@bench.example.com" for i in range(100)] + ["not-an-email", "a@b", "@x.com"]
+            results.append(bench("is_valid_email_format",
+                                 lambda: [au.is_valid_email_format(e) for e in emails],
+                                 repeat=args.repeat * 5))
+
+        context = {
+            "database": db.engine.dialect.name,
+            "users": args.users,
+            "orgs": args.orgs,
+            "distribution": args.distribution,
+            "alpha": args.alpha,
+            "largest_org": max(sizes),
+            "heavy_user_orgs": db.session.scalar(select(func.count()).select_from(heavy_orgs.subquery())),
+            "bcrypt_rounds": args.bcrypt_rounds,
+        }
+        db.session.remove()
+        db.drop_all()
+
+    write_results(results, args.out, **context)
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Serialization benchmark for organisation lists: stdlib jsonify of
+to_dict() rows, and orjson of the same dicts.
+
+    python -m benchmarks.bench_json [--rows N] [--repeat R] [--out FILE]
+"""
+import argparse
+import os
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--out", help="JSON results file (default: stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ.setdefault("JWT_SECRET_KEY", "benchmark")
+    os.environ.setdefault("APP_SECRET_KEY", "benchmark")
+    os.environ.setdefault("HNG11_T2_TEST_POSTGRESQL_DATABASE_URI", "sqlite://")
+
+    from maincode import create_app
+    from maincode.mainapp.jsonprovider import OrjsonProvider, StdlibJSONProvider
+    from maincode.mainapp.model import Organisation
+
+    from benchmarks.harness import bench, write_results
+
+    app = create_app(config_type="testing")
+    # Compact output, as in production
+    app.debug = False
+
+    orgs = [Organisation(orgId=f"org-{i:06d}", name=f"User{i}'s Organisation", creatorId=f"user-{i}",
+                         description="Benchmark organisation" if i % 2 else None)
+            for i in range(args.rows)]
+
+    def envelope(rows):
+        return {"status": "success", "message": "Orgs fetched successfully", "data": {"organisations": rows}}
+
+    results = []
+    with app.test_request_context():
+        stdlib, fast = StdlibJSONProvider(app), OrjsonProvider(app)
+        results.append(bench("stdlib_to_dict", lambda: stdlib.response(
+            envelope([o.to_dict() for o in orgs])), repeat=args.repeat))
+        results.append(bench("orjson_to_dict", lambda: fast.response(
+            envelope([o.to_dict() for o in orgs])), repeat=args.repeat))
+
+    baseline = results[0]["mean_s"]
+    for result in results:
+        result["speedup"] = baseline / result["mean_s"]
+    write_results(results, args.out, rows=args.rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Compare two benchmark result files.
+
+    python -m benchmarks.compare before.json after.json
+"""
+import json
+import sys
+
+
+def compare(before, after):
+    """Return [(name, before mean, after mean, after / before)]"""
+    old = {r["name"]: r["mean_s"] for r in before["results"]}
+    rows = []
+    for result in after["results"]:
+        previous = old.get(result["name"])
+        ratio = result["mean_s"] / previous if previous else None
+        rows.append((result["name"], previous, result["mean_s"], ratio))
+    return rows
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    with open(argv[0]) as f:
+        before = json.load(f)
+    with open(argv[1]) as f:
+        after = json.load(f)
+
+    print(f"{(before['commit'] or '?')[:10]} -> {(after['commit'] or '?')[:10]}")
+    for name, previous, current, ratio in compare(before, after):
+        previous_ms = f"{previous * 1000:10.3f}" if previous is not None else f"{'-':>10}"
+        change = f"{ratio:6.2f}x" if ratio is not None else "   new"
+        print(f"{name:24} {previous_ms} ms {current * 1000:10.3f} ms {change}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Minimal timing harness.
+
+`bench()` runs a callable repeatedly and summarises the timings;
+`write_results()` stores a run with enough context (commit, database,
+Python) to compare it against runs of other commits.
+"""
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+
+def bench(name, fn, repeat=200, warmup=10, setup=None):
+    """Time `fn()` `repeat` times after `warmup` untimed calls.
+    `setup()`, if given, runs untimed before every call and its result
+    is passed to `fn`"""
+    def timed_call():
+        args = (setup(),) if setup is not None else ()
+        start = time.perf_counter()
+        fn(*args)
+        return time.perf_counter() - start
+
+    for _ in range(warmup):
+        timed_call()
+    timings = [timed_call() for _ in range(repeat)]
+
+    timings.sort()
+    mean = statistics.fmean(timings)
+    return {
+        "name": name,
+        "repeat": repeat,
+        "mean_s": mean,
+        "median_s": statistics.median(timings),
+        "p95_s": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "min_s": timings[0],
+        "max_s": timings[-1],
+        "ops_per_s": 1 / mean if mean else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(results, path=None, **context):
+    """Write `results` as JSON to `path`, or stdout"""
+    document = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        **context,
+        "results": results,
+    }
+    text = json.dumps(document, indent=2)
+    if path is None:
+        sys.stdout.write(text + "\n")
+    else:
+        with open(path, "w") as f:
+            f.write(text + "\n")
+    return document
@@ -0,0 +1,104 @@
+"""
+Synthetic data for the benchmarks.
+
+`seed()` bulk inserts `n_users` users, each with a default
+"<firstName>'s Organisation" as registration creates, and `n_orgs`
+organisations created by random users, which it fills either uniformly
+or with power-law sizes: the organisation of rank r gets about
+`max_members * r ** -alpha` members (`max_members` defaults to a tenth
+of the users), so a few are huge and most are tiny, as in real
+tenants.
+"""
+import random
+
+from sqlalchemy import insert, update
+
+from maincode import db, hasher
+from maincode.mainapp import utils as au
+from maincode.mainapp.membership import recount_memberships
+from maincode.mainapp.model import User, Organisation, users_organisations_table
+
+
+BATCH_SIZE = 1000
+PASSWORD = "benchmark-password"
+
+
+def org_sizes(n_orgs, n_users, distribution="powerlaw", alpha=1.2, mean_members=5, max_members=None, rng=random):
+    """Return the member count of each organisation"""
+    if distribution == "uniform":
+        return [min(n_users, max(1, rng.randint(1, 2 * mean_members - 1))) for _ in range(n_orgs)]
+    if distribution == "powerlaw":
+        max_members = min(n_users, max_members or max(1, n_users // 10))
+        sizes = [max(1, int(max_members * (rank ** -alpha))) for rank in range(1, n_orgs + 1)]
+        rng.shuffle(sizes)
+        return sizes
+    raise ValueError(f"Unknown distribution {distribution!r}")
+
+
+def _insert(table, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(insert(table), rows[start:start + BATCH_SIZE])
+
+
+def _update(model, rows):
+    # Bulk UPDATE by primary key
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(update(model), rows[start:start + BATCH_SIZE])
+
+
+def seed(n_users, n_orgs, distribution="powerlaw", alpha=1.2, mean_members=5, max_members=None, random_seed=0):
+    """Fill the database and return (user_ids, org_ids, sizes), where
+    `org_ids` and `sizes` leave out the default organisations"""
+    rng = random.Random(random_seed)
+    now = au.aware_utcnow()
+    # One hash for everyone: seeding shouldn't be bcrypt bound
+    password = hasher.hash(PASSWORD)
+
+    user_ids = [au.generate_new_id() for _ in range(n_users)]
+    _insert(User.__table__, [
+        {
+            "id": user_id, "userId": user_id, "firstName": f"User{i}", "lastName": "Bench",
+            "email": f"user{i}@bench.example.com", "password": password, "phone": None, "created_on": now,
+        }
+        for i, user_id in enumerate(user_ids)
+    ])
+
+    # Users and their default orgs point at each other, so the users go
+    # in first and get their defaultOrgId once the orgs exist
+    default_org_ids = [au.generate_new_id() for _ in user_ids]
+    _insert(Organisation.__table__, [
+        {
+            "id": org_id, "orgId": org_id, "name": f"User{i}'s Organisation", "description": "",
+            "created_on": now, "creatorId": user_id,
+        }
+        for i, (org_id, user_id) in enumerate(zip(default_org_ids, user_ids))
+    ])
+    _update(User, [
+        {"id": user_id, "defaultOrgId": org_id} for user_id, org_id in zip(user_ids, default_org_ids)
+    ])
+
+    org_ids = [au.generate_new_id() for _ in range(n_orgs)]
+    creators = [rng.choice(user_ids) for _ in org_ids]
+    _insert(Organisation.__table__, [
+        {
+            "id": org_id, "orgId": org_id, "name": f"Org {i}", "description": "",
+            "created_on": now, "creatorId": creator,
+        }
+        for i, (org_id, creator) in enumerate(zip(org_ids, creators))
+    ])
+
+    sizes = org_sizes(n_orgs, n_users, distribution, alpha, mean_members, max_members, rng)
+    memberships = [
+        {"users_id": user_id, "organisations_id": org_id, "created_on": now}
+        for user_id, org_id in zip(user_ids, default_org_ids)
+    ]
+    for org_id, creator, size in zip(org_ids, creators, sizes):
+        members = set(rng.sample(user_ids, size - 1)) if size > 1 else set()
+        members.add(creator)
+        memberships.extend(
+            {"users_id": user_id, "organisations_id": org_id, "created_on": now} for user_id in members)
+    _insert(users_organisations_table, memberships)
+    db.session.commit()
+
+    recount_memberships()
+    return user_ids, org_ids, sizes
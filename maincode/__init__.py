@@ -1,6 +1,3 @@
-
-import os
-import sentry_sdk
 from flask_smorest import Api
 from flask_admin import Admin
 from flask_bcrypt import Bcrypt
@@ -9,17 +6,29 @@ from flask_login import LoginManager
 from flask_sqlalchemy import SQLAlchemy
 from flask import Flask, g, current_app
 from flask_jwt_extended import JWTManager
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_admin.contrib.sqla import ModelView
-from sentry_sdk.integrations.flask import FlaskIntegration
+from sqlalchemy.orm import load_only, selectinload
 
 
 from maincode import config
-from .appstrings import lcl, ucl
+from .appstrings import lcl
+from .mainapp.metrics import Metrics
+from .mainapp.ratelimit import RateLimiter
+from .mainapp.orgcache import OrgCache
+from .mainapp.passwords import PasswordHasher
+from .mainapp.replicas import RoutingSession, replicas
+from .mainapp.tracing import init_sentry
+from .mainapp.jsonprovider import json_provider_class
 
 
 api = Api()
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 bcrypt = Bcrypt()
+hasher = PasswordHasher()
+limiter = RateLimiter()
+org_cache = OrgCache()
+metrics = Metrics()
 jwt = JWTManager()
 login_manager = LoginManager()
 admin = Admin(template_mode='bootstrap4')
@@ -37,11 +46,13 @@ def create_app(config_type=None):
     config.config_classes[config_type].init_app(app)
     config.BaseConfig.CONFIG_TYPE = config_type
 
-    sentry_sdk.init(
-        dsn=f"{os.environ.get(ucl.SENTRY_DSN_FOR_HNG)}",
-        integrations=[FlaskIntegration()],
-        traces_sample_rate=1.0
-    )
+    app.json = json_provider_class(app.config['JSON_PROVIDER'])(app)
+
+    if app.config['PROXY_FIX_X_FOR']:
+        # remote_addr becomes the client's address, e.g. for rate limiting
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+
+    init_sentry(app)
 
     app.config['API_SPEC_OPTIONS'] = {
         'security': [{"bearerAuth": []}],
@@ -60,11 +71,16 @@ def create_app(config_type=None):
     with app.app_context():
         g.db = db
         g.db.init_app(app)
+        replicas.init_app(app)
         migrate.init_app(app, db)
         api.init_app(current_app)
         jwt.init_app(current_app)
         admin.init_app(current_app)
         bcrypt.init_app(current_app)
+        hasher.init_app(current_app)
+        limiter.init_app(current_app)
+        org_cache.init_app(current_app)
+        metrics.init_app(current_app)
         login_manager.init_app(current_app)
 
     # Import MAIN app blueprints
@@ -74,6 +90,10 @@ def create_app(config_type=None):
     # Import API blueprints
     from maincode.mainapi.accounts import sm_accounts
 
+    # Register CLI commands
+    from maincode.commands import register_commands
+    register_commands(app)
+
     # Register MAIN app blueprints
     app.register_blueprint(mainapp)
     app.register_blueprint(mainapi)
@@ -90,18 +110,63 @@ class ViewOnly(ModelView):
     can_edit = False
     can_delete = False
 
+    # The tables are large: no COUNT(*) per page, and pages stay small
+    simple_list_pager = True
+    page_size = 50
+    can_set_page_size = True
+    max_page_size = 100
+    # Related rows are loaded by `get_query`, not joined in
+    column_auto_select_related = False
+
+    def _get_list_extra_args(self):
+        # flask-admin takes ?page_size=N as is
+        view_args = super()._get_list_extra_args()
+        if view_args.page_size:
+            view_args.page_size = min(view_args.page_size, self.max_page_size)
+        return view_args
+
+
+def _org_name(view, context, model, name):
+    org = getattr(model, name)
+    return org.name if org is not None else ""
+
+
+def _user_email(view, context, model, name):
+    user = getattr(model, name)
+    return user.email if user is not None else ""
+
 
 class UserAdminView(ViewOnly):
-    column_hide_backrefs = False
     column_list = (
-        'userId', 'firstName', 'lastName', 'email',
-        'organisations', 'organisations_created',
-        'phone', 'password', '_accessTokens',
+        'userId', 'firstName', 'lastName', 'email', 'phone',
+        'default_org', 'orgCount', 'created_on',
     )
+    # Indexed columns only, ids are time ordered
+    column_sortable_list = ('userId', 'email')
+    column_default_sort = ('id', True)
+    column_formatters = {'default_org': _org_name}
+
+    def get_query(self):
+        # Listed columns only (no password hashes), default orgs in one more query
+        return super().get_query().options(
+            load_only(User.id, User.userId, User.firstName, User.lastName, User.email, User.phone,
+                      User.defaultOrgId, User.orgCount, User.created_on),
+            selectinload(User.default_org).load_only(Organisation.id, Organisation.name),
+        )
 
 
 class OrganisationAdminView(ViewOnly):
-    pass
+    column_list = ('orgId', 'name', 'description', 'creator', 'memberCount', 'created_on')
+    column_sortable_list = ('orgId', 'name')
+    column_default_sort = ('id', True)
+    column_formatters = {'creator': _user_email}
+
+    def get_query(self):
+        return super().get_query().options(
+            load_only(Organisation.id, Organisation.orgId, Organisation.name, Organisation.description,
+                      Organisation.creatorId, Organisation.memberCount, Organisation.created_on),
+            selectinload(Organisation.creator).load_only(User.id, User.email),
+        )
 
 
 from maincode.mainapp.model import User, Organisation
@@ -10,6 +10,9 @@ class lcl:
     users = "users"
     error = "error"
     token = "token"
+    limit = "limit"
+    cursor = "cursor"
+    created = "created"
     status = "status"
     errors = "errors"
     message = "message"
@@ -44,9 +47,31 @@ class ucl:
     COMMIT_HASH = "COMMIT_HASH"
     DATABASE_URL = "DATABASE_URL"
     PRODUCTION_ENV = "PRODUCTION_ENV"
+    PASSWORD_HASH_WORKERS = "PASSWORD_HASH_WORKERS"
+    PASSWORD_HASH_MAX_PENDING = "PASSWORD_HASH_MAX_PENDING"
+    WEB_CONCURRENCY = "WEB_CONCURRENCY"
+    IDENTITY_CACHE_TTL = "IDENTITY_CACHE_TTL"
+    RATELIMIT_BACKEND = "RATELIMIT_BACKEND"
+    RATELIMIT_MMAP_PATH = "RATELIMIT_MMAP_PATH"
+    PROXY_FIX_X_FOR = "PROXY_FIX_X_FOR"
+    ADMIN_EMAILS = "ADMIN_EMAILS"
+    DB_POOL_SIZE = "DB_POOL_SIZE"
+    DB_MAX_OVERFLOW = "DB_MAX_OVERFLOW"
+    DB_POOL_TIMEOUT = "DB_POOL_TIMEOUT"
+    DB_POOL_RECYCLE = "DB_POOL_RECYCLE"
+    DB_STATEMENT_TIMEOUT_MS = "DB_STATEMENT_TIMEOUT_MS"
+    DB_SERVERLESS = "DB_SERVERLESS"
+    DATABASE_REPLICA_URLS = "DATABASE_REPLICA_URLS"
+    VERCEL = "VERCEL"
     APP_SECRET_KEY = "APP_SECRET_KEY"
     JWT_SECRET_KEY = "JWT_SECRET_KEY"
     SENTRY_DSN_FOR_HNG = "SENTRY_DSN_FOR_HNG"
+    SENTRY_TRACES_SAMPLE_RATE = "SENTRY_TRACES_SAMPLE_RATE"
+    METRICS_DIR = "METRICS_DIR"
+    METRICS_TOKEN = "METRICS_TOKEN"
+    JSON_PROVIDER = "JSON_PROVIDER"
+    ORG_CACHE_BACKEND = "ORG_CACHE_BACKEND"
+    ORG_CACHE_SQLITE_PATH = "ORG_CACHE_SQLITE_PATH"
     HNG11_T2_DEV_POSTGRESQL_DATABASE_URI = "HNG11_T2_DEV_POSTGRESQL_DATABASE_URI"
     HNG11_T2_PROD_POSTGRESQL_DATABASE_URI = "HNG11_T2_PROD_POSTGRESQL_DATABASE_URI"
     HNG11_T2_TEST_POSTGRESQL_DATABASE_URI = "HNG11_T2_TEST_POSTGRESQL_DATABASE_URI"
@@ -0,0 +1,61 @@
+"""
+Flask CLI commands, e.g. ``flask --app run recount-memberships``
+"""
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+@click.command('recount-memberships')
+@click.option('--batch-size', default=1000, show_default=True, help="Rows per UPDATE/transaction")
+@with_appcontext
+def recount_memberships_command(batch_size):
+    """Recompute memberCount and orgCount from users_organisations"""
+    from maincode.mainapp.membership import recount_memberships
+
+    orgs, users = recount_memberships(batch_size=batch_size)
+    click.echo(f"Fixed {orgs} organisation(s) and {users} user(s)")
+
+
+@click.command('purge-tokens')
+@click.option('--batch-size', default=1000, show_default=True, help="Rows per DELETE/transaction")
+@with_appcontext
+def purge_tokens_command(batch_size):
+    """Delete expired rows from access_tokens and revoked_tokens"""
+    from maincode.mainapp.revocation import revocations
+
+    access, revoked = revocations.purge_expired(batch_size=batch_size)
+    click.echo(f"Purged {access} access token(s) and {revoked} revoked token(s)")
+
+
+def _parse_since(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise click.BadParameter("expected an ISO 8601 datetime")
+
+
+@click.command('export')
+@click.argument('kind', type=click.Choice(['users', 'organisations', 'memberships']))
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']), default='ndjson', show_default=True)
+@click.option('--updated-since', callback=_parse_since, help="Only rows changed since (ISO 8601, UTC if naive)")
+@click.option('--output', '-o', type=click.File('w'), default='-', help="File to write, stdout by default")
+@with_appcontext
+def export_command(kind, fmt, updated_since, output):
+    """Stream users, organisations or memberships as NDJSON or CSV"""
+    from maincode.mainapp.export import export_chunks
+
+    for chunk in export_chunks(kind, fmt, updated_since=updated_since,
+                               batch_size=current_app.config['EXPORT_BATCH_SIZE']):
+        output.write(chunk)
+    output.flush()
+
+
+def register_commands(app):
+    app.cli.add_command(recount_memberships_command)
+    app.cli.add_command(purge_tokens_command)
+    app.cli.add_command(export_command)
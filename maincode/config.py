@@ -2,6 +2,31 @@ import os
 from datetime import datetime, timezone, timedelta
 
 from maincode.appstrings import lcl, ccl, ucl
+from maincode.mainapp.dbpool import engine_options
+from maincode.mainapp.replicas import replica_bind_keys
+
+
+def env_flag(name, default=False):
+    """Read a boolean env var"""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def password_hash_workers():
+    """Default bcrypt pool size per app process. Every gunicorn worker
+    gets its own pool, so the host's cores are split between them by
+    WEB_CONCURRENCY (gunicorn's own default for --workers); without it
+    the pool stays at 2 rather than one process per core per worker"""
+    try:
+        web_workers = int(os.environ.get(ucl.WEB_CONCURRENCY, ""))
+    except ValueError:
+        # Unset, or not a number gunicorn would take either
+        web_workers = 0
+    if web_workers > 0:
+        return max(1, (os.cpu_count() or 1) // web_workers)
+    return 2
 
 
 class BaseConfig:
@@ -11,8 +36,33 @@ class BaseConfig:
     SQLALCHEMY_TRACK_MODIFICATIONS = True
     SECRET_KEY = os.environ.get(ucl.APP_SECRET_KEY)
     CONFIG_TYPE = None  # updated in application factory
+    # Emails of the users allowed on admin-only endpoints
+    ADMIN_EMAILS = {
+        e.strip().lower() for e in os.environ.get(ucl.ADMIN_EMAILS, "").split(",") if e.strip()
+    }
     COMMIT_HASH = datetime.now(tz=timezone.utc).isoformat()
 
+    # SENTRY VARS (no DSN, no Sentry; traces are opt-in)
+    SENTRY_DSN = os.environ.get(ucl.SENTRY_DSN_FOR_HNG) or None
+    SENTRY_ERROR_SAMPLE_RATE = 1.0
+    SENTRY_TRACES_SAMPLE_RATE = float(os.environ.get(ucl.SENTRY_TRACES_SAMPLE_RATE, 0.0))
+    SENTRY_TRACES_ROUTE_RATES = {  # {path prefix: rate}, longest prefix wins
+        "/api/organisations": 0.01,
+    }
+
+    # METRICS VARS (METRICS_DIR aggregates across workers)
+    METRICS_ENABLED = True
+    METRICS_DIR = os.environ.get(ucl.METRICS_DIR) or None
+    METRICS_FLUSH_SECONDS = 5
+    METRICS_TOKEN = os.environ.get(ucl.METRICS_TOKEN) or None
+    METRICS_REQUIRE_TOKEN = False
+
+    # QUERY BUDGET VARS (over-budget views raise instead of logging)
+    QUERY_BUDGET_RAISE = False
+
+    # JSON VARS ("auto" uses orjson when installed, else the stdlib)
+    JSON_PROVIDER = os.environ.get(ucl.JSON_PROVIDER, "auto")
+
     # API VARS
     API_VERSION = "v1"
     OPENAPI_URL_PREFIX = "/"
@@ -22,20 +72,88 @@ class BaseConfig:
     API_TITLE = "HNG11 STAGE TWO TASK API"
     OPENAPI_SWAGGER_UI_URL = "https://cdn.jsdelivr.net/npm/swagger-ui-dist/"
 
+    # DATABASE POOL VARS (SQLALCHEMY_ENGINE_OPTIONS is built from these in init_app)
+    DB_POOL_SIZE = int(os.environ.get(ucl.DB_POOL_SIZE, 5))
+    DB_MAX_OVERFLOW = int(os.environ.get(ucl.DB_MAX_OVERFLOW, 10))
+    DB_POOL_TIMEOUT = int(os.environ.get(ucl.DB_POOL_TIMEOUT, 30))
+    DB_POOL_RECYCLE = int(os.environ.get(ucl.DB_POOL_RECYCLE, 1800))
+    DB_POOL_PRE_PING = True
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get(ucl.DB_STATEMENT_TIMEOUT_MS, 0))
+    DB_SERVERLESS = env_flag(ucl.DB_SERVERLESS)
+
+    # READ REPLICA VARS (each replica becomes a `replica_<n>` bind)
+    SQLALCHEMY_REPLICA_URIS = [
+        u.strip() for u in os.environ.get(ucl.DATABASE_REPLICA_URLS, "").split(",") if u.strip()
+    ]
+    READ_YOUR_WRITES_SECONDS = 5
+    READ_YOUR_WRITES_SIZE = 10_000
+
     # JWT VARS
     JWT_SECRET_KEY = os.environ.get(ucl.JWT_SECRET_KEY)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(days=30)
+    REVOCATION_REFRESH_SECONDS = 30
+    REVOCATION_BLOOM_CAPACITY = 100_000
+    REVOCATION_BLOOM_ERROR_RATE = 0.001
+
+    # IDENTITY CACHE VARS (TTL of 0 disables the cross-request cache)
+    IDENTITY_CACHE_TTL = int(os.environ.get(ucl.IDENTITY_CACHE_TTL, 0))
+    IDENTITY_CACHE_SIZE = 10_000
+
+    # ORGANISATION CACHE VARS
+    ORG_CACHE_ENABLED = True
+    ORG_CACHE_BACKEND = os.environ.get(ucl.ORG_CACHE_BACKEND, "memory")
+    ORG_CACHE_TTL = 60
+    ORG_CACHE_SIZE = 10_000
+    ORG_CACHE_SQLITE_PATH = os.environ.get(ucl.ORG_CACHE_SQLITE_PATH, "/tmp/maincode-org-cache.sqlite")
+
+    # BULK REGISTRATION VARS
+    BULK_REGISTER_MAX_ROWS = 10_000
+    BULK_REGISTER_CHUNK_SIZE = 500
+    BULK_ADD_TO_ORG_MAX_USERS = 10_000
+    BULK_ADD_TO_ORG_BATCH_SIZE = 1000
+
+    # EXPORT VARS
+    EXPORT_BATCH_SIZE = 1000
+
+    # PASSWORD HASHING VARS
+    BCRYPT_LOG_ROUNDS = 12
+    # Per gunicorn worker: keep PASSWORD_HASH_WORKERS x WEB_CONCURRENCY near the core count
+    PASSWORD_HASH_WORKERS = int(os.environ.get(ucl.PASSWORD_HASH_WORKERS, password_hash_workers()))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get(ucl.PASSWORD_HASH_MAX_PENDING, 32))
+    PASSWORD_HASH_RETRY_AFTER = 1
+
+    # RATE LIMIT VARS
+    RATELIMIT_ENABLED = True
+    RATELIMIT_BACKEND = os.environ.get(ucl.RATELIMIT_BACKEND, "memory")
+    RATELIMIT_MMAP_PATH = os.environ.get(ucl.RATELIMIT_MMAP_PATH, "/tmp/maincode-ratelimit.bin")
+    RATELIMIT_MMAP_SLOTS = 65536
+    RATELIMIT_RULES = {  # {scope: {dimension: (burst, per_seconds)}}
+        "login": {"ip": (30, 60), "email": (5, 60)},
+        "register": {"ip": (10, 60), "email": (3, 60)},
+    }
+    # Proxies in front of the app whose X-Forwarded-For is trusted for
+    # the client IP (0 when clients connect directly)
+    PROXY_FIX_X_FOR = int(os.environ.get(ucl.PROXY_FIX_X_FOR, 0))
 
     @staticmethod
     def init_app(app):
-        pass
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+        uris = app.config['SQLALCHEMY_REPLICA_URIS']
+        app.config.setdefault('SQLALCHEMY_BINDS', {
+            key: {"url": uri, **engine_options(app.config, uri)}
+            for key, uri in zip(replica_bind_keys(uris), uris)
+        })
 
 
 class TestingConfig(BaseConfig):
     DEBUG = True
     TESTING_ENV = True
     ROOT_DOMAIN = "http://localhost:5000"
+    BCRYPT_LOG_ROUNDS = 4
+    PASSWORD_HASH_WORKERS = 0
+    RATELIMIT_ENABLED = False
+    QUERY_BUDGET_RAISE = True
     SQLALCHEMY_DATABASE_URI = os.environ.get(
         ucl.HNG11_T2_TEST_POSTGRESQL_DATABASE_URI)
 
@@ -43,6 +161,7 @@ class TestingConfig(BaseConfig):
 class DevelopmentConfig(BaseConfig):
     DEBUG = True
     DEVELOPMENT_ENV = True
+    QUERY_BUDGET_RAISE = True
     ROOT_DOMAIN = "http://localhost:5000"
     SQLALCHEMY_DATABASE_URI = os.environ.get(
         ucl.HNG11_T2_DEV_POSTGRESQL_DATABASE_URI)
@@ -51,6 +170,13 @@ class DevelopmentConfig(BaseConfig):
 class ProductionConfig(BaseConfig):
     ROOT_DOMAIN = ""
     PRODUCTION_ENV = True
+    # /metrics is not public in production
+    METRICS_REQUIRE_TOKEN = True
+    DB_POOL_SIZE = int(os.environ.get(ucl.DB_POOL_SIZE, 10))
+    DB_POOL_RECYCLE = int(os.environ.get(ucl.DB_POOL_RECYCLE, 300))
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get(ucl.DB_STATEMENT_TIMEOUT_MS, 15_000))
+    # Vercel functions are short-lived, so pool at PgBouncer instead
+    DB_SERVERLESS = env_flag(ucl.DB_SERVERLESS, default=bool(os.environ.get(ucl.VERCEL)))
     SQLALCHEMY_DATABASE_URI = \
         os.environ.get(ucl.DATABASE_URL) or os.environ.get(
             ucl.HNG11_T2_PROD_POSTGRESQL_DATABASE_URI)
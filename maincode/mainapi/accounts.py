@@ -1,17 +1,31 @@
-from flask import jsonify
+import json
+import math
+
+from flask import Response, current_app, jsonify, request, stream_with_context
 from flask.views import MethodView
 from flask_login import login_user
 from flask_smorest import Blueprint as smBlueprint
 from flask_jwt_extended import (
+    get_jwt,
+    get_current_user,
     get_jwt_identity,
     jwt_required,
 )
 
+from maincode import db, limiter, org_cache
 from maincode.appstrings import lcl
 from maincode.mainapp import utils as au
+from maincode.mainapp import etags
+from maincode.mainapp import export
+from maincode.mainapp import membership
+from maincode.mainapp.dbpool import pool_stats
+from maincode.mainapp.passwords import HashingPoolSaturated
+from maincode.mainapp.querybudget import query_budget
+from maincode.mainapp.revocation import revocations
 from maincode.mainapp.model import User, Organisation
 from maincode.mainapi.schemas import UserSchema, OrganisationSchema, \
-    UserLoginSchema, AddUserToOrgSchema
+    UserLoginSchema, AddUserToOrgSchema, OrganisationListArgsSchema, LogoutSchema, \
+    BulkAddUsersToOrgSchema, ExportArgsSchema
 
 
 sm_accounts = smBlueprint("Accounts", __name__,
@@ -20,7 +34,9 @@ sm_accounts = smBlueprint("Accounts", __name__,
 
 # User urls
 LOGIN_USER_URL = "/auth/login"
+LOGOUT_USER_URL = "/auth/logout"
 REGISTER_USER_URL = "/auth/register"
+BULK_REGISTER_USER_URL = "/auth/register/bulk"
 GET_USER_URL = "/api/users/<string:id>"
 
 # Organisation urls
@@ -28,6 +44,12 @@ LIST_ORGS_URL = "/api/organisations"
 REGISTER_ORG_URL = "/api/organisations"
 GET_ORG_URL = "/api/organisations/<string:orgId>"
 ADD_USER_TO_ORG_URL = "/api/organisations/<string:orgId>/users"
+BULK_ADD_USERS_TO_ORG_URL = "/api/organisations/<string:orgId>/users/bulk"
+
+# Admin urls
+DB_POOL_STATS_URL = "/api/admin/stats/db-pool"
+ORG_CACHE_STATS_URL = "/api/admin/stats/org-cache"
+EXPORT_URL = "/api/admin/export/<any(users, organisations, memberships):kind>"
 
 
 def auth_user(user_or_email, password, login=False):
@@ -54,8 +76,10 @@ def auth_user(user_or_email, password, login=False):
 @sm_accounts.route(REGISTER_USER_URL)
 class RegisterUser(MethodView):
 
+    @query_budget(8)
     @sm_accounts.arguments(UserSchema)
     @sm_accounts.response(201, UserSchema)
+    @limiter.limit("register")
     def post(self, data):
         """REGISTER NEW USER"""
 
@@ -69,7 +93,7 @@ class RegisterUser(MethodView):
         if not au.is_valid_email_format(data[lcl.email]):
             errors[lcl.errors].append({lcl.field: lcl.email, lcl.message: "Invalid email"})
         
-        if data.get(lcl.phone) and not data[lcl.phone].replace('+', '').replace('-', '').isnumeric():
+        if data.get(lcl.phone) and not au.is_valid_phone(data[lcl.phone]):
             errors[lcl.errors].append({lcl.field: lcl.phone, lcl.message: "Invalid phone number"})
         
         if errors[lcl.errors]:
@@ -86,17 +110,76 @@ class RegisterUser(MethodView):
                     "user": user.to_dict()
                 }
             }), 201
+        except HashingPoolSaturated as e:
+            return au.busy_response(e.retry_after)
         except Exception as e: # noqa
             return jsonify(au.UNSUCCESSFUL_REGISTER_USER_RESPONSE), 400
         except: # noqa
             return jsonify(au.UNSUCCESSFUL_REGISTER_USER_RESPONSE), 400
 
 
+def read_bulk_rows():
+    """Return the rows of a bulk request body, sent either as a JSON
+    array or as NDJSON (one object per line). Lines that aren't valid
+    JSON come back as None so they're reported against their index"""
+    if request.mimetype == "application/x-ndjson":
+        rows = []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                rows.append(None)
+        return rows
+
+    rows = request.get_json(silent=True)
+    return rows if isinstance(rows, list) else None
+
+
+@sm_accounts.route(BULK_REGISTER_USER_URL)
+class RegisterUsersBulk(MethodView):
+
+    @jwt_required()
+    @au.admin_required
+    def post(self):
+        """REGISTER MANY USERS (ADMIN ONLY)"""
+        rows = read_bulk_rows()
+        if rows is None:
+            return jsonify({lcl.errors: [{lcl.field: None, lcl.message: "Expected a JSON array or NDJSON"}]}), 422
+
+        if len(rows) > current_app.config['BULK_REGISTER_MAX_ROWS']:
+            return jsonify({lcl.errors: [{lcl.field: None, lcl.message: "Too many rows"}]}), 422
+
+        try:
+            results = mainapp.routes.register_users_bulk(
+                rows, chunk_size=current_app.config['BULK_REGISTER_CHUNK_SIZE'])
+            created = sum(r[lcl.status] == lcl.created for r in results)
+
+            return jsonify({
+                "status": "success",
+                "message": "Bulk registration processed",
+                "data": {
+                    "created": created,
+                    "failed": len(results) - created,
+                    "results": results
+                }
+            }), 200
+        except HashingPoolSaturated as e:
+            return au.busy_response(e.retry_after)
+        except Exception as e: # noqa
+            return jsonify(au.UNSUCCESSFUL_BULK_REGISTER_RESPONSE), 400
+        except: # noqa
+            return jsonify(au.UNSUCCESSFUL_BULK_REGISTER_RESPONSE), 400
+
+
 @sm_accounts.route(LOGIN_USER_URL)
 class LoginUser(MethodView):
 
+    @query_budget(5)
     @sm_accounts.arguments(UserLoginSchema)
     @sm_accounts.response(200, UserSchema)
+    @limiter.limit("login")
     def post(self, data):
         """LOGIN USER"""
         
@@ -108,6 +191,7 @@ class LoginUser(MethodView):
             user = auth_user(data[lcl.email], data[lcl.password], login=True)
 
             user.set_new_access_token()
+            db.session.commit()
 
             return jsonify({
                 "status": "success",
@@ -117,34 +201,76 @@ class LoginUser(MethodView):
                     "user": user.to_dict()
                 }
             }), 200
+        except HashingPoolSaturated as e:
+            return au.busy_response(e.retry_after)
         except Exception as e: # noqa
             return jsonify(au.UNSUCCESSFUL_LOGIN_USER_RESPONSE), 401
         except: # noqa
             return jsonify(au.UNSUCCESSFUL_LOGIN_USER_RESPONSE), 401
 
 
+@sm_accounts.route(LOGOUT_USER_URL)
+class LogoutUser(MethodView):
+
+    @query_budget(8)
+    @jwt_required()
+    @sm_accounts.arguments(LogoutSchema)
+    def post(self, data):
+        """LOGOUT USER (REVOKE TOKEN)"""
+        try:
+            user_id = get_jwt_identity()
+
+            if data.get('allSessions'):
+                revocations.revoke_all(user_id)
+            revocations.revoke(user_id, [get_jwt()['jti']])
+
+            db.session.commit()
+
+            return jsonify({
+                "status": "success",
+                "message": "Logout successful",
+            }), 200
+        except Exception as e: # noqa
+            return jsonify(au.UNSUCCESSFUL_LOGOUT_USER_RESPONSE), 400
+        except: # noqa
+            return jsonify(au.UNSUCCESSFUL_LOGOUT_USER_RESPONSE), 400
+
+
 @sm_accounts.route(GET_USER_URL)
 class GetUser(MethodView):
 
+    @query_budget(4)
     @jwt_required()
     @sm_accounts.response(200, UserSchema)
     def get(self, id):
         """GET PARTICULAR USER"""
         try:
-            requested_user = User.get_self(id)
-            current_user = User.get_self(get_jwt_identity())
-            if (not current_user) or (not requested_user):
-                return jsonify(au.UNSUCCESSFUL_GET_USER_RESPONSE), 400
-            
-            if  requested_user != current_user \
-                and requested_user not in current_user.users_in_all_organisations:
+            current_user = get_current_user()
+            if id == current_user.id:
+                requested_user = current_user
+            else:
+                if request.if_none_match:
+                    # Revalidation only needs the version
+                    version = membership.visible_user_version(current_user, id)
+                    not_modified = etags.conditional(version and etags.make_etag(id, version))
+                    if not_modified is not None:
+                        return not_modified
+                requested_user = membership.visible_user(current_user, id)
+
+            if not requested_user:
                 return jsonify(au.UNSUCCESSFUL_GET_USER_RESPONSE), 400
 
-            return jsonify({
+            etag = etags.make_etag(requested_user.id, requested_user.version)
+            if requested_user is current_user:
+                not_modified = etags.conditional(etag)
+                if not_modified is not None:
+                    return not_modified
+
+            return etags.tag(jsonify({
                 "status": "success",
                 "message": "User fetched successfully",
                 "data": requested_user.to_dict()
-            }), 200
+            }), etag), 200
         except Exception as e: # noqa
             return jsonify(au.UNSUCCESSFUL_GET_USER_RESPONSE), 400
         except: # noqa
@@ -154,27 +280,55 @@ class GetUser(MethodView):
 @sm_accounts.route(LIST_ORGS_URL)
 class ListOrgs(MethodView):
 
+    @query_budget(5)
     @jwt_required()
+    @sm_accounts.arguments(OrganisationListArgsSchema, location="query")
     @sm_accounts.response(200, OrganisationSchema(many=True))
-    def get(self):
+    def get(self, args):
         """LIST ALL ORGS"""
-        try:
-            user_id = get_jwt_identity()
+        after = None
+        if args.get(lcl.cursor):
+            after = au.decode_cursor(args[lcl.cursor])
+            if after is None:
+                return jsonify(au.INVALID_CURSOR_RESPONSE), 422
 
-            user = User.get_self(user_id)
+        # Every page, and the unpaged list, gets its own tag
+        page = None
+        if args.get(lcl.limit) or after:
+            page = (args.get(lcl.limit) or au.DEFAULT_PAGE_LIMIT, after)
 
-            orgs = [
-                o.to_dict() for o in Organisation.query
-                if user in o.users or user == o.creator
-            ]
-            
-            return jsonify({
+        try:
+            user = get_current_user()
+
+            etag = None
+            if request.if_none_match:
+                etag = etags.make_etag(membership.organisations_version(user.id, org_ids=user.known_org_ids), page)
+                not_modified = etags.conditional(etag)
+                if not_modified is not None:
+                    return not_modified
+
+            data = {}
+            complete = None
+            if page is not None:
+                limit = page[0]
+                orgs, next_key = membership.user_organisations_page(
+                    user.id, limit, after=after, org_ids=user.known_org_ids)
+                data["nextCursor"] = au.encode_cursor(next_key) if next_key else None
+            else:
+                orgs = complete = membership.user_organisations_query(user.id, org_ids=user.known_org_ids).all()
+
+            if etag is None:
+                # Loaded rows spare the version query when they're all of them
+                etag = etags.make_etag(membership.organisations_version(
+                    user.id, org_ids=user.known_org_ids, orgs=complete), page)
+
+            data["organisations"] = [o.to_dict() for o in orgs]
+
+            return etags.tag(jsonify({
                 "status": "success",
                 "message": "Orgs fetched successfully",
-                "data": {
-                    "organisations": orgs
-                }
-            }), 200
+                "data": data
+            }), etag), 200
         except Exception as e: # noqa
             return jsonify(au.UNSUCCESSFUL_LIST_ORGS_RESPONSE), 400
         except: # noqa
@@ -184,20 +338,33 @@ class ListOrgs(MethodView):
 @sm_accounts.route(GET_ORG_URL)
 class GetOrg(MethodView):
 
+    @query_budget(4)
     @jwt_required()
     @sm_accounts.response(200, OrganisationSchema)
     def get(self, orgId):
         """GET PARTICULAR ORGANISATION"""
         try:
-            org = Organisation.get_self(orgId)
+            if request.if_none_match and not org_cache.enabled():
+                # Revalidation only needs the version
+                version = Organisation.get_version(orgId)
+                not_modified = etags.conditional(version and etags.make_etag(orgId, version))
+                if not_modified is not None:
+                    return not_modified
+
+            org = org_cache.get(orgId)
             if not org:
                 return jsonify(au.UNSUCCESSFUL_GET_ORG_RESPONSE), 400
+
+            etag = etags.make_etag(orgId, org["version"])
+            not_modified = etags.conditional(etag)
+            if not_modified is not None:
+                return not_modified
             
-            return jsonify({
+            return etags.tag(jsonify({
                 "status": "success",
                 "message": "Org fetched successfully",
-                "data": org.to_dict()
-            }), 200
+                "data": org["data"]
+            }), etag), 200
         except Exception as e: # noqa
             return jsonify(au.UNSUCCESSFUL_GET_ORG_RESPONSE), 400
         except: # noqa
@@ -207,6 +374,7 @@ class GetOrg(MethodView):
 @sm_accounts.route(REGISTER_ORG_URL)
 class RegisterOrg(MethodView):
 
+    @query_budget(9)
     @jwt_required()
     @sm_accounts.arguments(OrganisationSchema)
     @sm_accounts.response(201, OrganisationSchema)
@@ -234,6 +402,7 @@ class RegisterOrg(MethodView):
 @sm_accounts.route(ADD_USER_TO_ORG_URL)
 class AddUserToOrg(MethodView):
 
+    @query_budget(6)
     @sm_accounts.arguments(AddUserToOrgSchema(only={'userId'}))
     def post(self, data, orgId):
         """ADD USER TO ORG"""
@@ -252,11 +421,114 @@ class AddUserToOrg(MethodView):
             return jsonify(au.UNSUCCESSFUL_ADD_USER_TO_ORG_RESPONSE), 401
 
 
+def bulk_add_budget():
+    # Fixed lookups, then an org UPDATE, a users UPDATE and an INSERT per batch
+    user_ids = (request.get_json(silent=True) or {}).get('userIds') or []
+    return 6 + 3 * math.ceil(len(user_ids) / current_app.config['BULK_ADD_TO_ORG_BATCH_SIZE'])
+
+
+@sm_accounts.route(BULK_ADD_USERS_TO_ORG_URL)
+class AddUsersToOrgBulk(MethodView):
+
+    @query_budget(bulk_add_budget)
+    @jwt_required()
+    @sm_accounts.arguments(BulkAddUsersToOrgSchema)
+    def post(self, data, orgId):
+        """ADD MANY USERS TO ORG"""
+        user_ids = data.get('userIds') or []
+        if len(user_ids) > current_app.config['BULK_ADD_TO_ORG_MAX_USERS']:
+            return jsonify({lcl.errors: [{lcl.field: 'userIds', lcl.message: "Too many userIds"}]}), 422
+
+        # Only members (and creators) of an org may add users to it in bulk
+        if orgId not in get_current_user().org_ids:
+            return jsonify(au.UNSUCCESSFUL_GET_ORG_RESPONSE), 400
+
+        try:
+            result = mainapp.routes.add_users_to_org_bulk(
+                user_ids, orgId, batch_size=current_app.config['BULK_ADD_TO_ORG_BATCH_SIZE'])
+            if not isinstance(result, tuple):
+                return jsonify(au.UNSUCCESSFUL_GET_ORG_RESPONSE), 400
+
+            added_ids, already_member_ids, unknown_ids = result
+            return jsonify({
+                "status": "success",
+                "message": "Users added to organisation successfully",
+                "data": {
+                    "added": added_ids,
+                    "alreadyMembers": already_member_ids,
+                    "unknownUserIds": unknown_ids
+                }
+            }), 200
+        except Exception as e: # noqa
+            return jsonify(au.UNSUCCESSFUL_BULK_ADD_USERS_TO_ORG_RESPONSE), 400
+        except: # noqa
+            return jsonify(au.UNSUCCESSFUL_BULK_ADD_USERS_TO_ORG_RESPONSE), 400
+
+
+@sm_accounts.route(DB_POOL_STATS_URL)
+class DbPoolStats(MethodView):
+
+    @query_budget(3)
+    @jwt_required()
+    @au.admin_required
+    def get(self):
+        """DATABASE POOL STATS (ADMIN ONLY)"""
+        return jsonify({
+            "status": "success",
+            "message": "Database pool stats",
+            "data": {
+                bind or "default": pool_stats(engine) for bind, engine in db.engines.items()
+            }
+        }), 200
+
+
+@sm_accounts.route(ORG_CACHE_STATS_URL)
+class OrgCacheStats(MethodView):
+
+    @query_budget(3)
+    @jwt_required()
+    @au.admin_required
+    def get(self):
+        """ORGANISATION CACHE STATS (ADMIN ONLY)"""
+        return jsonify({
+            "status": "success",
+            "message": "Organisation cache stats",
+            "data": {
+                "enabled": org_cache.enabled(),
+                "backend": current_app.config['ORG_CACHE_BACKEND'],
+                **org_cache.stats.snapshot(),
+            }
+        }), 200
+
+
+@sm_accounts.route(EXPORT_URL)
+class Export(MethodView):
+
+    # Rows are read while the response streams, after the view returns
+    @query_budget(3)
+    @jwt_required()
+    @au.admin_required
+    @sm_accounts.arguments(ExportArgsSchema, location="query")
+    def get(self, args, kind):
+        """STREAMING EXPORT (ADMIN ONLY)"""
+        fmt = args["format"]
+        chunks = export.export_chunks(
+            kind, fmt, updated_since=args.get("updated_since"),
+            batch_size=current_app.config['EXPORT_BATCH_SIZE'])
+        return Response(
+            stream_with_context(chunks), mimetype=export.FORMATS[fmt],
+            headers={"Content-Disposition": f'attachment; filename="{kind}.{fmt}"'})
+
+
 def register_accounts_api(app):
     app.add_url_rule(
         REGISTER_USER_URL, view_func=RegisterUser.as_view("register_user-register_user"))
+    app.add_url_rule(
+        BULK_REGISTER_USER_URL, view_func=RegisterUsersBulk.as_view("register_users_bulk-register_users_bulk"))
     app.add_url_rule(
         LOGIN_USER_URL, view_func=LoginUser.as_view("login_user-login_user"))
+    app.add_url_rule(
+        LOGOUT_USER_URL, view_func=LogoutUser.as_view("logout_user-logout_user"))
     app.add_url_rule(
         GET_USER_URL, view_func=GetUser.as_view("get_user-get_user"))
     app.add_url_rule(
@@ -265,6 +537,14 @@ def register_accounts_api(app):
         GET_ORG_URL, view_func=GetOrg.as_view("get_org-get_org"))
     app.add_url_rule(
         ADD_USER_TO_ORG_URL, view_func=AddUserToOrg.as_view("add_user_to_org_org-add_user_to_org_org"))
+    app.add_url_rule(
+        BULK_ADD_USERS_TO_ORG_URL, view_func=AddUsersToOrgBulk.as_view("add_users_to_org_bulk-add_users_to_org_bulk"))
+    app.add_url_rule(
+        DB_POOL_STATS_URL, view_func=DbPoolStats.as_view("db_pool_stats-db_pool_stats"))
+    app.add_url_rule(
+        ORG_CACHE_STATS_URL, view_func=OrgCacheStats.as_view("org_cache_stats-org_cache_stats"))
+    app.add_url_rule(
+        EXPORT_URL, view_func=Export.as_view("export-export"))
 
 
 from maincode import mainapp  # noqa
@@ -1,11 +1,16 @@
 """
 AVAILABLE TO THE PUBLIC
 """
-from flask import Blueprint, jsonify, redirect, request
+import hmac
 
-from maincode import jwt
+from flask import Blueprint, Response, abort, current_app, jsonify, redirect, request
+
+from maincode import jwt, metrics
 from maincode.config import BaseConfig
 from maincode.mainapp import utils as au
+from maincode.mainapp.identity import identities
+from maincode.mainapp.replicas import replicas
+from maincode.mainapp.revocation import revocations
 from .accounts import register_accounts_api
 
 
@@ -17,6 +22,18 @@ def openapi_swagger_ui():
     return redirect(f"{request.base_url}{BaseConfig.OPENAPI_SWAGGER_UI_PATH}")
 
 
+@mainapi.route("/metrics", methods=['GET'])
+def prometheus_metrics():
+    if not current_app.config['METRICS_ENABLED']:
+        abort(404)
+    token = current_app.config['METRICS_TOKEN']
+    if not token and current_app.config['METRICS_REQUIRE_TOKEN']:
+        abort(404)
+    if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return jsonify(au.jwt_error("No access token in request.", "authorization_required")), 401
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 @jwt.expired_token_loader
 def expired_token_callback(jwt_header, jwt_payload):  # noqa
     return (jsonify(au.jwt_error("The token has expired.", "token_expired")), 401)
@@ -42,4 +59,20 @@ def revoked_token_callback(jwt_header, jwt_payload):  # noqa
     return (jsonify(au.jwt_error("The token has been revoked.", "token_revoked")), 401)
 
 
+@jwt.token_in_blocklist_loader
+def check_if_token_revoked(jwt_header, jwt_payload):  # noqa
+    return revocations.is_revoked(jwt_payload["jti"])
+
+
+@jwt.user_lookup_loader
+def load_current_identity(jwt_header, jwt_payload):  # noqa
+    replicas.set_caller(jwt_payload["sub"], jwt_payload.get("iat"))
+    return identities.load(jwt_payload["sub"])
+
+
+@jwt.user_lookup_error_loader
+def missing_user_callback(jwt_header, jwt_payload):  # noqa
+    return (jsonify(au.jwt_error("The token's user no longer exists.", "user_not_found")), 401)
+
+
 register_accounts_api(mainapi)
@@ -1,4 +1,6 @@
-from marshmallow import Schema, fields
+from datetime import timezone
+
+from marshmallow import Schema, fields, validate
 
 
 class UserSchema(Schema):
@@ -15,11 +17,32 @@ class UserLoginSchema(Schema):
     password = fields.Str(load_only=True)
 
 
+class LogoutSchema(Schema):
+    allSessions = fields.Bool(load_default=False)
+
+
 class AddUserToOrgSchema(Schema):
     userId = fields.Str()
 
 
+class BulkAddUsersToOrgSchema(Schema):
+    userIds = fields.List(fields.Str(), required=True)
+
+
 class OrganisationSchema(Schema):
     orgId = fields.Str(dump_only=True)
     name = fields.Str()
-    description = fields.Str()
\ No newline at end of file
+    description = fields.Str()
+
+
+class OrganisationListArgsSchema(Schema):
+    """Query string of the organisations listing. Without `limit`
+    or `cursor` every organisation is returned at once, as before."""
+    limit = fields.Int(validate=validate.Range(min=1, max=1000))
+    cursor = fields.Str()
+
+
+class ExportArgsSchema(Schema):
+    """Query string of the admin exports"""
+    format = fields.Str(load_default="ndjson", validate=validate.OneOf(("ndjson", "csv")))
+    updated_since = fields.AwareDateTime(default_timezone=timezone.utc)
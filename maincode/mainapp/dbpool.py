@@ -0,0 +1,156 @@
+"""
+Instrumented connection pools.
+
+`engine_options()` builds `SQLALCHEMY_ENGINE_OPTIONS` from the app
+config. Either way the pool class is one of the instrumented
+subclasses below, which count checkouts and new connections and time
+how long callers wait for a connection. `pool_stats()` reads them for
+the admin stats endpoint.
+
+In serverless mode (`DB_SERVERLESS`) connections aren't pooled in the
+process at all: every checkout opens a fresh connection, which is
+meant to point at an external pooler such as PgBouncer. The "wait"
+time is then the connect time.
+
+Config:
+    DB_POOL_SIZE                connections kept open per worker
+    DB_MAX_OVERFLOW             extra connections allowed under load
+    DB_POOL_TIMEOUT             seconds to wait for a connection
+    DB_POOL_RECYCLE             seconds before a connection is replaced
+    DB_POOL_PRE_PING            test connections on checkout
+    DB_STATEMENT_TIMEOUT_MS     postgres statement_timeout, 0 disables
+    DB_SERVERLESS               use NullPool behind an external pooler
+"""
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+
+
+class PoolStats:
+    """Counters shared by every connection of one pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_checkout(self, waited, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def record_checkin(self):
+        with self._lock:
+            self.checkins += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def snapshot(self):
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "checkedOut": self.checkouts - self.checkins,
+                "connects": self.connects,
+                "timeouts": self.timeouts,
+                "waitSecondsTotal": round(self.wait_total, 6),
+                "waitSecondsAvg": round(self.wait_total / attempts, 6) if attempts else 0.0,
+                "waitSecondsMax": round(self.wait_max, 6),
+            }
+
+
+class _Instrumented:
+    """Mixin timing `_do_get` on top of a stock pool class"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def recreate(self):
+        # Keep counting across dispose()
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record_checkout(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record_checkout(time.perf_counter() - start)
+        return conn
+
+    def _do_return_conn(self, record):
+        self.stats.record_checkin()
+        super()._do_return_conn(record)
+
+    def _create_connection(self):
+        self.stats.record_connect()
+        return super()._create_connection()
+
+
+class InstrumentedQueuePool(_Instrumented, QueuePool):
+    pass
+
+
+class InstrumentedNullPool(_Instrumented, NullPool):
+    pass
+
+
+def engine_options(config, uri=None):
+    """Return `SQLALCHEMY_ENGINE_OPTIONS` for `config`, or the engine
+    options of the `uri` bind"""
+    uri = uri or config.get('SQLALCHEMY_DATABASE_URI')
+    url = make_url(uri) if uri else None
+
+    if url is not None and url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # In-memory SQLite needs its single StaticPool connection
+        return {}
+    if config.get('DB_SERVERLESS'):
+        options = {"poolclass": InstrumentedNullPool}
+    else:
+        options = {
+            "poolclass": InstrumentedQueuePool,
+            "pool_size": config['DB_POOL_SIZE'],
+            "max_overflow": config['DB_MAX_OVERFLOW'],
+            "pool_timeout": config['DB_POOL_TIMEOUT'],
+            "pool_recycle": config['DB_POOL_RECYCLE'],
+            "pool_pre_ping": config['DB_POOL_PRE_PING'],
+        }
+
+    timeout = config.get('DB_STATEMENT_TIMEOUT_MS')
+    if url is not None and timeout and url.get_backend_name() == "postgresql":
+        options["connect_args"] = {"options": f"-c statement_timeout={int(timeout)}"}
+    return options
+
+
+def pool_stats(engine):
+    """Return the state and counters of `engine`'s pool"""
+    pool = engine.pool
+    data = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        data.update({
+            "size": pool.size(),
+            "idle": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "timeout": pool.timeout(),
+        })
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        data.update(stats.snapshot())
+    return data
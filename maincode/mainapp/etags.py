@@ -0,0 +1,34 @@
+"""
+Conditional GETs.
+
+Views tag their responses with a weak ETag built from row versions
+(`User.version`, `Organisation.version`, `User.membershipVersion`) and
+answer 304 Not Modified when the request's If-None-Match already holds
+it. The versions are read with version-only queries first, so a 304
+never loads or serializes the rows themselves.
+
+Responses are per caller, so they are marked ``private, no-cache``:
+clients may keep them but must revalidate every time.
+"""
+import hashlib
+
+from flask import current_app, request
+
+
+def make_etag(*parts):
+    """Return an opaque ETag value for `parts`"""
+    return hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+
+
+def conditional(etag):
+    """Return a 304 response if the client already has `etag`, else None"""
+    if etag is None or not request.if_none_match.contains_weak(etag):
+        return None
+    return tag(current_app.response_class(status=304), etag)
+
+
+def tag(response, etag):
+    """Set the ETag and revalidation headers of `response`"""
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
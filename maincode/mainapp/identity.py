@@ -0,0 +1,128 @@
+"""
+The caller's identity for protected views.
+
+flask-jwt-extended's `user_lookup_loader` resolves the token subject
+once per request into an `Identity`: the user's public profile plus
+the ids of the organisations they belong to or created. Views read
+it with `get_current_user()` instead of reloading the User row.
+
+With `IDENTITY_CACHE_TTL` set, identities are also kept across
+requests in a per-worker LRU cache. Code that changes a user's
+memberships must call `identities.invalidate(user_id)`; other workers
+catch up when their entry expires.
+
+Config:
+    IDENTITY_CACHE_TTL      seconds an identity may be reused, 0 disables
+    IDENTITY_CACHE_SIZE     identities kept per worker
+"""
+import time
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+from maincode import db
+from maincode.mainapp.model import User
+from maincode.mainapp.membership import organisation_ids_query
+
+
+class Identity:
+    """Lightweight stand-in for the current User"""
+    __slots__ = ('id', 'profile', 'version', '_org_ids')
+
+    def __init__(self, user_id, profile, org_ids=None, version=None):
+        self.id = user_id
+        self.profile = profile
+        # User.version the profile was read at
+        self.version = version
+        self._org_ids = org_ids
+
+    @staticmethod
+    def from_user(user):
+        return Identity(user.id, user.to_dict(), version=user.version)
+
+    def to_dict(self):
+        return dict(self.profile)
+
+    @property
+    def known_org_ids(self):
+        """The organisation ids if already loaded, else None"""
+        return self._org_ids
+
+    @property
+    def org_ids(self) -> frozenset:
+        """Ids of the organisations the user belongs to or created"""
+        if self._org_ids is None:
+            self._org_ids = frozenset(db.session.scalars(organisation_ids_query(self.id)))
+        return self._org_ids
+
+
+class IdentityCache:
+    """Per-worker LRU cache of identities with a TTL"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, user_id, now, ttl):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            stored_at, identity = entry
+            if now - stored_at > ttl:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return identity
+
+    def put(self, identity, now, size):
+        with self._lock:
+            self._entries[identity.id] = (now, identity)
+            self._entries.move_to_end(identity.id)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class Identities:
+    """Loads identities, going through the app's cache when enabled"""
+
+    @staticmethod
+    def _cache():
+        return current_app.extensions.setdefault('identity_cache', IdentityCache())
+
+    def load(self, user_id):
+        """Return the Identity of `user_id`, or None if there's no such user"""
+        ttl = current_app.config['IDENTITY_CACHE_TTL']
+        now = time.monotonic()
+        if ttl:
+            identity = self._cache().get(user_id, now, ttl)
+            if identity is not None:
+                return identity
+
+        user = User.get_self(user_id)
+        if user is None:
+            return None
+
+        identity = Identity.from_user(user)
+        if ttl:
+            # Cached entries are complete so hits never query
+            identity.org_ids
+            self._cache().put(identity, now, current_app.config['IDENTITY_CACHE_SIZE'])
+        return identity
+
+    def invalidate(self, *user_ids):
+        if current_app.config['IDENTITY_CACHE_TTL']:
+            self._cache().invalidate(*user_ids)
+
+
+identities = Identities()
@@ -0,0 +1,66 @@
+"""
+JSON providers for the Flask app.
+
+`JSON_PROVIDER` picks one: "orjson", "stdlib", or "auto" (orjson when
+it's installed). orjson is in requirements.txt, "auto" falls back to
+the stdlib where it is missing. Both keep jsonify's output: sorted
+keys, trailing newline, indented in debug, and dates as HTTP dates.
+One difference is that orjson writes non-ASCII characters as UTF-8
+instead of \\u escapes.
+
+Config:
+    JSON_PROVIDER           "auto", "orjson" or "stdlib"
+"""
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    pass
+
+
+class OrjsonProvider(DefaultJSONProvider):
+
+    def _options(self, indent=False):
+        # Datetimes go through `default` so they render like jsonify's
+        option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Callers asking for json.dumps options get json.dumps
+            kwargs.setdefault('default', self.default)
+            return json.dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent)) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def json_provider_class(name):
+    """Return the provider class configured by `JSON_PROVIDER`"""
+    if name == "auto":
+        name = "orjson" if orjson is not None else "stdlib"
+    if name == "orjson":
+        if orjson is None:
+            raise RuntimeError("JSON_PROVIDER is 'orjson' but orjson isn't installed")
+        return OrjsonProvider
+    if name == "stdlib":
+        return StdlibJSONProvider
+    raise ValueError(f"Unknown JSON_PROVIDER {name!r}")
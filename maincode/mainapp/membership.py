@@ -0,0 +1,204 @@
+"""
+Membership queries shared by the API views and the models.
+
+Every lookup here is a single round trip whose cost depends on how
+many organisations the user is attached to, not on the total number
+of organisations in the database.
+
+`Organisation.memberCount` and `User.orgCount` mirror the rows of
+users_organisations, and `User.membershipVersion` goes up whenever
+the user joins or leaves an organisation. Code adding or removing
+memberships keeps them in step, either through the helpers below or,
+for objects already in the session, by assigning ``Model.column + 1``.
+`recount_memberships()` repairs any drift in the counts.
+"""
+from sqlalchemy import and_, bindparam, func, or_, select, union, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from maincode import db, org_cache
+from maincode.mainapp import utils as au
+from maincode.mainapp.model import User, Organisation, users_organisations_table
+
+
+def organisation_ids_query(user_id):
+    """Return a selectable of the ids of the organisations
+    `user_id` belongs to or created (UNION of both sources)"""
+    uo = users_organisations_table
+    return union(
+        select(uo.c.organisations_id.label('id'))
+        .where(uo.c.users_id == user_id),
+        select(Organisation.id.label('id'))
+        .where(Organisation.creatorId == user_id),
+    )
+
+
+def user_organisations_query(user_id, org_ids=None):
+    """Return a query of the organisations `user_id` belongs
+    to or created, oldest first. Pass `org_ids` when they are
+    already known to skip the membership UNION"""
+    if org_ids is None:
+        org_ids = select(organisation_ids_query(user_id).subquery().c.id)
+    return Organisation.query.filter(
+        Organisation.id.in_(org_ids)
+    ).order_by(Organisation.created_on, Organisation.id)
+
+
+def user_organisations_page(user_id, limit, after=None, org_ids=None):
+    """Return one keyset page of `user_organisations_query`.
+
+    `after` is the ``(created_on, id)`` of the last organisation of the
+    previous page. Returns ``(orgs, next_key)`` where ``next_key`` is
+    None on the last page."""
+    query = user_organisations_query(user_id, org_ids=org_ids)
+    if after is not None:
+        created_on, org_id = after
+        query = query.filter(or_(
+            Organisation.created_on > created_on,
+            and_(Organisation.created_on == created_on, Organisation.id > org_id),
+        ))
+
+    # Fetch one extra row to know whether there is a next page
+    orgs = query.limit(limit + 1).all()
+    if len(orgs) <= limit:
+        return orgs, None
+
+    orgs = orgs[:limit]
+    return orgs, (orgs[-1].created_on, orgs[-1].id)
+
+
+def organisations_version(user_id, org_ids=None, orgs=None):
+    """Return a value that changes whenever the organisations listed
+    for `user_id` do: joining or leaving one, or any of them being
+    updated. Pass `org_ids` when the listing is built from them, and
+    then `orgs` if every one of them is already loaded. At most one
+    query, that never loads the organisation rows"""
+    if org_ids is not None:
+        if orgs is not None:
+            return (sorted(org_ids), len(orgs), sum(o.version for o in orgs))
+        versions = db.session.execute(
+            select(func.count(), func.coalesce(func.sum(Organisation.version), 0))
+            .where(Organisation.id.in_(org_ids))).one()
+        return (sorted(org_ids), *versions)
+
+    uo = users_organisations_table
+    row = db.session.execute(
+        select(User.membershipVersion, func.count(Organisation.id),
+               func.coalesce(func.sum(Organisation.version), 0))
+        .select_from(User)
+        .outerjoin(uo, uo.c.users_id == User.id)
+        .outerjoin(Organisation, Organisation.id == uo.c.organisations_id)
+        .where(User.id == user_id)
+        .group_by(User.membershipVersion)).first()
+    return tuple(row) if row else None
+
+
+def _visible_to(viewer, user_id):
+    """Filter matching the User `user_id` if `viewer` may see them:
+    the one place the "same user or a shared organisation" rule lives.
+    Organisations count on both sides whether the user belongs to or
+    created them, as `organisation_ids_query` has it, and the answer is
+    the same whether or not the viewer's org ids are already loaded"""
+    org_ids = viewer.known_org_ids
+    if org_ids is None:
+        org_ids = select(organisation_ids_query(viewer.id).subquery().c.id)
+    uo = users_organisations_table
+    org_users = union(
+        select(uo.c.users_id.label('id')).where(uo.c.organisations_id.in_(org_ids)),
+        select(Organisation.creatorId.label('id')).where(Organisation.id.in_(org_ids)),
+    )
+    shared = User.id.in_(select(org_users.subquery().c.id))
+    return and_(User.id == user_id, or_(User.id == viewer.id, shared))
+
+
+def visible_user(viewer, user_id):
+    """Return the User `user_id` if `viewer` (an Identity) may see
+    them: it's the viewer, or they share an organisation. Loading
+    and the access check are a single query"""
+    return User.query.filter(_visible_to(viewer, user_id)).first()
+
+
+def visible_user_version(viewer, user_id):
+    """Return only the version of `visible_user(viewer, user_id)`,
+    or None"""
+    return db.session.scalar(select(User.version).where(_visible_to(viewer, user_id)))
+
+
+def insert_memberships(org_id, user_ids, batch_size=1000):
+    """Add `user_ids` to `org_id` with multi-row
+    ``INSERT ... ON CONFLICT DO NOTHING``, `batch_size` rows per
+    statement. Existing memberships are skipped. Returns the ids that
+    were actually added. Committing is left to the caller"""
+    dialect = {'postgresql': postgresql, 'sqlite': sqlite}[db.session.get_bind().dialect.name]
+    uo = users_organisations_table
+
+    added = []
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        stmt = dialect.insert(uo).values([
+            {'users_id': user_id, 'organisations_id': org_id, 'created_on': au.aware_utcnow()}
+            for user_id in batch
+        ]).on_conflict_do_nothing().returning(uo.c.users_id)
+        inserted = list(db.session.scalars(stmt))
+        adjust_counts(org_id, inserted, 1)
+        added.extend(inserted)
+    return added
+
+
+def remove_memberships(org_id, user_ids):
+    """Remove `user_ids` from `org_id` and return the ids that were
+    members. Committing is left to the caller"""
+    uo = users_organisations_table
+    removed = list(db.session.scalars(
+        uo.delete().where(uo.c.organisations_id == org_id, uo.c.users_id.in_(user_ids))
+        .returning(uo.c.users_id)))
+    adjust_counts(org_id, removed, -1)
+    return removed
+
+
+def adjust_counts(org_id, user_ids, delta):
+    """Move the counters by `delta` for `user_ids` joining (or leaving)
+    `org_id`, and bump their membership versions: two UPDATEs however
+    many users. The org's cache entry goes once the caller commits"""
+    if not user_ids:
+        return
+    db.session.execute(
+        update(Organisation.__table__).where(Organisation.__table__.c.id == org_id)
+        .values(memberCount=Organisation.__table__.c.memberCount + delta * len(user_ids)))
+    org_cache.invalidate_on_commit(db.session, org_id)
+    users = User.__table__
+    db.session.execute(
+        update(users).where(users.c.id.in_(user_ids))
+        .values(orgCount=users.c.orgCount + delta, membershipVersion=users.c.membershipVersion + 1))
+
+
+def _recount(table, key, counted_by, column, batch_size):
+    """Rewrite `column` of `table` from users_organisations, `batch_size`
+    rows at a time, touching only rows that drifted"""
+    uo = users_organisations_table
+    actual = select(func.count()).where(uo.c[counted_by] == table.c.id).scalar_subquery()
+
+    fixed = 0
+    last_id = ""
+    while True:
+        ids = db.session.scalars(
+            select(table.c.id).where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)).all()
+        if not ids:
+            return fixed
+        result = db.session.execute(
+            update(table).where(table.c.id.in_(bindparam(key, expanding=True)), table.c[column] != actual)
+            .values({column: actual}).returning(table.c.id), {key: ids})
+        fixed_ids = result.scalars().all()
+        if table is Organisation.__table__:
+            org_cache.invalidate_on_commit(db.session, *fixed_ids)
+        db.session.commit()
+        fixed += len(fixed_ids)
+        last_id = ids[-1]
+
+
+def recount_memberships(batch_size=1000):
+    """Recompute every counter with set-based UPDATEs, one transaction
+    per batch. Returns (orgs fixed, users fixed)"""
+    return (
+        _recount(Organisation.__table__, 'org_ids', 'organisations_id', 'memberCount', batch_size),
+        _recount(User.__table__, 'user_ids', 'users_id', 'orgCount', batch_size),
+    )
@@ -0,0 +1,334 @@
+"""
+Request and database instrumentation, served as Prometheus text.
+
+Recorded per request (labelled by url rule and method):
+    http_requests_total                 by status code
+    http_request_duration_seconds       latency histogram
+    db_queries_per_request              statement count histogram
+    db_queries_total                    statements issued
+    db_query_seconds_total              time spent in the database
+Recorded per bcrypt job:
+    password_hash_seconds               by operation (hash, hash_many, check)
+Recorded per cache lookup:
+    cache_requests_total                by cache and result (hit, miss)
+
+Every thread writes to its own `ThreadStats`, so recording takes no
+lock; a scrape merges the threads' stats, folding those of finished
+threads into a retired total. With `METRICS_DIR` set, each worker also
+writes a snapshot of its totals to `<METRICS_DIR>/<pid>.json` at most
+every `METRICS_FLUSH_SECONDS`, and a scrape adds up the other workers'
+snapshots. A scrape deletes the snapshots of workers whose pid is no
+longer running, so a dead worker's totals stop counting.
+
+`/metrics` requires `METRICS_TOKEN` when it is set. With
+`METRICS_REQUIRE_TOKEN`, as in production, it is not served at all
+until a token is set.
+
+Config:
+    METRICS_ENABLED             record and serve metrics
+    METRICS_DIR                 shared snapshot directory, unset for one process
+    METRICS_FLUSH_SECONDS       how often a worker writes its snapshot
+    METRICS_TOKEN               bearer token /metrics requires, if set
+    METRICS_REQUIRE_TOKEN       serve /metrics only when METRICS_TOKEN is set
+"""
+import json
+import os
+import threading
+import time
+import weakref
+from collections import defaultdict
+
+from flask import current_app, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+HASH_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+HELP = {
+    "http_requests_total": ("counter", "Requests handled"),
+    "http_request_duration_seconds": ("histogram", "Request latency"),
+    "db_queries_per_request": ("histogram", "SQL statements issued per request"),
+    "db_queries_total": ("counter", "SQL statements issued"),
+    "db_query_seconds_total": ("counter", "Time spent executing SQL"),
+    "password_hash_seconds": ("histogram", "bcrypt job latency, queueing included"),
+    "cache_requests_total": ("counter", "Cache lookups"),
+}
+
+_START = 'maincode.metrics_start'
+
+
+class ThreadStats:
+    """Counters and histograms written by a single thread"""
+
+    def __init__(self):
+        self.thread = weakref.ref(threading.current_thread())
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        # Statements of the request the thread is serving
+        self.request_queries = 0
+        self.request_db_seconds = 0.0
+
+    def inc(self, key, value=1.0):
+        self.counters[key] += value
+
+    def observe(self, key, buckets, value):
+        hist = self.histograms.get(key)
+        if hist is None:
+            # Per-bucket counts, then +Inf, then the sum
+            hist = self.histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                hist[i] += 1
+                break
+        else:
+            hist[len(buckets)] += 1
+        hist[-1] += value
+
+    def is_alive(self):
+        thread = self.thread()
+        return thread is not None and thread.is_alive()
+
+
+class Snapshot:
+    """Mergeable totals, keyed by (name, labels)"""
+
+    def __init__(self):
+        self.counters = defaultdict(float)
+        self.histograms = {}
+
+    def add(self, counters, histograms):
+        for key, value in counters.items():
+            self.counters[key] += value
+        for key, hist in histograms.items():
+            mine = self.histograms.get(key)
+            if mine is None:
+                self.histograms[key] = list(hist)
+            else:
+                self.histograms[key] = [a + b for a, b in zip(mine, hist)]
+
+    def to_json(self):
+        return json.dumps({
+            "counters": [[name, labels, value] for (name, labels), value in self.counters.items()],
+            "histograms": [[name, labels, hist] for (name, labels), hist in self.histograms.items()],
+        })
+
+    @staticmethod
+    def from_json(text):
+        data = json.loads(text)
+        snapshot = Snapshot()
+        snapshot.add(
+            {(name, tuple(map(tuple, labels))): value for name, labels, value in data["counters"]},
+            {(name, tuple(map(tuple, labels))): hist for name, labels, hist in data["histograms"]},
+        )
+        return snapshot
+
+
+class Metrics:
+    """Flask extension recording request and query stats"""
+
+    def __init__(self, app=None):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._retired = Snapshot()
+        self._last_flush = 0.0
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_DIR', None)
+        app.config.setdefault('METRICS_FLUSH_SECONDS', 5)
+        app.config.setdefault('METRICS_TOKEN', None)
+        app.config.setdefault('METRICS_REQUIRE_TOKEN', False)
+        app.extensions['metrics'] = self
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        with self._lock:
+            if not self._listening:
+                # Engine-wide, so replica binds are counted too
+                event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+                event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+                self._listening = True
+
+    def _stats(self):
+        stats = getattr(self._local, 'stats', None)
+        if stats is None:
+            stats = self._local.stats = ThreadStats()
+            with self._lock:
+                self._threads.append(stats)
+        return stats
+
+    # Recording
+
+    def _before_request(self):
+        stats = self._stats()
+        stats.request_queries = 0
+        stats.request_db_seconds = 0.0
+        request.environ[_START] = time.perf_counter()
+
+    def _after_request(self, response):
+        start = request.environ.get(_START)
+        if start is None:
+            return response
+
+        stats = self._stats()
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        labels = (("endpoint", route), ("method", request.method))
+        stats.inc(("http_requests_total", labels + (("status", str(response.status_code)),)))
+        stats.observe(("http_request_duration_seconds", labels), LATENCY_BUCKETS, time.perf_counter() - start)
+        stats.observe(("db_queries_per_request", labels), QUERY_COUNT_BUCKETS, stats.request_queries)
+        stats.inc(("db_queries_total", labels), stats.request_queries)
+        stats.inc(("db_query_seconds_total", labels), stats.request_db_seconds)
+
+        self._maybe_flush()
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info['metrics_query_start'] = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = conn.info.pop('metrics_query_start', None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        if has_request_context():
+            stats = self._stats()
+            stats.request_queries += 1
+            stats.request_db_seconds += elapsed
+
+    def observe_password_hash(self, operation, seconds):
+        self._stats().observe(
+            ("password_hash_seconds", (("operation", operation),)), HASH_BUCKETS, seconds)
+
+    def observe_cache(self, cache, result):
+        self._stats().inc(("cache_requests_total", (("cache", cache), ("result", result))))
+
+    # Reporting
+
+    def local_snapshot(self):
+        """Return this worker's totals"""
+        with self._lock:
+            live = []
+            for stats in self._threads:
+                if stats.is_alive():
+                    live.append(stats)
+                else:
+                    # Finished threads no longer write, fold them in for good
+                    self._retired.add(stats.counters, stats.histograms)
+            self._threads = live
+
+            snapshot = Snapshot()
+            snapshot.add(self._retired.counters, self._retired.histograms)
+        for stats in live:
+            snapshot.add(stats.counters.copy(), stats.histograms.copy())
+        return snapshot
+
+    def _maybe_flush(self):
+        directory = current_app.config['METRICS_DIR']
+        now = time.monotonic()
+        if not directory or now - self._last_flush < current_app.config['METRICS_FLUSH_SECONDS']:
+            return
+        self._last_flush = now
+        self.flush(directory)
+
+    def flush(self, directory):
+        """Write this worker's snapshot for the other workers to read"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.local_snapshot().to_json())
+        os.replace(tmp, path)
+
+    def collect(self):
+        """Return the totals of every worker"""
+        snapshot = self.local_snapshot()
+        directory = current_app.config['METRICS_DIR']
+        if directory and os.path.isdir(directory):
+            own = f"{os.getpid()}.json"
+            for name in os.listdir(directory):
+                if not name.endswith(".json") or name == own:
+                    continue
+                path = os.path.join(directory, name)
+                if not _pid_alive(name[:-len(".json")]):
+                    # Its worker exited, the totals went with it
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                    continue
+                try:
+                    with open(path) as f:
+                        other = Snapshot.from_json(f.read())
+                except (OSError, ValueError):
+                    continue
+                snapshot.add(other.counters, other.histograms)
+        return snapshot
+
+    def render(self):
+        """Return every worker's totals in the Prometheus text format"""
+        return render_prometheus(self.collect())
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(int(pid), 0)
+    except ValueError:
+        # Not a worker snapshot, leave it alone
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _buckets_for(name):
+    return {
+        "http_request_duration_seconds": LATENCY_BUCKETS,
+        "db_queries_per_request": QUERY_COUNT_BUCKETS,
+        "password_hash_seconds": HASH_BUCKETS,
+    }[name]
+
+
+def render_prometheus(snapshot):
+    lines = []
+    by_name = defaultdict(list)
+    for (name, labels), value in snapshot.counters.items():
+        by_name[name].append((labels, value))
+    for (name, labels), hist in snapshot.histograms.items():
+        by_name[name].append((labels, hist))
+
+    for name in sorted(by_name):
+        kind, text = HELP[name]
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(by_name[name]):
+            if kind == "counter":
+                lines.append(f"{name}{_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(_buckets_for(name) + ("+Inf",), value[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {value[-1]}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
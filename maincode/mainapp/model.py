@@ -1,10 +1,10 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from flask_login import UserMixin
-from sqlalchemy.dialects.postgresql import JSON
+from flask_jwt_extended import decode_token
 
 from maincode.mainapp import utils as au
 from maincode.appstrings import ccl, lcl
-from maincode import db, bcrypt, login_manager
+from maincode import db, hasher, login_manager
 
 
 @login_manager.user_loader
@@ -12,12 +12,20 @@ def load_user(user_id):
     return User.query.get(user_id)
 
 
+def _bump_version():
+    """`onupdate` for version columns: every UPDATE of the row,
+    ORM or Core, increments it in the database"""
+    return db.literal_column('version') + 1
+
+
 users_organisations_table = db.Table(
     "users_organisations",
     db.Model.metadata,
     db.Column('users_id', db.String, db.ForeignKey('users.id'), primary_key=True),
     db.Column('organisations_id', db.String, db.ForeignKey('organisations.id'), primary_key=True),
-    db.Column('created_on', db.DateTime, default=au.aware_utcnow)
+    db.Column('created_on', db.DateTime, default=au.aware_utcnow),
+    # The primary key serves lookups by user, this one lookups by org
+    db.Index('ix_users_organisations_organisations_id_users_id', 'organisations_id', 'users_id'),
 )
 
 
@@ -37,17 +45,31 @@ class User(db.Model, UserMixin):
     lastName = db.Column(db.String, nullable=False)
     email = db.Column(db.String, nullable=False, unique=True)
     password = db.Column(db.String, nullable=False)
-    _accessTokens = db.Column(JSON, nullable=False)
     phone = db.Column(db.String)
     created_on = db.Column(db.DateTime, nullable=False, default=au.aware_utcnow)
+    updated_on = db.Column(db.DateTime, nullable=False, default=au.aware_utcnow, onupdate=au.aware_utcnow)
+    # Bumped by every UPDATE, the ETag of GET /api/users/<id>
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1', onupdate=_bump_version())
+    # Number of organisations the user is a member of, see membership.py
+    orgCount = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Bumped whenever the user joins or leaves an organisation, see membership.py
+    membershipVersion = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # users and organisations reference each other, so this FK is added after both tables
+    defaultOrgId = db.Column(db.String, db.ForeignKey(
+        'organisations.id', use_alter=True, name='fk_users_defaultOrgId_organisations', ondelete='SET NULL'))
     # .........
     # Have to sacrifice `load="dynamic"` in order to visualize relationships in flask-admin
     organisations_created = db.relationship(
         'Organisation', backref=lcl.creator, foreign_keys='Organisation.creatorId')
     organisations = db.relationship(
         'Organisation', secondary=users_organisations_table, back_populates=lcl.users)
+    # Set by an UPDATE after both rows are inserted (post_update breaks the cycle)
+    default_org = db.relationship('Organisation', foreign_keys=[defaultOrgId], post_update=True)
+    # Append-only history, never loaded as a whole
+    access_tokens = db.relationship('AccessToken', lazy='write_only', passive_deletes=True)
 
-    def __init__(self, userId, firstName, lastName, email, password, accessToken, phone=None):
+    def __init__(self, userId, firstName, lastName, email, password, accessToken, phone=None,
+                 hashed_password=None):
 
         self.id = userId
         self.email = email
@@ -55,12 +77,8 @@ class User(db.Model, UserMixin):
         self.userId = userId
         self.lastName = lastName
         self.firstName = firstName
-        self.password = bcrypt.generate_password_hash(password).decode('utf-8')
-        self._accessTokens = [{
-            lcl.user_id: userId, 
-            lcl.token: accessToken, 
-            lcl.datetime: au.aware_utcnow().isoformat()
-        }]
+        self.password = hashed_password or hasher.hash(password)
+        self._add_access_token(AccessToken.from_token(userId, accessToken))
     
     # def update_password(self):
     #     """Arbitrary password update"""
@@ -68,34 +86,52 @@ class User(db.Model, UserMixin):
     #     db.session.commit()
 
     def confirm_password(self, password):
-        return bcrypt.check_password_hash(self.password, password)
+        return hasher.check(self.password, password)
     
+    def _add_access_token(self, access_token):
+        self.access_tokens.add(access_token)
+        self._latest_access_token = access_token
+
+    @property
+    def latest_access_token(self):
+        """The newest AccessToken row, fetched on its own rather
+        than through the token history"""
+        latest = getattr(self, '_latest_access_token', None)
+        if latest is None:
+            latest = AccessToken.query.filter_by(userId=self.id).order_by(
+                AccessToken.issued_at.desc(), AccessToken.id.desc()).first()
+            self._latest_access_token = latest
+        return latest
+
     @property
     def current_access_token(self):
-        return self._accessTokens[-1][lcl.token]
+        latest = self.latest_access_token
+        return latest.token if latest else None
     
     @property
     def current_access_token_datetime(self):
-        return datetime.fromisoformat(self._accessTokens[-1][lcl.datetime])
+        latest = self.latest_access_token
+        return latest.issued_at if latest else None
     
+    @staticmethod
+    def default_org_name_for(firstName):
+        return f"{firstName}'s {ccl.ORGANISATION}"
+
     @property
     def default_org_name(self):
-        return f"{self.firstName}'s {ccl.ORGANISATION}"
+        return User.default_org_name_for(self.firstName)
     
     def add_default_organisation(self, description):
         default_org = Organisation(
             creatorId=self.id,
             description=description,
             name=self.default_org_name,
-            orgId=au.generate_new_org_id(Organisation),
+            orgId=au.generate_new_id(),
         )
         db.session.add(default_org)
+        self.default_org = default_org
         return default_org
     
-    @property
-    def default_org(self):
-        return Organisation.query.filter_by(name=self.default_org_name).first()
-    
     @staticmethod
     def get_self(user_id):
         return User.query.filter_by(id=user_id).first()
@@ -111,19 +147,18 @@ class User(db.Model, UserMixin):
     
     @property
     def all_organisations(self) -> list:
-        return [o for o in Organisation.query if self in o.users or self == o.creator]
+        from maincode.mainapp.membership import user_organisations_query
+        return user_organisations_query(self.id).all()
     
     @property
     def users_in_all_organisations(self) -> list:
         return [u for o in self.all_organisations for u in o.users]
-    
+
     def set_new_access_token(self):
-        self._accessTokens = [{
-            lcl.user_id: self.id, 
-            lcl.token: au.create_new_jwt_token(self.id), 
-            lcl.datetime: au.aware_utcnow().isoformat(),
-        }]
-        db.session.commit()
+        """Append a fresh token to the history. Committing
+        is left to the caller"""
+        self._add_access_token(AccessToken.from_token(self.id, au.create_new_jwt_token(self.id)))
+        return self.current_access_token
 
 
 class Organisation(db.Model):
@@ -138,11 +173,16 @@ class Organisation(db.Model):
 
     id = db.Column(db.String, primary_key=True)
     orgId = db.Column(db.String, nullable=False, unique=True)
-    name = db.Column(db.String, nullable=False)
+    name = db.Column(db.String, nullable=False, index=True)
     description = db.Column(db.String)
     created_on = db.Column(db.DateTime, nullable=False, default=au.aware_utcnow)
+    updated_on = db.Column(db.DateTime, nullable=False, default=au.aware_utcnow, onupdate=au.aware_utcnow)
+    # Bumped by every UPDATE, the ETag of GET /api/organisations/<id>
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1', onupdate=_bump_version())
+    # Number of members, see membership.py
+    memberCount = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     # .........
-    creatorId = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
+    creatorId = db.Column(db.String, db.ForeignKey('users.id'), nullable=False, index=True)
     users = db.relationship('User', secondary=users_organisations_table, 
                             back_populates=lcl.organisations, lazy=lcl.dynamic)
 
@@ -157,10 +197,66 @@ class Organisation(db.Model):
     @staticmethod
     def get_self(org_id):
         return Organisation.query.filter_by(id=org_id).first()
+
+    @staticmethod
+    def get_version(org_id):
+        return db.session.scalar(db.select(Organisation.version).filter_by(id=org_id))
     
     def to_dict(self):
         return {
             "orgId": self.orgId,
             "name": self.name,
             "description": self.description
-        }
\ No newline at end of file
+        }
+
+
+class AccessToken(db.Model):
+    """"""
+    __tablename__ = "access_tokens"
+
+    id = db.Column(db.Integer, primary_key=True)
+    userId = db.Column(db.String, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    jti = db.Column(db.String, nullable=False, unique=True)
+    token = db.Column(db.String, nullable=False)
+    issued_at = db.Column(db.DateTime, nullable=False, default=au.aware_utcnow)
+    expires_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_access_tokens_userId_issued_at', 'userId', 'issued_at'),
+    )
+
+    def __init__(self, userId, jti, token, issued_at, expires_at=None):
+
+        self.jti = jti
+        self.token = token
+        self.userId = userId
+        self.issued_at = issued_at
+        self.expires_at = expires_at
+
+    @staticmethod
+    def from_token(user_id, token):
+        """Build a row for the encoded JWT `token`"""
+        claims = decode_token(token)
+        return AccessToken(
+            token=token,
+            userId=user_id,
+            jti=claims['jti'],
+            issued_at=datetime.fromtimestamp(claims['iat'], timezone.utc),
+            expires_at=datetime.fromtimestamp(claims['exp'], timezone.utc) if 'exp' in claims else None,
+        )
+
+
+class RevokedToken(db.Model):
+    """"""
+    __tablename__ = "revoked_tokens"
+
+    jti = db.Column(db.String, primary_key=True)
+    userId = db.Column(db.String, db.ForeignKey('users.id', ondelete='CASCADE'))
+    revoked_on = db.Column(db.DateTime, nullable=False, default=au.aware_utcnow, index=True)
+    expires_at = db.Column(db.DateTime)
+
+    def __init__(self, jti, userId=None, expires_at=None):
+
+        self.jti = jti
+        self.userId = userId
+        self.expires_at = expires_at
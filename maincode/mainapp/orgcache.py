@@ -0,0 +1,310 @@
+"""
+Read-through cache of organisations, keyed by org id.
+
+`GET /api/organisations/<orgId>` reads the organisation's payload and
+version through `org_cache.get()` instead of querying every time.
+Misses are loaded single-flight: when several threads of a worker miss
+on the same org at once, one of them queries and the rest wait for its
+result, so a hot org expiring doesn't stampede the database.
+
+Every commit that inserted, updated or deleted an Organisation through
+the ORM invalidates its entry once the commit succeeds, so admin edits
+and future update endpoints need no extra code. Core UPDATEs bypass
+the ORM and must call `org_cache.invalidate_on_commit()` themselves if
+they change cached fields or the version. A load racing a commit can still store the old
+row, which then lives until the TTL.
+
+Backends:
+    memory  per-process LRU with a TTL
+    sqlite  a table in a local SQLite file (WAL), so every gunicorn
+            worker on the host shares the entries and invalidations
+
+Config:
+    ORG_CACHE_ENABLED       switch the cache on/off
+    ORG_CACHE_BACKEND       "memory" or "sqlite"
+    ORG_CACHE_TTL           seconds an entry may be served
+    ORG_CACHE_SIZE          entries kept
+    ORG_CACHE_SQLITE_PATH   file backing the sqlite table
+"""
+import os
+import json
+import time
+import random
+import sqlite3
+import threading
+from itertools import chain
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+_DIRTY = 'maincode.dirty_org_ids'
+
+
+class MemoryBackend:
+    """Per-process LRU cache with a TTL"""
+
+    def __init__(self, size=10_000):
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, now, ttl):
+        with self._lock:
+            self._entries[key] = (now + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteBackend:
+    """Entries shared by every process on the host.
+
+    Values are JSON in a single table of a WAL-mode SQLite file, so
+    readers never block each other or the writer. Each thread keeps
+    its own connection. Expired entries and those over `size` (soonest
+    to expire first) are pruned on roughly one write in `PRUNE_EVERY`."""
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, path, size=10_000):
+        self.path = path
+        self.size = size
+        self._local = threading.local()
+        self._connection()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, now):
+        row = self._connection().execute(
+            "SELECT value FROM entries WHERE key = ? AND expires > ?", (key, now)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, now, ttl):
+        conn = self._connection()
+        conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", (key, json.dumps(value), now + ttl))
+        if random.randrange(self.PRUNE_EVERY) == 0:
+            self.prune(now)
+
+    def prune(self, now):
+        conn = self._connection()
+        conn.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+        conn.execute(
+            "DELETE FROM entries WHERE key IN ("
+            "  SELECT key FROM entries ORDER BY expires"
+            "  LIMIT max(0, (SELECT count(*) FROM entries) - ?))", (self.size,))
+
+    def delete(self, *keys):
+        self._connection().executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in keys])
+
+    def clear(self):
+        self._connection().execute("DELETE FROM entries")
+
+
+class _Flight:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, fn):
+        """Return ``(fn(), shared)``, where `shared` is True if another
+        thread's call already in flight was waited for instead"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, True
+
+        try:
+            flight.value = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.value, False
+
+
+class CacheStats:
+    """Per-worker counters of one cache"""
+
+    FIELDS = ('hits', 'misses', 'loads', 'shared', 'invalidations')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = dict.fromkeys(self.FIELDS, 0)
+
+    def inc(self, field, n=1):
+        with self._lock:
+            self.counts[field] += n
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(self.counts)
+        lookups = data['hits'] + data['misses']
+        data['hitRate'] = round(data['hits'] / lookups, 4) if lookups else 0.0
+        return data
+
+
+def load_organisation(org_id):
+    """Return what the cache keeps for `org_id`, or None"""
+    from maincode.mainapp.model import Organisation
+    org = Organisation.get_self(org_id)
+    if org is None:
+        return None
+    return {"data": org.to_dict(), "version": org.version}
+
+
+class OrgCache:
+    """Flask extension caching `load_organisation()` results"""
+
+    def __init__(self, app=None):
+        self._backends = {}
+        self._flights = SingleFlight()
+        self.stats = CacheStats()
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ORG_CACHE_ENABLED', True)
+        app.config.setdefault('ORG_CACHE_BACKEND', 'memory')
+        app.config.setdefault('ORG_CACHE_TTL', 60)
+        app.config.setdefault('ORG_CACHE_SIZE', 10_000)
+        app.config.setdefault('ORG_CACHE_SQLITE_PATH', '/tmp/maincode-org-cache.sqlite')
+        app.extensions['org_cache'] = self
+        if not self._listening:
+            event.listen(Session, 'after_flush', _collect_dirty)
+            event.listen(Session, 'after_commit', self._after_commit)
+            event.listen(Session, 'after_rollback', _forget_dirty)
+            self._listening = True
+
+    @staticmethod
+    def enabled():
+        return current_app.config['ORG_CACHE_ENABLED']
+
+    def _get_backend(self):
+        config = current_app.config
+        key = (os.getpid(), config['ORG_CACHE_BACKEND'], config['ORG_CACHE_SQLITE_PATH'])
+        backend = self._backends.get(key)
+        if backend is None:
+            if config['ORG_CACHE_BACKEND'] == 'sqlite':
+                backend = SQLiteBackend(config['ORG_CACHE_SQLITE_PATH'], config['ORG_CACHE_SIZE'])
+            else:
+                backend = MemoryBackend(config['ORG_CACHE_SIZE'])
+            self._backends[key] = backend
+        return backend
+
+    def get(self, org_id, loader=load_organisation):
+        """Return ``{"data": ..., "version": ...}`` for `org_id`, or None
+        if there's no such organisation (not cached)"""
+        if not self.enabled():
+            return loader(org_id)
+
+        backend = self._get_backend()
+        value = backend.get(org_id, time.time())
+        if value is not None:
+            self._count('hit')
+            return value
+        self._count('miss')
+
+        def load():
+            loaded = loader(org_id)
+            self.stats.inc('loads')
+            if loaded is not None:
+                backend.set(org_id, loaded, time.time(), current_app.config['ORG_CACHE_TTL'])
+            return loaded
+
+        value, shared = self._flights.do(org_id, load)
+        if shared:
+            self.stats.inc('shared')
+        return value
+
+    def invalidate(self, *org_ids):
+        if org_ids and self.enabled():
+            self._get_backend().delete(*org_ids)
+            self.stats.inc('invalidations', len(org_ids))
+
+    @staticmethod
+    def invalidate_on_commit(session, *org_ids):
+        """Invalidate `org_ids` once `session` commits, as ORM changes are"""
+        if org_ids:
+            session.info.setdefault(_DIRTY, set()).update(org_ids)
+
+    def clear(self):
+        self._get_backend().clear()
+
+    def _count(self, result):
+        self.stats.inc('hits' if result == 'hit' else 'misses')
+        metrics = current_app.extensions.get('metrics')
+        if metrics is not None:
+            metrics.observe_cache('org', result)
+
+    def _after_commit(self, session):
+        org_ids = session.info.pop(_DIRTY, None)
+        if org_ids and has_app_context():
+            self.invalidate(*org_ids)
+
+
+def _collect_dirty(session, flush_context):
+    from maincode.mainapp.model import Organisation
+    org_ids = {
+        obj.id for obj in chain(session.new, session.dirty, session.deleted) if isinstance(obj, Organisation)
+    }
+    if org_ids:
+        session.info.setdefault(_DIRTY, set()).update(org_ids)
+
+
+def _forget_dirty(session):
+    session.info.pop(_DIRTY, None)
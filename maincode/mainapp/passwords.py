@@ -0,0 +1,131 @@
+"""
+Password hashing service.
+
+bcrypt is deliberately slow, so hashing and verification are handed to
+a small process pool instead of running on the request thread. The
+number of jobs allowed in flight is capped: past the cap the caller
+gets `HashingPoolSaturated` straight away, which the views turn into a
+503 with a Retry-After header instead of letting requests pile up.
+
+Config:
+    BCRYPT_LOG_ROUNDS            bcrypt cost factor
+    PASSWORD_HASH_WORKERS        pool size per app process, 0 hashes inline
+                                 on the caller; defaults to the cores divided
+                                 by WEB_CONCURRENCY (gunicorn workers), else 2
+    PASSWORD_HASH_MAX_PENDING    jobs allowed in flight before refusing
+    PASSWORD_HASH_RETRY_AFTER    seconds advertised to refused clients
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+from flask import current_app
+
+from maincode.config import password_hash_workers
+
+
+class HashingPoolSaturated(Exception):
+    """Raised when the hashing queue is full"""
+
+    def __init__(self, retry_after):
+        super().__init__("Password hashing queue is full")
+        self.retry_after = retry_after
+
+
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check_password(pw_hash, password):
+    return bcrypt.checkpw(password.encode('utf-8'), pw_hash.encode('utf-8'))
+
+
+@contextmanager
+def _timed(operation):
+    """Report the job's duration to the metrics extension, if any"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics = current_app.extensions.get('metrics')
+        if metrics is not None:
+            metrics.observe_password_hash(operation, time.perf_counter() - start)
+
+
+class PasswordHasher:
+    """Flask extension running bcrypt in a bounded worker pool"""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._pool = None
+        self._pool_key = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('BCRYPT_LOG_ROUNDS', 12)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', password_hash_workers())
+        app.config.setdefault('PASSWORD_HASH_MAX_PENDING', 32)
+        app.config.setdefault('PASSWORD_HASH_RETRY_AFTER', 1)
+        app.extensions['password_hasher'] = self
+
+    def hash(self, password):
+        """Return the bcrypt hash of `password` as a str"""
+        return self._run("hash", _hash_password, password, current_app.config['BCRYPT_LOG_ROUNDS'])
+
+    def hash_many(self, passwords):
+        """Return the hashes of `passwords`, in order, spreading the
+        work over the whole pool. The batch takes a single queue slot"""
+        passwords = list(passwords)
+        rounds = [current_app.config['BCRYPT_LOG_ROUNDS']] * len(passwords)
+        with self._slot() as pool, _timed("hash_many"):
+            if pool is None:
+                return list(map(_hash_password, passwords, rounds))
+            chunksize = max(1, len(passwords) // (4 * current_app.config['PASSWORD_HASH_WORKERS']))
+            return list(pool.map(_hash_password, passwords, rounds, chunksize=chunksize))
+
+    def check(self, pw_hash, password):
+        """Return True if `password` matches `pw_hash`"""
+        return self._run("check", _check_password, pw_hash, password)
+
+    def _get_pool(self, workers):
+        # Pools don't survive a fork, so gunicorn workers
+        # each lazily build their own on first use
+        key = (os.getpid(), workers)
+        if self._pool_key != key:
+            # A pool inherited over a fork belongs to the parent;
+            # one of ours resized through config is shut down
+            if self._pool is not None and self._pool_key[0] == key[0]:
+                self._pool.shutdown(wait=False)
+            self._pool = ProcessPoolExecutor(max_workers=workers)
+            self._pool_key = key
+        return self._pool
+
+    @contextmanager
+    def _slot(self):
+        """Hold one of the PASSWORD_HASH_MAX_PENDING slots and
+        yield the pool to run on (None to run inline)"""
+        config = current_app.config
+
+        with self._lock:
+            if self._pending >= config['PASSWORD_HASH_MAX_PENDING']:
+                raise HashingPoolSaturated(config['PASSWORD_HASH_RETRY_AFTER'])
+            self._pending += 1
+            workers = config['PASSWORD_HASH_WORKERS']
+            pool = self._get_pool(workers) if workers else None
+
+        try:
+            yield pool
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _run(self, operation, fn, *args):
+        with self._slot() as pool, _timed(operation):
+            if pool is None:
+                return fn(*args)
+            return pool.submit(fn, *args).result()
@@ -0,0 +1,132 @@
+"""
+SQL statement budgets.
+
+`count_queries()` records the statements the current thread issues
+while it is open, except those run under `uncounted()`. `query_budget(n)` wraps a view so that going over `n`
+statements raises `QueryBudgetExceeded` when QUERY_BUDGET_RAISE is set
+(debug and testing configs), and otherwise logs a warning listing the
+statement fingerprints, so N+1 regressions show up in CI instead of in
+the database.
+
+Config:
+    QUERY_BUDGET_RAISE      raise instead of logging when over budget
+"""
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+_local = threading.local()
+_listening = False
+_listen_lock = threading.Lock()
+
+_IN_LIST = re.compile(r"\bIN\s*\((?:[^()]|\([^()]*\))*\)", re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM = re.compile(r"%\(\w+\)s|\?|:\w+|\$\d+")
+_SPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a view issues more statements than its budget"""
+
+
+def fingerprint(statement):
+    """Return `statement` with literals, parameters and IN lists
+    collapsed, so repeats of one query look alike"""
+    statement = _STRING.sub("?", statement)
+    statement = _PARAM.sub("?", statement)
+    statement = _IN_LIST.sub("IN (...)", statement)
+    statement = _NUMBER.sub("?", statement)
+    return _SPACE.sub(" ", statement).strip()
+
+
+class QueryLog:
+    """Statements issued while a `count_queries()` block was open"""
+
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def fingerprints(self):
+        """Return [(fingerprint, times issued)], most repeated first"""
+        return Counter(map(fingerprint, self.statements)).most_common()
+
+    def describe(self):
+        return "\n".join(f"{n} x {fp}" for fp, n in self.fingerprints())
+
+
+def _record(conn, cursor, statement, parameters, context, executemany):
+    for log in getattr(_local, 'logs', ()):
+        log.statements.append(statement)
+
+
+def _listen():
+    global _listening
+    with _listen_lock:
+        if not _listening:
+            event.listen(Engine, "before_cursor_execute", _record)
+            _listening = True
+
+
+@contextmanager
+def count_queries():
+    """Yield a QueryLog of the statements this thread issues in the block"""
+    _listen()
+    log = QueryLog()
+    logs = _local.__dict__.setdefault('logs', [])
+    logs.append(log)
+    try:
+        yield log
+    finally:
+        logs.remove(log)
+
+
+@contextmanager
+def uncounted():
+    """Keep the statements this thread issues in the block out of every
+    open `count_queries()`. For periodic upkeep that a request happens
+    to trigger, such as the revocation filter's rebuild, and that its
+    view's budget shouldn't pay for"""
+    logs = _local.__dict__.get('logs', [])
+    _local.logs = []
+    try:
+        yield
+    finally:
+        _local.logs = logs
+
+
+def check_budget(log, budget, name):
+    """Raise or warn if `log` went over `budget`"""
+    if log.count <= budget:
+        return
+    message = f"{name} issued {log.count} SQL statements, over its budget of {budget}:\n{log.describe()}"
+    if current_app.config.get('QUERY_BUDGET_RAISE'):
+        raise QueryBudgetExceeded(message)
+    current_app.logger.warning(message)
+
+
+def query_budget(budget):
+    """Declare how many statements a view may issue. `budget` is a
+    number, or for views whose work grows with the request a function
+    called after the view that returns one"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with count_queries() as log:
+                result = fn(*args, **kwargs)
+            limit = budget() if callable(budget) else budget
+            check_budget(log, limit, f"{request.method} {request.path}")
+            return result
+        wrapper.query_budget = budget
+        return wrapper
+    return decorator
@@ -0,0 +1,243 @@
+"""
+Token-bucket rate limiting for the credential endpoints.
+
+Every hit spends one token from a bucket per (scope, dimension, value),
+e.g. ("login", "ip", "10.0.0.1") and ("login", "email", "a@b.c").
+Buckets refill continuously at ``burst / per_seconds`` tokens per
+second up to ``burst``. A request is refused when any of its buckets
+is empty, before the view touches the database or bcrypt, and then
+spends nothing from the others: all of them are checked before any
+token is taken.
+
+Buckets are keyed by ``request.remote_addr``. Behind a reverse proxy
+that is the proxy's address, so set `PROXY_FIX_X_FOR` to the number of
+proxies in front of the app to take the client from X-Forwarded-For.
+
+Backends:
+    memory  per-process LRU table; fine for a single worker
+    mmap    a fixed-size table in a shared file, so every gunicorn
+            worker on the host draws from the same buckets
+
+Config:
+    RATELIMIT_ENABLED       switch the limiter on/off
+    RATELIMIT_BACKEND       "memory" or "mmap"
+    RATELIMIT_MMAP_PATH     file backing the mmap table
+    RATELIMIT_MMAP_SLOTS    number of buckets in the mmap table
+    RATELIMIT_RULES         {scope: {dimension: (burst, per_seconds)}}
+    PROXY_FIX_X_FOR         trusted proxies setting X-Forwarded-For
+"""
+import os
+import math
+import mmap
+import time
+import fcntl
+import struct
+import hashlib
+import threading
+from functools import wraps
+from collections import OrderedDict
+
+from flask import current_app, request
+
+from maincode.appstrings import lcl
+from maincode.mainapp import utils as au
+
+
+def _key_hash(key):
+    # 0 marks an empty mmap slot, so never hand it out
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+
+
+def _refill(tokens, stamp, now, burst, rate):
+    return min(burst, tokens + (now - stamp) * rate)
+
+
+def _wait(tokens, rate):
+    return 0 if tokens >= 1 else (1 - tokens) / rate
+
+
+class MemoryBackend:
+    """In-process buckets.
+
+    An LRU table of ``(tokens, stamp)`` under a lock. Once `max_keys`
+    buckets exist a new key evicts the least recently used one, so
+    flooding the table with fresh keys only forgets the idlest buckets,
+    never the ones that are actively throttling someone."""
+
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def peek(self, key, burst, rate, now):
+        """Return what `consume` would, without spending a token"""
+        with self._lock:
+            tokens, stamp = self._buckets.get(key, (burst, now))
+        return _wait(_refill(tokens, stamp, now, burst, rate), rate)
+
+    def consume(self, key, burst, rate, now):
+        """Spend a token from `key`. Return 0 if allowed, else the
+        number of seconds until a token is available"""
+        with self._lock:
+            buckets = self._buckets
+            tokens, stamp = buckets.get(key, (burst, now))
+            tokens = _refill(tokens, stamp, now, burst, rate)
+            wait = _wait(tokens, rate)
+
+            buckets[key] = (tokens if wait else tokens - 1, now)
+            buckets.move_to_end(key)
+            if len(buckets) > self.max_keys:
+                buckets.popitem(last=False)
+            return wait
+
+
+class MmapBackend:
+    """Buckets shared by every process on the host.
+
+    The file holds ``slots`` fixed-size records ``(key_hash, tokens,
+    stamp)`` split into groups of `GROUP` slots. A key lives in one
+    group, chosen by its hash. The group is guarded by a byte-range
+    ``lockf`` so processes don't interleave, and by a thread lock
+    because POSIX record locks are shared by all threads of a process.
+    When a group is full the least recently used slot is recycled."""
+
+    GROUP = 8
+    RECORD = struct.Struct('<Qdd')
+
+    def __init__(self, path, slots=65536):
+        self.groups = max(1, slots // self.GROUP)
+        size = self.groups * self.GROUP * self.RECORD.size
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        self._thread_lock = threading.Lock()
+
+    def _group(self, key_hash):
+        group_size = self.GROUP * self.RECORD.size
+        return (key_hash % self.groups) * group_size, group_size
+
+    def _tokens(self, offset, key_hash, burst, rate, now):
+        slot_hash, tokens, stamp = self.RECORD.unpack_from(self._map, offset)
+        if slot_hash != key_hash:
+            tokens, stamp = burst, now
+        return _refill(tokens, stamp, now, burst, rate)
+
+    def peek(self, key, burst, rate, now):
+        """Return what `consume` would, without spending a token"""
+        key_hash = _key_hash(key)
+        start, group_size = self._group(key_hash)
+
+        with self._thread_lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_SH, group_size, start)
+            try:
+                offset = self._find_slot(start, key_hash)
+                return _wait(self._tokens(offset, key_hash, burst, rate, now), rate)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, group_size, start)
+
+    def consume(self, key, burst, rate, now):
+        """Spend a token from `key`. Return 0 if allowed, else the
+        number of seconds until a token is available"""
+        key_hash = _key_hash(key)
+        start, group_size = self._group(key_hash)
+
+        with self._thread_lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, group_size, start)
+            try:
+                offset = self._find_slot(start, key_hash)
+                tokens = self._tokens(offset, key_hash, burst, rate, now)
+
+                if tokens < 1:
+                    self.RECORD.pack_into(self._map, offset, key_hash, tokens, now)
+                    return (1 - tokens) / rate
+
+                self.RECORD.pack_into(self._map, offset, key_hash, tokens - 1, now)
+                return 0
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, group_size, start)
+
+    def _find_slot(self, start, key_hash):
+        oldest, oldest_stamp = start, math.inf
+        for i in range(self.GROUP):
+            offset = start + i * self.RECORD.size
+            slot_hash, _, stamp = self.RECORD.unpack_from(self._map, offset)
+            if slot_hash == key_hash or slot_hash == 0:
+                return offset
+            if stamp < oldest_stamp:
+                oldest, oldest_stamp = offset, stamp
+        return oldest
+
+
+class RateLimiter:
+    """Flask extension applying `RATELIMIT_RULES` to decorated views"""
+
+    def __init__(self, app=None):
+        self._backends = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_BACKEND', 'memory')
+        app.config.setdefault('RATELIMIT_MMAP_PATH', '/tmp/maincode-ratelimit.bin')
+        app.config.setdefault('RATELIMIT_MMAP_SLOTS', 65536)
+        app.config.setdefault('RATELIMIT_RULES', {})
+        app.extensions['rate_limiter'] = self
+
+    def _get_backend(self):
+        config = current_app.config
+        key = (os.getpid(), config['RATELIMIT_BACKEND'], config['RATELIMIT_MMAP_PATH'])
+        backend = self._backends.get(key)
+        if backend is None:
+            if config['RATELIMIT_BACKEND'] == 'mmap':
+                backend = MmapBackend(config['RATELIMIT_MMAP_PATH'], config['RATELIMIT_MMAP_SLOTS'])
+            else:
+                backend = MemoryBackend()
+            self._backends[key] = backend
+        return backend
+
+    def hit(self, scope, **identifiers):
+        """Spend a token from each of the `scope` buckets named by
+        `identifiers` (e.g. ``ip=..., email=...``). Return 0 if the
+        request may go ahead, else the seconds to wait.
+
+        Nothing is spent if any bucket is already empty. A bucket that
+        another request empties between the check and the spend can
+        still refuse after earlier ones spent; spending stops there"""
+        config = current_app.config
+        if not config['RATELIMIT_ENABLED']:
+            return 0
+
+        buckets = [
+            (f"{scope}:{dimension}:{identifiers[dimension]}", burst, burst / per_seconds)
+            for dimension, (burst, per_seconds) in config['RATELIMIT_RULES'].get(scope, {}).items()
+            if identifiers.get(dimension)
+        ]
+        backend = self._get_backend()
+        now = time.time()
+
+        wait = max((backend.peek(key, burst, rate, now) for key, burst, rate in buckets), default=0)
+        if wait:
+            return wait
+        for key, burst, rate in buckets:
+            wait = backend.consume(key, burst, rate, now)
+            if wait:
+                return wait
+        return 0
+
+    def limit(self, scope):
+        """Decorate a view taking the parsed request body as its
+        first argument, keying the `scope` buckets by client IP and
+        by the body's email"""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(view, data, *args, **kwargs):
+                email = (data.get(lcl.email) or "").strip().lower()
+                wait = self.hit(scope, ip=request.remote_addr, email=email)
+                if wait:
+                    return au.too_many_requests_response(math.ceil(wait))
+                return fn(view, data, *args, **kwargs)
+            return wrapper
+        return decorator
@@ -0,0 +1,167 @@
+"""
+Read-replica routing.
+
+With `SQLALCHEMY_REPLICA_URIS` set, each replica becomes a
+`replica_<n>` bind and `RoutingSession` sends the reads of GET/HEAD
+requests to one of them. Everything else goes to the primary: writes,
+flushes, non-GET requests, any read that follows a write in the
+same request, and reads inside `replicas.primary()` (the revocation
+checks, which a lagging replica would let revoked tokens through).
+
+Replicas lag, so a caller who has just written reads from the primary
+for `READ_YOUR_WRITES_SECONDS`. The window starts when the request
+that wrote finishes, or when the caller's token was issued, which
+covers freshly registered and logged in users. The write times are
+kept per worker: a request landing on another worker only gets the
+token-age half of the guarantee.
+
+Config:
+    SQLALCHEMY_REPLICA_URIS     replica database URIs, empty disables
+    READ_YOUR_WRITES_SECONDS    seconds a writer's reads stay on the primary
+    READ_YOUR_WRITES_SIZE       writers remembered per worker
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+
+
+SAFE_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+
+_CALLER = 'maincode.db_caller'
+_REPLICA = 'maincode.db_replica'
+_WROTE = 'maincode.db_wrote'
+_PINNED = 'maincode.db_pinned'
+
+
+class RoutingSession(Session):
+    """Session picking a replica engine for safe requests"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or getattr(clause, 'is_dml', False):
+                replicas.mark_write()
+            else:
+                key = replicas.replica_for_request()
+                if key is not None:
+                    return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class RecentWriters:
+    """Per-worker map of user id to the end of their primary window"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._until = {}
+
+    def mark(self, user_id, until, size):
+        with self._lock:
+            if len(self._until) >= size:
+                now = time.time()
+                self._until = {k: v for k, v in self._until.items() if v > now}
+            if len(self._until) < size:
+                self._until[user_id] = until
+
+    def is_recent(self, user_id, now):
+        return self._until.get(user_id, 0) > now
+
+
+class Replicas:
+    """Flask extension deciding where each request reads from"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+        app.config.setdefault('READ_YOUR_WRITES_SECONDS', 5)
+        app.config.setdefault('READ_YOUR_WRITES_SIZE', 10_000)
+        keys = replica_bind_keys(app.config['SQLALCHEMY_REPLICA_URIS'])
+        app.extensions['replicas'] = {
+            'keys': keys,
+            'writers': RecentWriters(),
+        }
+        # Replicas serve the default metadata. Flask-SQLAlchemy makes an
+        # empty one per bind, which would outlive the app in the global
+        # `db` and break create_all/drop_all for apps without the binds
+        metadatas = app.extensions['sqlalchemy'].metadatas
+        for key in keys:
+            metadatas.pop(key, None)
+        app.after_request(self._remember_write)
+
+    @staticmethod
+    def _state():
+        return current_app.extensions['replicas']
+
+    def set_caller(self, user_id, issued_at=None):
+        """Record who the request is for. Called from the jwt user
+        loader, before the caller's row is read"""
+        request.environ[_CALLER] = (user_id, issued_at)
+
+    def mark_write(self):
+        if has_request_context():
+            request.environ[_WROTE] = True
+
+    @contextmanager
+    def primary(self):
+        """Send the reads of the block to the primary, for lookups
+        that must not lag, such as revocations"""
+        if not has_request_context():
+            yield
+            return
+        environ = request.environ
+        environ[_PINNED] = environ.get(_PINNED, 0) + 1
+        try:
+            yield
+        finally:
+            environ[_PINNED] -= 1
+
+    def replica_for_request(self):
+        """Return the replica bind key the current request should read
+        from, or None for the primary"""
+        if not has_request_context():
+            return None
+        state = self._state()
+        environ = request.environ
+        if not state['keys'] or request.method not in SAFE_METHODS or environ.get(_WROTE) or environ.get(_PINNED):
+            return None
+
+        if self._caller_is_fresh(state, environ.get(_CALLER)):
+            return None
+
+        key = environ.get(_REPLICA)
+        if key is None:
+            # Stick to one replica for the whole request
+            key = environ[_REPLICA] = random.choice(state['keys'])
+        return key
+
+    @staticmethod
+    def _caller_is_fresh(state, caller):
+        if caller is None:
+            return False
+        user_id, issued_at = caller
+        window = current_app.config['READ_YOUR_WRITES_SECONDS']
+        now = time.time()
+        if issued_at is not None and now - issued_at < window:
+            return True
+        return state['writers'].is_recent(user_id, now)
+
+    def _remember_write(self, response):
+        caller = request.environ.get(_CALLER)
+        if request.environ.get(_WROTE) and caller is not None:
+            config = current_app.config
+            self._state()['writers'].mark(
+                caller[0], time.time() + config['READ_YOUR_WRITES_SECONDS'], config['READ_YOUR_WRITES_SIZE'])
+        return response
+
+
+def replica_bind_keys(uris):
+    return [f"replica_{n}" for n in range(len(uris))]
+
+
+replicas = Replicas()
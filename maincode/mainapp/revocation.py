@@ -0,0 +1,205 @@
+"""
+JWT revocation.
+
+Revoked token ids (jti) are persisted in the revoked_tokens table.
+Every worker also keeps a Bloom filter of them, so checking a token
+that was never revoked, which is nearly every request, costs a few
+hashes and no query. A filter hit is confirmed against the table,
+because Bloom filters can give false positives but never false
+negatives.
+
+Each worker refreshes its filter every `REVOCATION_REFRESH_SECONDS`
+by pulling only the rows revoked since its last refresh. The filter
+is rebuilt from the unexpired rows once it has taken in more ids
+than it was sized for. Refreshes run under `uncounted()`, outside the
+query budget of whichever request triggers them.
+
+Rows of tokens that have expired are no use to anyone, JWT validation
+already rejects those tokens. `purge_expired`, run through
+`flask purge-tokens`, deletes them from access_tokens and
+revoked_tokens.
+
+Config:
+    REVOCATION_REFRESH_SECONDS      how stale a worker's filter may get
+    REVOCATION_BLOOM_CAPACITY       ids the filter is sized for
+    REVOCATION_BLOOM_ERROR_RATE     target false positive rate
+"""
+import math
+import time
+import hashlib
+import threading
+from datetime import timedelta
+
+from flask import current_app
+from sqlalchemy import select, delete
+
+from maincode import db
+from maincode.mainapp import utils as au
+from maincode.mainapp.model import RevokedToken, AccessToken
+from maincode.mainapp.querybudget import uncounted
+from maincode.mainapp.replicas import replicas
+
+
+# Re-read a little before the last refresh so rows whose
+# transaction committed late are not missed
+REFRESH_OVERLAP = timedelta(seconds=30)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings"""
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        positions = self._positions(item)
+        bits = self._bits
+        if all(bits[pos >> 3] & (1 << (pos & 7)) for pos in positions):
+            return
+        for pos in positions:
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class _WorkerState:
+    """One worker's filter and its refresh watermark"""
+
+    def __init__(self):
+        self.bloom = None
+        self.refreshed_at = 0.0
+        self.watermark = None
+        self.lock = threading.Lock()
+
+
+class RevocationList:
+    """Answers `is_revoked` from a per-worker Bloom filter
+    backed by the revoked_tokens table"""
+
+    @staticmethod
+    def _state():
+        return current_app.extensions.setdefault('revocation_list', _WorkerState())
+
+    def is_revoked(self, jti):
+        # A replica may not have the revocation yet
+        with replicas.primary():
+            state = self._state()
+            self._maybe_refresh(state)
+            if jti not in state.bloom:
+                return False
+            return db.session.get(RevokedToken, jti) is not None
+
+    def revoke(self, user_id, jtis):
+        """Persist the revocation of `jtis` belonging to `user_id`.
+        Committing is left to the caller"""
+        jtis = set(jtis) - {
+            jti for (jti,) in db.session.query(RevokedToken.jti).filter(RevokedToken.jti.in_(jtis))
+        }
+        expiries = dict(db.session.query(AccessToken.jti, AccessToken.expires_at)
+                        .filter(AccessToken.jti.in_(jtis)))
+        for jti in jtis:
+            db.session.add(RevokedToken(jti=jti, userId=user_id, expires_at=expiries.get(jti)))
+
+        # The refresh would pick these up anyway; adding them now
+        # makes this worker honour the revocation immediately
+        state = self._state()
+        self._maybe_refresh(state)
+        for jti in jtis:
+            state.bloom.add(jti)
+        return jtis
+
+    def revoke_all(self, user_id):
+        """Revoke every unexpired token issued to `user_id`"""
+        jtis = [jti for (jti,) in db.session.query(AccessToken.jti).filter(
+            AccessToken.userId == user_id,
+            db.or_(AccessToken.expires_at.is_(None), AccessToken.expires_at > au.aware_utcnow()),
+        )]
+        return self.revoke(user_id, jtis)
+
+    @staticmethod
+    def purge_expired(batch_size=1000):
+        """Delete access and revoked token rows that expired, walking
+        each table by primary key `batch_size` rows per transaction.
+        Returns (access tokens deleted, revoked tokens deleted)"""
+        cutoff = au.aware_utcnow()
+        return (
+            _purge(AccessToken, AccessToken.id, cutoff, batch_size),
+            _purge(RevokedToken, RevokedToken.jti, cutoff, batch_size),
+        )
+
+    def _maybe_refresh(self, state):
+        config = current_app.config
+        now = time.monotonic()
+        if state.bloom is not None and now - state.refreshed_at < config['REVOCATION_REFRESH_SECONDS']:
+            return
+
+        # One thread refreshes; the others carry on with the current filter
+        if not state.lock.acquire(blocking=state.bloom is None):
+            return
+        try:
+            # Once per worker and refresh interval, not part of any view's budget
+            with uncounted():
+                if state.bloom is None or state.bloom.count > state.bloom.capacity:
+                    self._rebuild(state, config)
+                else:
+                    self._pull_new(state)
+            state.refreshed_at = now
+        finally:
+            state.lock.release()
+
+    @staticmethod
+    def _rebuild(state, config):
+        started = au.aware_utcnow()
+        query = db.session.query(RevokedToken.jti).filter(
+            db.or_(RevokedToken.expires_at.is_(None), RevokedToken.expires_at > started))
+        live = query.count()
+
+        bloom = BloomFilter(max(config['REVOCATION_BLOOM_CAPACITY'], live * 2),
+                            config['REVOCATION_BLOOM_ERROR_RATE'])
+        for (jti,) in query.yield_per(5000):
+            bloom.add(jti)
+        state.bloom, state.watermark = bloom, started
+
+    @staticmethod
+    def _pull_new(state):
+        started = au.aware_utcnow()
+        rows = db.session.query(RevokedToken.jti).filter(
+            RevokedToken.revoked_on > state.watermark - REFRESH_OVERLAP)
+        for (jti,) in rows:
+            state.bloom.add(jti)
+        state.watermark = started
+
+
+def _purge(model, key, cutoff, batch_size):
+    purged = 0
+    last_key = None
+    while True:
+        query = select(key).order_by(key).limit(batch_size)
+        if last_key is not None:
+            query = query.where(key > last_key)
+        keys = db.session.scalars(query).all()
+        if not keys:
+            return purged
+        result = db.session.execute(
+            delete(model).where(key.in_(keys), model.expires_at < cutoff))
+        db.session.commit()
+        purged += result.rowcount
+        last_key = keys[-1]
+
+
+revocations = RevocationList()
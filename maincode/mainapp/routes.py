@@ -1,10 +1,14 @@
 from flask import Blueprint, jsonify, request
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
 
 
-from maincode import db
+from maincode import db, hasher
 from maincode.appstrings import lcl, ccl
 from maincode.mainapp import utils as au
-from maincode.mainapp.model import User, Organisation
+from maincode.mainapp import membership
+from maincode.mainapp.identity import identities
+from maincode.mainapp.model import User, Organisation, users_organisations_table
 
 
 mainapp = Blueprint("mainapp", __name__)
@@ -24,56 +28,191 @@ def home():
 
 def register_user(data):
 
-    user_id = au.generate_new_user_id(User)
-    
-    # Initialise user
-    user = User(
-        userId=user_id,
-        email=data['email'],
-        phone=data['phone'],
-        lastName=data['lastName'],
-        password=data['password'],
-        firstName=data['firstName'],
-        accessToken=au.create_new_jwt_token(user_id)
-    )
-
-    # Add user to session
-    db.session.add(user)
-
-    # Create default org for user
-    org = user.add_default_organisation("")
+    # Hash once; only the ids change between attempts
+    hashed_password = hasher.hash(data['password'])
 
-    # Add user to org
-    org.users.add(user)
+    for attempt in range(au.ID_COLLISION_RETRIES):
+        user_id = au.generate_new_id()
 
-    # Commit all
-    db.session.commit()
+        # Initialise user
+        user = User(
+            userId=user_id,
+            email=data['email'],
+            phone=data['phone'],
+            lastName=data['lastName'],
+            password=data['password'],
+            firstName=data['firstName'],
+            hashed_password=hashed_password,
+            accessToken=au.create_new_jwt_token(user_id)
+        )
 
-    return user, org
+        # Add user to session
+        db.session.add(user)
+
+        # Create default org for user
+        org = user.add_default_organisation("")
+
+        # Add user to org
+        org.users.add(user)
+        user.orgCount = org.memberCount = 1
+
+        # Commit all, retrying with fresh ids on a key collision
+        try:
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            # A duplicate email or the like won't go away on a retry
+            if not au.is_id_collision(e) or attempt == au.ID_COLLISION_RETRIES - 1:
+                raise
+            continue
+
+        return user, org
 
 
 def register_org(data):
-    
-    # Initialise org
-    org = Organisation(
-        name=data[lcl.name],
-        creatorId=data['creatorId'],
-        description=data.get(lcl.description),
-        orgId=au.generate_new_org_id(Organisation),
-    )
 
     creator = User.get_self(data['creatorId'])
 
-    # Add org to session
-    db.session.add(org)
+    for attempt in range(au.ID_COLLISION_RETRIES):
+        # Initialise org
+        org = Organisation(
+            name=data[lcl.name],
+            creatorId=data['creatorId'],
+            description=data.get(lcl.description),
+            orgId=au.generate_new_id(),
+        )
 
-    # Add user to org
-    org.users.add(creator)
+        # Add org to session
+        db.session.add(org)
 
-    # Commit all
-    db.session.commit()
+        # Add user to org
+        org.users.add(creator)
+        org.memberCount = 1
+        creator.orgCount = User.orgCount + 1
+        creator.membershipVersion = User.membershipVersion + 1
+
+        # Commit all, retrying with a fresh id on a key collision
+        try:
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            # A duplicate email or the like won't go away on a retry
+            if not au.is_id_collision(e) or attempt == au.ID_COLLISION_RETRIES - 1:
+                raise
+            continue
+
+        identities.invalidate(creator.id)
+
+        return org, org.creator
+
+
+def _bulk_row_errors(row):
+    """Validate one bulk registration row the way RegisterUser does"""
+    if not isinstance(row, dict):
+        return [{lcl.field: None, lcl.message: "Row must be an object"}]
+
+    errors = au.check_regiter_user_data(row)[lcl.errors]
+    if errors:
+        return errors
+
+    errors = [
+        {lcl.field: f, lcl.message: f"{f.title()} must be a string"}
+        for f in ('firstName', 'lastName', 'email', 'password') if not isinstance(row[f], str)
+    ]
+    if errors:
+        return errors
+
+    if not au.is_valid_email_format(row[lcl.email]):
+        errors.append({lcl.field: lcl.email, lcl.message: "Invalid email"})
+
+    if row.get(lcl.phone) and not au.is_valid_phone(str(row[lcl.phone])):
+        errors.append({lcl.field: lcl.phone, lcl.message: "Invalid phone number"})
 
-    return org, org.creator
+    return errors
+
+
+def register_users_bulk(rows, chunk_size=500):
+    """Register many users at once and return one result per row.
+
+    Rows are validated in a single pass and checked against existing
+    emails with one IN query per chunk. Passwords are hashed across the
+    whole hashing pool. Users, their default organisations and their
+    memberships then go in as multi-row INSERTs, followed by one bulk
+    UPDATE linking each user to its default org, one transaction per
+    `chunk_size` rows, so a failed chunk doesn't undo the others."""
+    results = [None] * len(rows)
+    valid = []
+    seen_emails = set()
+
+    for index, row in enumerate(rows):
+        errors = _bulk_row_errors(row)
+        if not errors and row[lcl.email] in seen_emails:
+            errors = [{lcl.field: lcl.email, lcl.message: "Duplicate email in request"}]
+        if errors:
+            results[index] = {"index": index, lcl.status: lcl.error, lcl.errors: errors}
+            continue
+        seen_emails.add(row[lcl.email])
+        valid.append(index)
+
+    for start in range(0, len(valid), chunk_size):
+        chunk = valid[start:start + chunk_size]
+
+        taken = {email for (email,) in db.session.query(User.email).filter(
+            User.email.in_([rows[i][lcl.email] for i in chunk]))}
+        for index in chunk:
+            if rows[index][lcl.email] in taken:
+                results[index] = {"index": index, lcl.status: lcl.error, lcl.errors: [
+                    {lcl.field: lcl.email, lcl.message: "User with email exists"}]}
+        chunk = [i for i in chunk if results[i] is None]
+        if not chunk:
+            continue
+
+        hashes = hasher.hash_many(rows[i][lcl.password] for i in chunk)
+
+        users, orgs, memberships = [], [], []
+        for index, hashed_password in zip(chunk, hashes):
+            row = rows[index]
+            user_id, org_id = au.generate_new_id(), au.generate_new_id()
+            users.append({
+                "id": user_id,
+                "userId": user_id,
+                "email": row[lcl.email],
+                "phone": str(row[lcl.phone]) if row.get(lcl.phone) is not None else None,
+                "lastName": row['lastName'],
+                "firstName": row['firstName'],
+                "password": hashed_password,
+                "orgCount": 1,
+            })
+            orgs.append({
+                "id": org_id,
+                "orgId": org_id,
+                "creatorId": user_id,
+                "description": "",
+                "name": User.default_org_name_for(row['firstName']),
+                "memberCount": 1,
+            })
+            memberships.append({"users_id": user_id, "organisations_id": org_id})
+
+        try:
+            db.session.execute(insert(User), users)
+            db.session.execute(insert(Organisation), orgs)
+            db.session.execute(insert(users_organisations_table), memberships)
+            # Point users at their orgs once both exist
+            db.session.execute(update(User), [
+                {"id": org["creatorId"], "defaultOrgId": org["id"]} for org in orgs])
+            db.session.commit()
+        except IntegrityError:
+            # Most likely an email registered concurrently
+            db.session.rollback()
+            for index in chunk:
+                results[index] = {"index": index, lcl.status: lcl.error, lcl.errors: [
+                    {lcl.field: None, lcl.message: "Conflict while saving, please retry"}]}
+            continue
+
+        for index, user in zip(chunk, users):
+            results[index] = {"index": index, lcl.status: lcl.created, "userId": user["userId"]}
+
+    return results
 
 
 def add_user_to_org(userId, orgId):
@@ -88,8 +227,38 @@ def add_user_to_org(userId, orgId):
     
     # Add user to org
     org.users.add(user)
+    org.memberCount = Organisation.memberCount + 1
+    user.orgCount = User.orgCount + 1
+    user.membershipVersion = User.membershipVersion + 1
 
     # Commit all
     db.session.commit()
 
+    identities.invalidate(user.id)
+
     return user, org
+
+
+def add_users_to_org_bulk(userIds, orgId, batch_size=1000):
+    """Add many users to an org in one transaction.
+
+    Returns None if the org doesn't exist, else a tuple of
+    ``(added_ids, already_member_ids, unknown_ids)``"""
+    if not db.session.query(Organisation.id).filter_by(id=orgId).scalar():
+        return
+
+    user_ids = list(dict.fromkeys(userIds))
+    known = {user_id for (user_id,) in db.session.query(User.id).filter(User.id.in_(user_ids))}
+    unknown_ids = [user_id for user_id in user_ids if user_id not in known]
+    user_ids = [user_id for user_id in user_ids if user_id in known]
+
+    added = set(membership.insert_memberships(orgId, user_ids, batch_size=batch_size))
+
+    # Commit all
+    db.session.commit()
+
+    identities.invalidate(*added)
+
+    added_ids = [user_id for user_id in user_ids if user_id in added]
+    already_member_ids = [user_id for user_id in user_ids if user_id not in added]
+    return added_ids, already_member_ids, unknown_ids
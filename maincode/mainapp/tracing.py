@@ -0,0 +1,53 @@
+"""
+Sentry setup.
+
+Nothing is initialised without a DSN, so local runs and tests pay no
+per-request cost. With one, errors are always reported at
+`SENTRY_ERROR_SAMPLE_RATE`, while performance traces are opt-in and
+sampled per route: the longest `SENTRY_TRACES_ROUTE_RATES` prefix
+matching the request path wins, else `SENTRY_TRACES_SAMPLE_RATE`.
+Requests continuing an upstream trace follow the upstream decision.
+
+Config:
+    SENTRY_DSN                  project DSN, unset disables Sentry
+    SENTRY_ERROR_SAMPLE_RATE    share of error events sent
+    SENTRY_TRACES_SAMPLE_RATE   default share of requests traced
+    SENTRY_TRACES_ROUTE_RATES   {path prefix: share of requests traced}
+"""
+import sentry_sdk
+from sentry_sdk.integrations.flask import FlaskIntegration
+
+
+def make_traces_sampler(default_rate, route_rates):
+    """Return a Sentry `traces_sampler` applying `route_rates`"""
+    prefixes = sorted(route_rates, key=len, reverse=True)
+
+    def traces_sampler(sampling_context):
+        parent_sampled = sampling_context.get("parent_sampled")
+        if parent_sampled is not None:
+            return float(parent_sampled)
+
+        path = (sampling_context.get("wsgi_environ") or {}).get("PATH_INFO", "")
+        for prefix in prefixes:
+            if path == prefix or path.startswith(prefix.rstrip("/") + "/"):
+                return route_rates[prefix]
+        return default_rate
+
+    return traces_sampler
+
+
+def init_sentry(app):
+    """Initialise Sentry from `app.config`. Returns False when no DSN
+    is configured"""
+    config = app.config
+    if not config.get('SENTRY_DSN'):
+        return False
+
+    sentry_sdk.init(
+        dsn=config['SENTRY_DSN'],
+        integrations=[FlaskIntegration()],
+        sample_rate=config['SENTRY_ERROR_SAMPLE_RATE'],
+        traces_sampler=make_traces_sampler(
+            config['SENTRY_TRACES_SAMPLE_RATE'], config['SENTRY_TRACES_ROUTE_RATES']),
+    )
+    return True
@@ -1,12 +1,52 @@
 import re
-from uuid import uuid4
+import time
+import secrets
+import threading
+from uuid import UUID
+from functools import wraps
+from flask import current_app, jsonify
 from datetime import datetime, timezone
-from flask_jwt_extended import create_access_token, create_refresh_token
+from itsdangerous import BadSignature, URLSafeSerializer
+from flask_jwt_extended import create_access_token, create_refresh_token, get_current_user
 
 
 from maincode.appstrings import lcl
 
 
+DEFAULT_PAGE_LIMIT = 100
+
+# Attempts at inserting a row under a freshly generated id
+ID_COLLISION_RETRIES = 3
+
+# The "table.column"s that hold generated ids
+ID_COLUMNS = frozenset({"users.id", "users.userId", "organisations.id", "organisations.orgId"})
+
+_PG_KEY_DETAIL = re.compile(r'Key \((.+?)\)=')
+
+
+def violated_columns(error):
+    """Return the "table.column" names whose unique or primary key
+    constraint an IntegrityError violated, or an empty set if it was
+    some other constraint"""
+    diag = getattr(error.orig, 'diag', None)
+    if diag is not None:
+        # psycopg2: table_name, and 'Key ("userId")=(...) already exists.'
+        match = _PG_KEY_DETAIL.match(diag.message_detail or "")
+        if not match or not diag.table_name:
+            return set()
+        columns = (column.strip().strip('"') for column in match.group(1).split(","))
+        return {f"{diag.table_name}.{column}" for column in columns}
+    # sqlite3: "UNIQUE constraint failed: users.email"
+    _, found, columns = str(error.orig).partition("UNIQUE constraint failed: ")
+    return {column.strip() for column in columns.split(",")} if found else set()
+
+
+def is_id_collision(error):
+    """True if an IntegrityError is a clash on a generated id,
+    which a retry under a fresh id gets past"""
+    return bool(violated_columns(error) & ID_COLUMNS)
+
+
 UNSUCCESSFUL_REGISTER_USER_RESPONSE = {
     "status": "Bad request",
     "message": "Registration unsuccessful",
@@ -21,6 +61,13 @@ UNSUCCESSFUL_LOGIN_USER_RESPONSE = {
 }
 
 
+UNSUCCESSFUL_LOGOUT_USER_RESPONSE = {
+    "status": "Bad request",
+    "message": "Logout unsuccessful",
+    "statusCode": 400
+}
+
+
 UNSUCCESSFUL_GET_USER_RESPONSE = {
     "status": "Not Found",
     "message": "User not found",
@@ -42,6 +89,11 @@ UNSUCCESSFUL_GET_ORG_RESPONSE = {
 }
 
 
+INVALID_CURSOR_RESPONSE = {
+    lcl.errors: [{lcl.field: lcl.cursor, lcl.message: "Invalid cursor"}]
+}
+
+
 UNSUCCESSFUL_LIST_ORGS_RESPONSE = {
     "status": "Not Found",
     "message": "Organisations list not found",
@@ -55,6 +107,13 @@ SUCCESSFUL_ADD_USER_TO_ORG_RESPONSE = {
 }
 
 
+UNSUCCESSFUL_BULK_ADD_USERS_TO_ORG_RESPONSE = {
+    "status": "Bad Request",
+    "message": "Client error",
+    "statusCode": 400
+}
+
+
 UNSUCCESSFUL_ADD_USER_TO_ORG_RESPONSE = {
     "status": "Bad Request",
     "message": "Client error",
@@ -62,6 +121,34 @@ UNSUCCESSFUL_ADD_USER_TO_ORG_RESPONSE = {
 }
 
 
+FORBIDDEN_RESPONSE = {
+    "status": "Forbidden",
+    "message": "Admin access required",
+    "statusCode": 403
+}
+
+
+UNSUCCESSFUL_BULK_REGISTER_RESPONSE = {
+    "status": "Bad request",
+    "message": "Bulk registration unsuccessful",
+    "statusCode": 400
+}
+
+
+SERVICE_BUSY_RESPONSE = {
+    "status": "Service Unavailable",
+    "message": "Server busy, please retry shortly",
+    "statusCode": 503
+}
+
+
+TOO_MANY_REQUESTS_RESPONSE = {
+    "status": "Too Many Requests",
+    "message": "Too many attempts, please retry later",
+    "statusCode": 429
+}
+
+
 def is_eq(val1, val2):
     return val1 == val2
 
@@ -82,6 +169,28 @@ def jwt_error(msg, err):
     }
 
 
+def admin_required(fn):
+    """Let through only callers listed in ADMIN_EMAILS.
+    Goes under `jwt_required`"""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        user = get_current_user()
+        if user is None or user.to_dict()[lcl.email].lower() not in current_app.config['ADMIN_EMAILS']:
+            return jsonify(FORBIDDEN_RESPONSE), 403
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def busy_response(retry_after):
+    """Return the 503 response for a saturated worker pool"""
+    return jsonify(SERVICE_BUSY_RESPONSE), 503, {"Retry-After": str(retry_after)}
+
+
+def too_many_requests_response(retry_after):
+    """Return the 429 response for a rate limited client"""
+    return jsonify(TOO_MANY_REQUESTS_RESPONSE), 429, {"Retry-After": str(retry_after)}
+
+
 def create_new_jwt_token(identity, refresh=False):
     if refresh:
         # Refresh existing user token
@@ -90,20 +199,53 @@ def create_new_jwt_token(identity, refresh=False):
     return create_access_token(identity=identity, fresh=True)
 
 
-def generate_new_org_id(Org):
-    new_id = str(uuid4()).replace('-', '')
-    while True:
-        if Org.get_self(new_id):
-            continue
-        return new_id
+def _cursor_serializer():
+    return URLSafeSerializer(current_app.secret_key, salt="organisations-cursor")
+
+
+def encode_cursor(key):
+    """Sign a keyset ``(created_on, id)`` pair into an opaque token"""
+    created_on, row_id = key
+    return _cursor_serializer().dumps([created_on.isoformat(), row_id])
+
+
+def decode_cursor(token):
+    """Return the ``(created_on, id)`` pair signed into `token`,
+    or None if the token is malformed or has been tampered with"""
+    try:
+        created_on, row_id = _cursor_serializer().loads(token)
+        return datetime.fromisoformat(created_on), row_id
+    except (BadSignature, TypeError, ValueError):
+        return None
 
 
-def generate_new_user_id(Usr):
-    new_id = str(uuid4()).replace('-', '')
-    while True:
-        if Usr.get_self(new_id):
-            continue
-        return new_id
+_id_lock = threading.Lock()
+_id_state = {"ms": 0, "rand": 0}
+
+
+def generate_new_id():
+    """Return a new 32-char hex id laid out like a UUIDv7.
+
+    The leading 48 bits are the Unix time in milliseconds, so ids
+    sort by creation time and new rows land at the right edge of the
+    primary key index. The rest is random. Within one millisecond
+    the random part is incremented instead of redrawn, so ids from
+    one process are strictly increasing. No uniqueness query is made;
+    the primary key catches the (practically impossible) collision
+    and callers retry."""
+    with _id_lock:
+        ms = max(time.time_ns() // 1_000_000, _id_state["ms"])
+        if ms == _id_state["ms"]:
+            rand = _id_state["rand"] + 1
+            if rand >> 74:
+                ms, rand = ms + 1, secrets.randbits(74)
+        else:
+            rand = secrets.randbits(74)
+        _id_state["ms"], _id_state["rand"] = ms, rand
+
+    # 48 bits time | version 7 | 12 bits rand | variant 0b10 | 62 bits rand
+    value = (ms << 80) | (0x7 << 76) | ((rand >> 62) << 64) | (0b10 << 62) | (rand & ((1 << 62) - 1))
+    return UUID(int=value).hex
     
 
 def is_valid_email_format(string):
@@ -130,6 +272,10 @@ def is_valid_email_format(string):
     return True
 
 
+def is_valid_phone(string):
+    return string.replace('+', '').replace('-', '').isnumeric()
+
+
 def check_regiter_user_data(d):
     required_f = ['firstName', 'lastName', 'email', 'password']
 
@@ -1,6 +1,9 @@
 import pytest
+from contextlib import contextmanager
 
 from maincode import db, create_app
+from maincode.mainapp.model import User
+from maincode.mainapp.querybudget import count_queries
 
 
 @pytest.fixture
@@ -12,7 +15,8 @@ def app():
     db.create_all()
     # Do tests
     yield app
-    # Drop tables
+    # Drop tables (release the session's locks first)
+    db.session.remove()
     db.drop_all()
     app_ctx.pop()
 
@@ -20,4 +24,26 @@ def app():
 @pytest.fixture
 def client(app):
     # yield test client
-    return app.test_client()
\ No newline at end of file
+    return app.test_client()
+
+
+@pytest.fixture
+def query_budget():
+    # Fail the test if the block issues more than `n` statements
+    @contextmanager
+    def check(n):
+        with count_queries() as log:
+            yield log
+        assert log.count <= n, f"{log.count} SQL statements, budget {n}:\n{log.describe()}"
+    return check
+
+
+@pytest.fixture
+def register(client):
+    # Sign a user up through the API, return them and their auth headers
+    def register(first_name, email):
+        client.post("http://localhost:5000/auth/register", json={
+            "firstName": first_name, "lastName": "Obioha", "email": email, "password": "mypassword", "phone": ""})
+        user = User.query.filter_by(email=email).first()
+        return user, {'Authorization': f'Bearer {user.current_access_token}'}
+    return register
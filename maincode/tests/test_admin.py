@@ -0,0 +1,51 @@
+from maincode import db
+from maincode.mainapp.model import Organisation
+from maincode.mainapp.querybudget import count_queries
+
+
+base_url = "http://localhost:5000"
+
+
+def register_many(client, n, start=0):
+    for i in range(start, start + n):
+        client.post(f"{base_url}/auth/register", json={
+            "firstName": f"User{i}", "lastName": "Obioha", "email": f"user{i}@example.com",
+            "password": "mypassword", "phone": ""})
+
+
+def list_page(client, url):
+    # Start from a cold session, as a fresh request would
+    db.session.expire_all()
+    with count_queries() as log:
+        resp = client.get(url)
+    assert resp.status_code == 200
+    return resp.get_data(as_text=True), log
+
+
+def test_user_list_queries_dont_grow_with_rows(app, client):
+    with app.test_request_context():
+        register_many(client, 3)
+        _, small = list_page(client, f"{base_url}/admin/user/")
+        register_many(client, 12, start=3)
+        page, large = list_page(client, f"{base_url}/admin/user/")
+
+        assert large.count == small.count <= 2
+        assert "user14@example.com" in page and "User14&#39;s Organisation" in page
+        users_select = next(s for s in large.statements if "FROM users" in s)
+        assert "password" not in users_select
+        assert "count(" not in " ".join(large.statements)
+
+
+def test_org_list_and_page_size_cap(app, client):
+    with app.test_request_context():
+        register_many(client, 5)
+        page, log = list_page(client, f"{base_url}/admin/organisation/")
+        assert log.count <= 2
+        assert "user4@example.com" in page
+
+        view = next(v for v in app.extensions['admin'][0]._views if getattr(v, 'model', None) is Organisation)
+        with app.test_request_context("/admin/organisation/?page_size=1000000"):
+            assert view._get_list_extra_args().page_size == view.max_page_size
+        with app.test_request_context("/admin/organisation/?page_size=20"):
+            assert view._get_list_extra_args().page_size == 20
+
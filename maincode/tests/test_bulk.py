@@ -0,0 +1,70 @@
+import json
+
+from maincode.mainapp.model import User
+
+
+base_url = "http://localhost:5000"
+
+
+def user_data(first_name, email, **extra):
+    data = {
+        "firstName": first_name,
+        "lastName": "Obioha",
+        "email": email,
+        "password": "mypassword",
+        "phone": "",
+    }
+    data.update(extra)
+    return data
+
+
+def register_admin(app, client):
+    app.config['ADMIN_EMAILS'] = {"admin@example.com"}
+    client.post(f"{base_url}/auth/register", json=user_data("Admin", "admin@example.com"))
+    admin = User.query.filter_by(email="admin@example.com").first()
+    return {'Authorization': f'Bearer {admin.current_access_token}'}
+
+
+def test_bulk_register_reports_per_row(app, client):
+    with app.test_request_context():
+        headers = register_admin(app, client)
+
+        rows = [
+            user_data("Ada", "ada@example.com"),
+            user_data("Bola", "not-an-email"),
+            user_data("Chidi", "admin@example.com"),
+            user_data("Dayo", "ada@example.com"),
+            {"firstName": "Ebuka"},
+            user_data("Femi", "femi@example.com", phone="0801"),
+        ]
+        resp = client.post(f"{base_url}/auth/register/bulk", json=rows, headers=headers)
+        assert resp.status_code == 200
+        data = resp.json['data']
+        assert (data['created'], data['failed']) == (2, 4)
+
+        statuses = [r['status'] for r in data['results']]
+        assert statuses == ["created", "error", "error", "error", "error", "created"]
+        assert data['results'][2]['errors'][0]['message'] == "User with email exists"
+        assert data['results'][3]['errors'][0]['message'] == "Duplicate email in request"
+
+        ada = User.query.filter_by(email="ada@example.com").first()
+        assert ada.userId == data['results'][0]['userId']
+        assert ada.confirm_password("mypassword")
+        assert ada.default_org in ada.organisations
+
+
+def test_bulk_register_ndjson_and_admin_only(app, client):
+    with app.test_request_context():
+        headers = register_admin(app, client)
+
+        body = "\n".join([json.dumps(user_data("Ada", "ada@example.com")), "{broken", ""])
+        resp = client.post(f"{base_url}/auth/register/bulk", data=body,
+                           content_type="application/x-ndjson", headers=headers)
+        assert resp.status_code == 200
+        assert [r['status'] for r in resp.json['data']['results']] == ["created", "error"]
+
+        ada = User.query.filter_by(email="ada@example.com").first()
+        client.post(f"{base_url}/auth/login", json={"email": ada.email, "password": "mypassword"})
+        resp = client.post(f"{base_url}/auth/register/bulk", json=[],
+                           headers={'Authorization': f'Bearer {ada.current_access_token}'})
+        assert resp.status_code == 403
@@ -0,0 +1,42 @@
+from maincode import db
+from maincode.config import ProductionConfig
+from maincode.mainapp.model import User
+from maincode.mainapp.dbpool import engine_options, InstrumentedNullPool, InstrumentedQueuePool
+
+
+base_url = "http://localhost:5000"
+
+
+def pool_config(**overrides):
+    config = {k: getattr(ProductionConfig, k) for k in dir(ProductionConfig) if k.isupper()}
+    config.update(overrides)
+    return config
+
+
+def test_engine_options_per_mode():
+    options = engine_options(pool_config(
+        DB_SERVERLESS=False, DB_STATEMENT_TIMEOUT_MS=5000,
+        SQLALCHEMY_DATABASE_URI="postgresql://u:p@db/app"))
+    assert options["poolclass"] is InstrumentedQueuePool
+    assert options["pool_pre_ping"] is True
+    assert options["connect_args"] == {"options": "-c statement_timeout=5000"}
+
+    options = engine_options(pool_config(DB_SERVERLESS=True, SQLALCHEMY_DATABASE_URI="sqlite:///x.db"))
+    assert options == {"poolclass": InstrumentedNullPool}
+
+
+def test_pool_stats_endpoint(app, client):
+    with app.test_request_context():
+        app.config['ADMIN_EMAILS'] = {"admin@example.com"}
+        client.post(f"{base_url}/auth/register", json={
+            "firstName": "Admin", "lastName": "Obioha", "email": "admin@example.com",
+            "password": "mypassword", "phone": ""})
+        admin = User.query.filter_by(email="admin@example.com").first()
+        headers = {'Authorization': f'Bearer {admin.current_access_token}'}
+
+        resp = client.get(f"{base_url}/api/admin/stats/db-pool", headers=headers)
+        assert resp.status_code == 200
+        stats = resp.json['data']['default']
+        assert stats['pool'] == type(db.engine.pool).__name__ == "InstrumentedQueuePool"
+        assert stats['checkouts'] >= 1
+        assert stats['connects'] >= 1
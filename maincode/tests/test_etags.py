@@ -0,0 +1,125 @@
+from maincode import db
+from maincode.mainapp.model import User, Organisation
+
+
+base_url = "http://localhost:5000"
+
+
+def revalidate(client, url, headers, query_budget, budget):
+    first = client.get(url, headers=headers)
+    assert first.status_code == 200
+    assert first.headers['ETag'].startswith('W/"')
+    with query_budget(budget):
+        second = client.get(url, headers={**headers, 'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 304
+    assert second.data == b""
+    assert second.headers['ETag'] == first.headers['ETag']
+    return first.headers['ETag']
+
+
+def test_get_org_not_modified_until_updated(app, client, query_budget, register):
+    with app.test_request_context():
+        ada, headers = register("Ada", "ada@example.com")
+        org = ada.default_org
+        url = f"{base_url}/api/organisations/{org.id}"
+        # Revocation check, identity, version
+        etag = revalidate(client, url, headers, query_budget, 3)
+
+        org.description = "Renamed"
+        db.session.commit()
+        assert org.version == 2
+        resp = client.get(url, headers={**headers, 'If-None-Match': etag})
+        assert resp.status_code == 200
+        assert resp.json['data']['description'] == "Renamed"
+        assert resp.headers['ETag'] != etag
+
+
+def test_get_user_not_modified(app, client, query_budget, register):
+    with app.test_request_context():
+        ada, headers = register("Ada", "ada@example.com")
+        bola, _ = register("Bola", "bola@example.com")
+        client.post(f"{base_url}/api/organisations/{ada.default_org.id}/users", json={"userId": bola.userId})
+
+        revalidate(client, f"{base_url}/api/users/{ada.id}", headers, query_budget, 2)
+        etag = revalidate(client, f"{base_url}/api/users/{bola.id}", headers, query_budget, 3)
+
+        bola.lastName = "Ade"
+        db.session.commit()
+        resp = client.get(f"{base_url}/api/users/{bola.id}", headers={**headers, 'If-None-Match': etag})
+        assert resp.status_code == 200
+        assert resp.json['data']['lastName'] == "Ade"
+
+        # Users that aren't visible don't get a 304 either
+        chidi, _ = register("Chidi", "chidi@example.com")
+        resp = client.get(f"{base_url}/api/users/{chidi.id}", headers={**headers, 'If-None-Match': '*'})
+        assert resp.status_code == 400
+
+
+def test_revalidation_budget_on_a_fresh_worker(app, client, register):
+    with app.test_request_context():
+        app.config['ORG_CACHE_ENABLED'] = False
+        ada, headers = register("Ada", "ada@example.com")
+        bola, _ = register("Bola", "bola@example.com")
+        client.post(f"{base_url}/api/organisations/{ada.default_org.id}/users", json={"userId": bola.userId})
+
+        # The first request of a worker builds the revocation filter
+        # outside the view's budget (QUERY_BUDGET_RAISE is on)
+        stale = {**headers, 'If-None-Match': 'W/"stale"'}
+        for url in (f"{base_url}/api/users/{bola.id}", f"{base_url}/api/organisations/{ada.default_org.id}"):
+            app.extensions.pop('revocation_list', None)
+            assert client.get(url, headers=stale).status_code == 200
+
+
+def test_list_orgs_etag_follows_memberships(app, client, query_budget, register):
+    with app.test_request_context():
+        ada, headers = register("Ada", "ada@example.com")
+        bola, _ = register("Bola", "bola@example.com")
+        url = f"{base_url}/api/organisations"
+        etag = revalidate(client, url, headers, query_budget, 3)
+
+        client.post(f"{base_url}/api/organisations/{bola.default_org.id}/users", json={"userId": ada.userId})
+        assert User.get_self(ada.id).membershipVersion == 2
+        resp = client.get(url, headers={**headers, 'If-None-Match': etag})
+        assert resp.status_code == 200
+        assert len(resp.json['data']['organisations']) == 2
+        etag = resp.headers['ETag']
+
+        # Updating one of the organisations changes it too
+        org = Organisation.get_self(bola.default_org.id)
+        org.name = "Renamed"
+        db.session.commit()
+        resp = client.get(url, headers={**headers, 'If-None-Match': etag})
+        assert resp.status_code == 200
+        assert "Renamed" in {o['name'] for o in resp.json['data']['organisations']}
+
+
+def test_list_orgs_pages_have_their_own_etags(app, client, register):
+    with app.test_request_context():
+        ada, headers = register("Ada", "ada@example.com")
+        for i in range(3):
+            client.post(f"{base_url}/api/organisations", json={"name": f"Org {i}"}, headers=headers)
+        url = f"{base_url}/api/organisations"
+
+        first = client.get(url, headers=headers, query_string={"limit": 2})
+        cursor = first.json['data']['nextCursor']
+        tags = {first.headers['ETag'],
+                client.get(url, headers=headers).headers['ETag'],
+                client.get(url, headers=headers, query_string={"limit": 3}).headers['ETag']}
+        assert len(tags) == 3
+
+        # Page 2 isn't "not modified" for a client that only has page 1
+        resp = client.get(url, headers={**headers, 'If-None-Match': first.headers['ETag']},
+                          query_string={"limit": 2, "cursor": cursor})
+        assert resp.status_code == 200
+        assert len(resp.json['data']['organisations']) == 2
+        resp = client.get(url, headers={**headers, 'If-None-Match': resp.headers['ETag']},
+                          query_string={"limit": 2, "cursor": cursor})
+        assert resp.status_code == 304
+
+
+def test_list_orgs_etag_from_cached_identity(app, client, query_budget, register):
+    with app.test_request_context():
+        app.config['IDENTITY_CACHE_TTL'] = 60
+        ada, headers = register("Ada", "ada@example.com")
+        # The tag computed from the loaded rows matches the version query's
+        revalidate(client, f"{base_url}/api/organisations", headers, query_budget, 3)
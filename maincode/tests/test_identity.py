@@ -0,0 +1,32 @@
+base_url = "http://localhost:5000"
+
+
+def test_cached_identity_serves_hot_reads(app, client, register, query_budget):
+    with app.test_request_context():
+        app.config['IDENTITY_CACHE_TTL'] = 60
+        u1, headers = register("Ada", "ada@example.com")
+        u2, _ = register("Bola", "bola@example.com")
+
+        # Warm the cache
+        assert client.get(f"{base_url}/api/users/{u1.id}", headers=headers).status_code == 200
+
+        with query_budget(0):
+            resp = client.get(f"{base_url}/api/users/{u1.id}", headers=headers)
+        assert resp.status_code == 200
+
+        with query_budget(1) as log:
+            resp = client.get(f"{base_url}/api/users/{u2.id}", headers=headers)
+        assert resp.status_code == 400
+        assert log.count == 1
+
+        with query_budget(1) as log:
+            resp = client.get(f"{base_url}/api/organisations", headers=headers)
+        assert len(resp.json['data']['organisations']) == 1
+        assert log.count == 1
+
+        # Membership changes invalidate the cached identity
+        client.post(f"{base_url}/api/organisations/{u2.default_org.id}/users",
+                    json={"userId": u1.userId})
+        resp = client.get(f"{base_url}/api/organisations", headers=headers)
+        assert len(resp.json['data']['organisations']) == 2
+        assert client.get(f"{base_url}/api/users/{u2.id}", headers=headers).status_code == 200
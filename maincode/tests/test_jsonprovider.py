@@ -0,0 +1,37 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from maincode.mainapp.jsonprovider import OrjsonProvider, StdlibJSONProvider
+
+
+# The stdlib provider still serves where orjson is missing
+pytest.importorskip("orjson")
+
+base_url = "http://localhost:5000"
+
+
+def test_providers_agree(app):
+    payload = {"b": [{"x": 1}], "a": datetime(2024, 7, 1, tzinfo=timezone.utc)}
+    fast = json.loads(OrjsonProvider(app).dumps(payload))
+    slow = json.loads(StdlibJSONProvider(app).dumps(payload))
+    assert fast == slow == {"a": "Mon, 01 Jul 2024 00:00:00 GMT", "b": [{"x": 1}]}
+    assert OrjsonProvider(app).dumps({1: "one"}) == '{"1":"one"}'
+
+
+def test_list_orgs_same_under_both_providers(app, client):
+    with app.test_request_context():
+        token = client.post(f"{base_url}/auth/register", json={
+            "firstName": "Ada", "lastName": "Obioha", "email": "ada@example.com",
+            "password": "mypassword", "phone": ""}).json['data']['accessToken']
+        headers = {'Authorization': f'Bearer {token}'}
+        client.post(f"{base_url}/api/organisations", json={"name": "Ünïcode", "description": "x"},
+                    headers=headers)
+
+        app.json = OrjsonProvider(app)
+        fast = client.get(f"{base_url}/api/organisations", headers=headers).json
+        app.json = StdlibJSONProvider(app)
+        slow = client.get(f"{base_url}/api/organisations", headers=headers).json
+        assert fast == slow
+        assert len(fast['data']['organisations']) == 2
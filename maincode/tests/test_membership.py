@@ -0,0 +1,205 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from maincode import db
+from maincode.mainapp.model import User, Organisation
+from maincode.mainapp import membership, routes
+from maincode.mainapp import utils as au
+
+
+base_url = "http://localhost:5000"
+
+
+def test_user_organisations_query(app, client, register):
+    with app.test_request_context():
+        u1, _ = register("Ada", "ada@example.com")
+        u2, _ = register("Bola", "bola@example.com")
+        u3, _ = register("Chidi", "chidi@example.com")
+
+        # An org created by u3 without u3 being a member still counts
+        orphan = Organisation(orgId="orphan", name="Orphan", creatorId=u3.id)
+        db.session.add(orphan)
+        db.session.commit()
+
+        client.post(f"{base_url}/api/organisations/{u2.default_org.id}/users",
+                    json={"userId": u1.userId})
+
+        u1_orgs = membership.user_organisations_query(u1.id).all()
+        assert [o.name for o in u1_orgs] == [u1.default_org_name, u2.default_org_name]
+
+        u3_orgs = membership.user_organisations_query(u3.id).all()
+        assert {o.id for o in u3_orgs} == {u3.default_org.id, orphan.id}
+        assert u3.all_organisations == u3_orgs
+
+
+def test_users_sharing_an_organisation_see_each_other(app, client, register):
+    with app.test_request_context():
+        u1, _ = register("Ada", "ada@example.com")
+        u2, headers = register("Bola", "bola@example.com")
+        url = f"{base_url}/api/users/{u1.id}"
+
+        assert client.get(url, headers=headers).status_code == 400
+
+        client.post(f"{base_url}/api/organisations/{u2.default_org.id}/users",
+                    json={"userId": u1.userId})
+
+        resp = client.get(url, headers=headers)
+        assert resp.status_code == 200
+        assert resp.json['data']['email'] == u1.email
+
+
+def test_visibility_same_with_and_without_identity_cache(app, client, register):
+    with app.test_request_context():
+        u1, u1_headers = register("Ada", "ada@example.com")
+        u2, u2_headers = register("Bola", "bola@example.com")
+        # Bola created an org without being a member of it; Ada is one
+        org = Organisation(orgId=au.generate_new_id(), name="Side project", creatorId=u2.id)
+        db.session.add(org)
+        db.session.flush()
+        membership.insert_memberships(org.id, [u1.id])
+        db.session.commit()
+
+        for ttl in (0, 60):
+            app.config['IDENTITY_CACHE_TTL'] = ttl
+            app.extensions.pop('identity_cache', None)
+            for _ in range(2):
+                assert client.get(f"{base_url}/api/users/{u1.id}", headers=u2_headers).status_code == 200
+                assert client.get(f"{base_url}/api/users/{u2.id}", headers=u1_headers).status_code == 200
+
+
+def test_list_orgs_keyset_pagination(app, client, register):
+    with app.test_request_context():
+        u1, headers = register("Ada", "ada@example.com")
+        for i in range(4):
+            client.post(f"{base_url}/api/organisations", json={"name": f"Org {i}"}, headers=headers)
+
+        # Default stays unpaginated
+        resp = client.get(f"{base_url}/api/organisations", headers=headers)
+        everything = [o['orgId'] for o in resp.json['data']['organisations']]
+        assert len(everything) == 5
+        assert 'nextCursor' not in resp.json['data']
+
+        seen, cursor = [], None
+        while True:
+            query = "?limit=2" + (f"&cursor={cursor}" if cursor else "")
+            resp = client.get(f"{base_url}/api/organisations{query}", headers=headers)
+            assert resp.status_code == 200
+            seen.extend(o['orgId'] for o in resp.json['data']['organisations'])
+            cursor = resp.json['data']['nextCursor']
+            if not cursor:
+                break
+        assert seen == everything
+
+        resp = client.get(f"{base_url}/api/organisations?limit=2&cursor=forged", headers=headers)
+        assert resp.status_code == 422
+        assert resp.json['errors'][0]['field'] == 'cursor'
+
+
+def test_generated_ids_are_time_ordered():
+    ids = [au.generate_new_id() for _ in range(10000)]
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+    assert all(len(i) == 32 and i[12] == '7' for i in ids)
+
+
+def test_bulk_add_users_to_org(app, client, register):
+    with app.test_request_context():
+        owner, headers = register("Ada", "ada@example.com")
+        members = [register(f"User{i}", f"user{i}@example.com")[0] for i in range(5)]
+        org_id = owner.default_org.id
+
+        client.post(f"{base_url}/api/organisations/{org_id}/users", json={"userId": members[0].id})
+
+        user_ids = [m.id for m in members] + ["ghost", members[1].id]
+        resp = client.post(f"{base_url}/api/organisations/{org_id}/users/bulk",
+                           json={"userIds": user_ids}, headers=headers)
+        assert resp.status_code == 200
+        data = resp.json['data']
+        assert data['added'] == [m.id for m in members[1:]]
+        assert data['alreadyMembers'] == [members[0].id]
+        assert data['unknownUserIds'] == ["ghost"]
+        assert owner.default_org.users.count() == 6
+
+        # Outsiders can't add to an org they don't belong to
+        outsider = members[0]
+        resp = client.post(f"{base_url}/api/organisations/{outsider.default_org.id}/users/bulk",
+                           json={"userIds": [owner.id]}, headers=headers)
+        assert resp.status_code == 400
+
+
+def test_bulk_add_over_several_batches(app, client, register):
+    with app.test_request_context():
+        app.config['BULK_ADD_TO_ORG_BATCH_SIZE'] = 2
+        owner, headers = register("Ada", "ada@example.com")
+        members = [register(f"User{i}", f"user{i}@example.com")[0] for i in range(5)]
+
+        # Three batches, within the budget that grows with them
+        resp = client.post(f"{base_url}/api/organisations/{owner.default_org.id}/users/bulk",
+                           json={"userIds": [m.id for m in members]}, headers=headers)
+        assert resp.status_code == 200
+        assert resp.json['data']['added'] == [m.id for m in members]
+        assert owner.default_org.users.count() == 6
+
+
+def test_only_id_collisions_are_retried(app, client, register, monkeypatch):
+    with app.test_request_context():
+        ada, _ = register("Ada", "ada@example.com")
+        generate = au.generate_new_id
+        # The first id handed out is already taken
+        ids = [ada.id]
+        monkeypatch.setattr(au, "generate_new_id", lambda: ids.pop(0) if ids else generate())
+
+        def user_data(email):
+            return {"firstName": "Bola", "lastName": "O", "email": email, "password": "mypassword", "phone": ""}
+
+        bola, _ = routes.register_user(user_data("bola@example.com"))
+        assert bola.id != ada.id
+
+        attempts = []
+        monkeypatch.setattr(au, "generate_new_id", lambda: attempts.append(1) or generate())
+        routes.register_user(user_data("chidi@example.com"))
+        per_attempt = len(attempts)
+        attempts.clear()
+        with pytest.raises(IntegrityError):
+            routes.register_user(user_data("ada@example.com"))
+        assert len(attempts) == per_attempt
+
+
+def test_default_org_is_per_user_not_per_name(app, client, register):
+    with app.test_request_context():
+        first, _ = register("Ada", "ada@example.com")
+        second, _ = register("Ada", "ada.two@example.com")
+
+        assert first.defaultOrgId and second.defaultOrgId
+        assert first.default_org.id != second.default_org.id
+        assert first.default_org.creatorId == first.id
+        assert second.default_org.creatorId == second.id
+
+
+def test_membership_counters_and_recount(app, client, register):
+    with app.test_request_context():
+        owner, headers = register("Ada", "ada@example.com")
+        members = [register(f"User{i}", f"user{i}@example.com")[0] for i in range(3)]
+        org_id = owner.default_org.id
+
+        client.post(f"{base_url}/api/organisations", json={"name": "Acme"}, headers=headers)
+        client.post(f"{base_url}/api/organisations/{org_id}/users", json={"userId": members[0].id})
+        client.post(f"{base_url}/api/organisations/{org_id}/users/bulk",
+                    json={"userIds": [m.id for m in members]}, headers=headers)
+
+        db.session.expire_all()
+        assert owner.default_org.memberCount == 4
+        assert owner.orgCount == 2
+        assert [m.orgCount for m in members] == [2, 2, 2]
+
+        # Drift the counters, then let the CLI repair them
+        db.session.execute(db.update(User).values(orgCount=0))
+        db.session.execute(db.update(Organisation).values(memberCount=99))
+        db.session.commit()
+        result = app.test_cli_runner().invoke(args=["recount-memberships", "--batch-size", "2"])
+        assert result.exit_code == 0
+        assert "Fixed 5 organisation(s) and 4 user(s)" in result.output
+
+        db.session.expire_all()
+        assert owner.default_org.memberCount == 4
+        assert owner.orgCount == 2
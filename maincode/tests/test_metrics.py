@@ -0,0 +1,75 @@
+import os
+import re
+import subprocess
+import sys
+
+from maincode import metrics
+from maincode.mainapp.metrics import Snapshot
+
+
+base_url = "http://localhost:5000"
+
+
+def sample(text, name, **labels):
+    """Return the value of the `name` series carrying `labels`"""
+    for line in text.splitlines():
+        match = re.match(r'^(\w+)(?:\{(.*)\})? (\S+)$', line)
+        if not match or match.group(1) != name:
+            continue
+        found = dict(re.findall(r'(\w+)="([^"]*)"', match.group(2) or ""))
+        if all(found.get(k) == v for k, v in labels.items()):
+            return float(match.group(3))
+    return None
+
+
+def test_metrics_record_requests_queries_and_hashing(app, client):
+    with app.test_request_context():
+        token = client.post(f"{base_url}/auth/register", json={
+            "firstName": "Ada", "lastName": "Obioha", "email": "ada@example.com",
+            "password": "mypassword", "phone": ""}).json['data']['accessToken']
+        client.get(f"{base_url}/api/organisations", headers={'Authorization': f'Bearer {token}'})
+
+        resp = client.get(f"{base_url}/metrics")
+        assert resp.status_code == 200
+        assert resp.mimetype == "text/plain"
+        text = resp.get_data(as_text=True)
+
+        orgs = {"endpoint": "/api/organisations", "method": "GET"}
+        assert sample(text, "http_requests_total", status="200", **orgs) >= 1
+        assert sample(text, "http_request_duration_seconds_count", **orgs) >= 1
+        assert sample(text, "http_request_duration_seconds_bucket", le="+Inf", **orgs) >= 1
+        assert sample(text, "db_queries_total", **orgs) >= 1
+        assert sample(text, "db_query_seconds_total", **orgs) > 0
+        assert sample(text, "password_hash_seconds_count", operation="hash") >= 1
+
+
+def test_metrics_add_up_worker_snapshots(app, client, tmp_path):
+    with app.test_request_context():
+        app.config['METRICS_DIR'] = str(tmp_path)
+        client.get(f"{base_url}/api/organisations")
+        own = sample(metrics.render(), "http_requests_total", endpoint="/api/organisations", status="401")
+
+        other = Snapshot()
+        other.add({("http_requests_total", (("endpoint", "/api/organisations"), ("method", "GET"),
+                                            ("status", "401"))): 5.0}, {})
+        # A live worker's snapshot is added, an exited one's is deleted
+        (tmp_path / f"{os.getppid()}.json").write_text(other.to_json())
+        exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                                capture_output=True, text=True, check=True).stdout.strip()
+        (tmp_path / f"{exited}.json").write_text(other.to_json())
+
+        text = client.get(f"{base_url}/metrics").get_data(as_text=True)
+        assert sample(text, "http_requests_total", endpoint="/api/organisations", status="401") == own + 5
+        assert (tmp_path / f"{os.getppid()}.json").exists()
+        assert not (tmp_path / f"{exited}.json").exists()
+
+
+def test_metrics_token(app, client):
+    with app.test_request_context():
+        app.config['METRICS_REQUIRE_TOKEN'] = True
+        assert client.get(f"{base_url}/metrics").status_code == 404
+
+        app.config['METRICS_TOKEN'] = "scrape-me"
+        assert client.get(f"{base_url}/metrics").status_code == 401
+        assert client.get(f"{base_url}/metrics", headers={'Authorization': 'Bearer wrong'}).status_code == 401
+        assert client.get(f"{base_url}/metrics", headers={'Authorization': 'Bearer scrape-me'}).status_code == 200
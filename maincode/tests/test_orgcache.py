@@ -0,0 +1,119 @@
+import threading
+import time
+
+from maincode import db, org_cache
+from maincode.mainapp.model import Organisation
+from maincode.mainapp.orgcache import MemoryBackend, SingleFlight, SQLiteBackend
+
+
+base_url = "http://localhost:5000"
+
+
+def test_memory_backend_lru_and_ttl():
+    backend = MemoryBackend(size=2)
+    backend.set("a", 1, now=0, ttl=10)
+    backend.set("b", 2, now=0, ttl=10)
+    assert backend.get("a", now=1) == 1
+    backend.set("c", 3, now=1, ttl=10)
+    # "b" was least recently used
+    assert (backend.get("a", 2), backend.get("b", 2), backend.get("c", 2)) == (1, None, 3)
+    assert backend.get("a", now=10) is None
+    backend.delete("c")
+    assert backend.get("c", now=2) is None
+
+
+def test_sqlite_backend_is_shared(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    one, two = SQLiteBackend(path, size=2), SQLiteBackend(path, size=2)
+    one.set("o1", {"data": {"name": "X"}, "version": 1}, now=0, ttl=10)
+    assert two.get("o1", now=5) == {"data": {"name": "X"}, "version": 1}
+    assert two.get("o1", now=10) is None
+
+    two.delete("o1")
+    one.set("o1", {"version": 2}, now=20, ttl=10)
+    one.set("o2", {"version": 1}, now=21, ttl=10)
+    one.set("o3", {"version": 1}, now=22, ttl=10)
+    one.prune(now=22)
+    assert [two.get(k, now=22) for k in ("o1", "o2", "o3")] == [None, {"version": 1}, {"version": 1}]
+
+
+def test_single_flight_loads_once():
+    flights = SingleFlight()
+    calls = []
+    release = threading.Event()
+    results = []
+
+    def load():
+        calls.append(1)
+        release.wait(5)
+        return "value"
+
+    threads = [threading.Thread(target=lambda: results.append(flights.do("k", load))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False] + [True] * 7
+    assert {value for value, _ in results} == {"value"}
+
+
+def test_get_org_served_from_cache_until_updated(app, client, query_budget, register):
+    with app.test_request_context():
+        org_cache.clear()
+        ada, headers = register("Ada", "ada@example.com")
+        url = f"{base_url}/api/organisations/{ada.defaultOrgId}"
+        assert client.get(url, headers=headers).json['data']['name'] == "Ada's Organisation"
+
+        hits = org_cache.stats.snapshot()['hits']
+        with query_budget(2) as log:
+            resp = client.get(url, headers=headers)
+        assert resp.json['data']['name'] == "Ada's Organisation"
+        assert not any("FROM organisations" in s for s in log.statements)
+        assert org_cache.stats.snapshot()['hits'] == hits + 1
+
+        # Commits touching the org invalidate it
+        org = Organisation.get_self(ada.defaultOrgId)
+        org.name = "Renamed"
+        db.session.commit()
+        assert client.get(url, headers=headers).json['data']['name'] == "Renamed"
+
+        # Rolled back changes don't
+        org.name = "Never saved"
+        db.session.flush()
+        db.session.rollback()
+        with query_budget(2):
+            assert client.get(url, headers=headers).json['data']['name'] == "Renamed"
+
+
+def test_membership_changes_invalidate_the_org(app, client, register):
+    with app.test_request_context():
+        org_cache.clear()
+        ada, headers = register("Ada", "ada@example.com")
+        bola, _ = register("Bola", "bola@example.com")
+        url = f"{base_url}/api/organisations/{ada.defaultOrgId}"
+        etag = client.get(url, headers=headers).headers['ETag']
+        assert client.get(url, headers=headers).headers['ETag'] == etag
+
+        # Bulk adds change the member count through Core UPDATEs, not the ORM
+        client.post(f"{base_url}/api/organisations/{ada.defaultOrgId}/users/bulk",
+                    json={"userIds": [bola.id]}, headers=headers)
+        resp = client.get(url, headers={**headers, 'If-None-Match': etag})
+        assert resp.status_code == 200
+        assert resp.headers['ETag'] != etag
+
+
+def test_org_cache_stats_admin_only(app, client, register):
+    with app.test_request_context():
+        app.config['ADMIN_EMAILS'] = {"admin@example.com"}
+        _, admin = register("Admin", "admin@example.com")
+        _, ada = register("Ada", "ada@example.com")
+
+        url = f"{base_url}/api/admin/stats/org-cache"
+        assert client.get(url, headers=ada).status_code == 403
+        data = client.get(url, headers=admin).json['data']
+        assert data['backend'] == "memory"
+        assert {'hits', 'misses', 'loads', 'shared', 'invalidations', 'hitRate'} <= set(data)
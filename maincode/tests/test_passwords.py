@@ -0,0 +1,64 @@
+from maincode import hasher
+from maincode.config import password_hash_workers
+
+
+base_url = "http://localhost:5000"
+
+udata = {
+    "firstName": "Ada",
+    "lastName": "Obioha",
+    "email": "ada@example.com",
+    "password": "mypassword",
+    "phone": "",
+}
+
+
+def test_hash_in_worker_pool(app):
+    app.config['PASSWORD_HASH_WORKERS'] = 1
+
+    pw_hash = hasher.hash("mypassword")
+    assert pw_hash.startswith("$2b$04$")
+    assert hasher.check(pw_hash, "mypassword")
+    assert not hasher.check(pw_hash, "notmypassword")
+
+    hashes = hasher.hash_many(["one", "two", "three"])
+    assert [hasher.check(h, p) for h, p in zip(hashes, ["one", "two", "three"])] == [True] * 3
+
+    # Resizing the pool shuts the old one down
+    old_pool = hasher._get_pool(1)
+    app.config['PASSWORD_HASH_WORKERS'] = 2
+    assert hasher.check(pw_hash, "mypassword")
+    assert hasher._pool is not old_pool
+    assert old_pool._shutdown_thread
+
+
+def test_saturated_pool_returns_503(app, client):
+    with app.test_request_context():
+        app.config['PASSWORD_HASH_MAX_PENDING'] = 0
+
+        resp = client.post(f"{base_url}/auth/register", json=udata)
+        assert resp.status_code == 503
+        assert resp.headers['Retry-After'] == str(app.config['PASSWORD_HASH_RETRY_AFTER'])
+
+        app.config['PASSWORD_HASH_MAX_PENDING'] = 32
+        assert client.post(f"{base_url}/auth/register", json=udata).status_code == 201
+
+        app.config['PASSWORD_HASH_MAX_PENDING'] = 0
+        resp = client.post(f"{base_url}/auth/login",
+                           json={"email": udata["email"], "password": udata["password"]})
+        assert resp.status_code == 503
+
+
+def test_hash_workers_split_cores_between_web_workers(monkeypatch):
+    monkeypatch.setattr("os.cpu_count", lambda: 8)
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    assert password_hash_workers() == 2
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    assert password_hash_workers() == 2
+    monkeypatch.setenv("WEB_CONCURRENCY", "16")
+    assert password_hash_workers() == 1
+    monkeypatch.setenv("WEB_CONCURRENCY", "1")
+    assert password_hash_workers() == 8
+    for junk in ("auto", "", "-3"):
+        monkeypatch.setenv("WEB_CONCURRENCY", junk)
+        assert password_hash_workers() == 2
@@ -0,0 +1,59 @@
+import logging
+
+import pytest
+
+from maincode import db
+from maincode.mainapp.model import User
+from maincode.mainapp.querybudget import (
+    QueryBudgetExceeded, QueryLog, check_budget, count_queries, fingerprint, uncounted,
+)
+
+
+base_url = "http://localhost:5000"
+
+
+def test_fingerprint_collapses_literals_and_in_lists():
+    a = fingerprint("SELECT * FROM users WHERE id IN (?, ?, ?) AND name = 'ada' LIMIT 10")
+    b = fingerprint("SELECT  *  FROM users WHERE id IN (%(id_1)s) AND name = 'bola' LIMIT 5")
+    assert a == b == "SELECT * FROM users WHERE id IN (...) AND name = ? LIMIT ?"
+
+
+def test_uncounted_statements_stay_out_of_open_logs(app):
+    with count_queries() as outer:
+        db.session.execute(db.text("SELECT 1"))
+        with uncounted():
+            with count_queries() as inner:
+                db.session.execute(db.text("SELECT 2"))
+            db.session.execute(db.text("SELECT 3"))
+        db.session.execute(db.text("SELECT 4"))
+    assert outer.statements == ["SELECT 1", "SELECT 4"]
+    assert inner.statements == ["SELECT 2"]
+
+
+def test_list_orgs_stays_within_budget(app, client, query_budget):
+    with app.test_request_context():
+        client.post(f"{base_url}/auth/register", json={
+            "firstName": "Ada", "lastName": "Obioha", "email": "ada@example.com",
+            "password": "mypassword", "phone": ""})
+        user = User.query.filter_by(email="ada@example.com").first()
+        headers = {'Authorization': f'Bearer {user.current_access_token}'}
+        for i in range(10):
+            client.post(f"{base_url}/api/organisations", json={"name": f"Org {i}"}, headers=headers)
+
+        with query_budget(4):
+            resp = client.get(f"{base_url}/api/organisations", headers=headers)
+        assert len(resp.json['data']['organisations']) == 11
+
+
+def test_over_budget_raises_or_warns(app, caplog):
+    log = QueryLog()
+    log.statements = ["SELECT * FROM organisations WHERE id = 1"] * 3
+
+    with app.test_request_context():
+        with pytest.raises(QueryBudgetExceeded):
+            check_budget(log, 2, "GET /api/organisations")
+
+        app.config['QUERY_BUDGET_RAISE'] = False
+        with caplog.at_level(logging.WARNING):
+            check_budget(log, 2, "GET /api/organisations")
+        assert "3 x SELECT * FROM organisations WHERE id = ?" in caplog.text
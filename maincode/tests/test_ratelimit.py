@@ -0,0 +1,74 @@
+from flask import request
+
+from maincode import config, create_app, limiter
+from maincode.mainapp.ratelimit import MemoryBackend, MmapBackend
+
+
+base_url = "http://localhost:5000"
+
+
+def test_memory_backend_refills():
+    backend = MemoryBackend()
+    assert backend.consume("k", 2, 1.0, now=100.0) == 0
+    assert backend.consume("k", 2, 1.0, now=100.0) == 0
+    assert backend.consume("k", 2, 1.0, now=100.0) == 1.0
+    assert backend.consume("k", 2, 1.0, now=101.0) == 0
+    assert backend.consume("other", 2, 1.0, now=101.0) == 0
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(max_keys=3)
+    assert backend.consume("victim", 1, 0.01, now=100.0) == 0
+    for i in range(10):
+        # Fresh keys keep arriving, the throttled one stays in use
+        backend.consume(f"rotating{i}", 1, 0.01, now=100.0)
+        assert backend.consume("victim", 1, 0.01, now=100.0) > 0
+    assert len(backend._buckets) == 3
+
+
+def test_mmap_backend_is_shared(tmp_path):
+    path = str(tmp_path / "buckets.bin")
+    worker1, worker2 = MmapBackend(path, slots=64), MmapBackend(path, slots=64)
+
+    assert worker1.consume("k", 2, 0.5, now=100.0) == 0
+    assert worker2.consume("k", 2, 0.5, now=100.0) == 0
+    assert worker1.consume("k", 2, 0.5, now=100.0) == 2.0
+    assert worker2.consume("k", 2, 0.5, now=102.0) == 0
+    assert worker1.peek("k", 2, 0.5, now=102.0) == 2.0
+
+
+def test_login_is_throttled_by_email(app, client):
+    with app.test_request_context():
+        app.config['RATELIMIT_ENABLED'] = True
+        app.config['RATELIMIT_RULES'] = {"login": {"email": (2, 60)}}
+
+        creds = {"email": "Ada@example.com", "password": "mypassword"}
+        assert client.post(f"{base_url}/auth/login", json=creds).status_code == 401
+        assert client.post(f"{base_url}/auth/login", json=creds).status_code == 401
+
+        creds["email"] = "ada@example.com"
+        resp = client.post(f"{base_url}/auth/login", json=creds)
+        assert resp.status_code == 429
+        assert int(resp.headers['Retry-After']) == 30
+
+
+def test_refused_hit_spends_no_other_bucket(app):
+    with app.test_request_context():
+        app.config['RATELIMIT_ENABLED'] = True
+        app.config['RATELIMIT_RULES'] = {"login": {"ip": (1, 60), "email": (2, 60)}}
+
+        assert limiter.hit("login", ip="192.0.2.1", email="spend@example.com") == 0
+        assert limiter.hit("login", ip="192.0.2.1", email="spend@example.com") > 0
+        # The refused hit left the email bucket's last token alone
+        assert limiter.hit("login", ip="192.0.2.2", email="spend@example.com") == 0
+        assert limiter.hit("login", ip="192.0.2.3", email="spend@example.com") > 0
+
+
+def test_proxy_fix_takes_client_from_forwarded_for(monkeypatch):
+    monkeypatch.setattr(config.config_classes['testing'], 'PROXY_FIX_X_FOR', 1)
+    app = create_app(config_type='testing')
+    app.add_url_rule("/remote-addr", "remote_addr", lambda: request.remote_addr)
+
+    resp = app.test_client().get("/remote-addr", headers={"X-Forwarded-For": "203.0.113.7"},
+                                 environ_base={"REMOTE_ADDR": "10.0.0.1"})
+    assert resp.get_data(as_text=True) == "203.0.113.7"
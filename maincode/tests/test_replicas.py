@@ -0,0 +1,64 @@
+import pytest
+
+from maincode import db, create_app
+from maincode.config import TestingConfig
+from maincode.mainapp.model import User
+
+
+base_url = "http://localhost:5000"
+
+
+@pytest.fixture
+def replica_app(tmp_path, monkeypatch):
+    monkeypatch.setattr(TestingConfig, "SQLALCHEMY_REPLICA_URIS", [f"sqlite:///{tmp_path}/replica.db"])
+    app = create_app(config_type='testing')
+    app_ctx = app.app_context()
+    app_ctx.push()
+    db.create_all()
+    # The replica starts with the schema but none of the rows
+    db.metadata.create_all(db.engines['replica_0'])
+    yield app
+    db.session.remove()
+    db.drop_all()
+    app_ctx.pop()
+
+
+def test_reads_route_to_replica_outside_the_write_window(replica_app):
+    client = replica_app.test_client()
+    # Not a GET, so the test's own queries read the primary
+    with replica_app.test_request_context(method="POST"):
+        client.post(f"{base_url}/auth/register", json={
+            "firstName": "Ada", "lastName": "Obioha", "email": "ada@example.com",
+            "password": "mypassword", "phone": ""})
+        user = User.query.filter_by(email="ada@example.com").first()
+        headers = {'Authorization': f'Bearer {user.current_access_token}'}
+
+        # The token was just issued, so reads stay on the primary
+        assert client.get(f"{base_url}/api/users/{user.id}", headers=headers).status_code == 200
+
+        # Past the window the read goes to the (lagging) replica
+        replica_app.config['READ_YOUR_WRITES_SECONDS'] = 0
+        resp = client.get(f"{base_url}/api/users/{user.id}", headers=headers)
+        assert resp.status_code == 401
+        assert resp.json['error'] == "user_not_found"
+
+        # Writes always go to the primary
+        resp = client.post(f"{base_url}/api/organisations", json={"name": "Acme"}, headers=headers)
+        assert resp.status_code == 201
+
+
+def test_revocation_checks_read_the_primary(replica_app):
+    assert 'replica_0' not in db.metadatas
+    client = replica_app.test_client()
+    with replica_app.test_request_context(method="POST"):
+        client.post(f"{base_url}/auth/register", json={
+            "firstName": "Ada", "lastName": "Obioha", "email": "ada@example.com",
+            "password": "mypassword", "phone": ""})
+        user = User.query.filter_by(email="ada@example.com").first()
+        headers = {'Authorization': f'Bearer {user.current_access_token}'}
+
+        assert client.post(f"{base_url}/auth/logout", headers=headers).status_code == 200
+        # The replica hasn't seen the revocation, the primary has
+        resp = client.get(f"{base_url}/api/users/{user.id}", headers=headers)
+        assert resp.status_code == 401
+        assert resp.json['error'] == "token_revoked"
@@ -0,0 +1,93 @@
+from datetime import timedelta
+
+from maincode import db
+from maincode.mainapp import utils as au
+from maincode.mainapp.model import User, AccessToken, RevokedToken
+from maincode.mainapp.revocation import BloomFilter
+
+
+base_url = "http://localhost:5000"
+
+udata = {
+    "firstName": "Ada",
+    "lastName": "Obioha",
+    "email": "ada@example.com",
+    "password": "mypassword",
+    "phone": "",
+}
+
+
+def auth_header(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_login_appends_to_token_history(app, client):
+    with app.test_request_context():
+        first = client.post(f"{base_url}/auth/register", json=udata).json['data']['accessToken']
+        creds = {"email": udata["email"], "password": udata["password"]}
+        second = client.post(f"{base_url}/auth/login", json=creds).json['data']['accessToken']
+        assert first != second
+
+        user = User.query.filter_by(email=udata["email"]).first()
+        db.session.expire_all()
+        assert user.current_access_token == second
+        assert AccessToken.query.filter_by(userId=user.id).count() == 2
+
+
+def test_logout_revokes_token(app, client):
+    with app.test_request_context():
+        token = client.post(f"{base_url}/auth/register", json=udata).json['data']['accessToken']
+        creds = {"email": udata["email"], "password": udata["password"]}
+        other = client.post(f"{base_url}/auth/login", json=creds).json['data']['accessToken']
+
+        assert client.get(f"{base_url}/api/organisations", headers=auth_header(token)).status_code == 200
+
+        resp = client.post(f"{base_url}/auth/logout", json={}, headers=auth_header(token))
+        assert resp.status_code == 200
+
+        resp = client.get(f"{base_url}/api/organisations", headers=auth_header(token))
+        assert resp.status_code == 401
+        assert resp.json['error'] == "token_revoked"
+        assert client.get(f"{base_url}/api/organisations", headers=auth_header(other)).status_code == 200
+
+        client.post(f"{base_url}/auth/logout", json={"allSessions": True}, headers=auth_header(other))
+        assert client.get(f"{base_url}/api/organisations", headers=auth_header(other)).status_code == 401
+
+
+def test_purge_tokens_deletes_only_expired_rows(app, client):
+    with app.test_request_context():
+        client.post(f"{base_url}/auth/register", json=udata)
+        creds = {"email": udata["email"], "password": udata["password"]}
+        for _ in range(4):
+            client.post(f"{base_url}/auth/login", json=creds)
+        user = User.query.filter_by(email=udata["email"]).first()
+        live = client.post(f"{base_url}/auth/login", json=creds).json['data']['accessToken']
+
+        tokens = AccessToken.query.filter_by(userId=user.id).order_by(AccessToken.id).all()
+        past = au.aware_utcnow() - timedelta(hours=1)
+        for token in tokens[:4]:
+            token.expires_at = past
+            db.session.add(RevokedToken(jti=token.jti, userId=user.id, expires_at=past))
+        db.session.add(RevokedToken(jti=tokens[4].jti, userId=user.id, expires_at=tokens[4].expires_at))
+        db.session.commit()
+
+        result = app.test_cli_runner().invoke(args=["purge-tokens", "--batch-size", "2"])
+        assert result.exit_code == 0
+        assert "Purged 4 access token(s) and 4 revoked token(s)" in result.output
+
+        db.session.expire_all()
+        assert [t.jti for t in AccessToken.query.order_by(AccessToken.id)] == [t.jti for t in tokens[4:]]
+        assert [t.jti for t in RevokedToken.query.all()] == [tokens[4].jti]
+        assert user.current_access_token == live
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    items = [f"jti-{i}" for i in range(1000)]
+    for item in items:
+        bloom.add(item)
+
+    assert all(item in bloom for item in items)
+    assert bloom.count <= 1000
+    false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_positives < 300
@@ -0,0 +1,23 @@
+import sentry_sdk
+
+from maincode.mainapp.tracing import make_traces_sampler
+
+
+def environ(path):
+    return {"wsgi_environ": {"PATH_INFO": path}}
+
+
+def test_traces_sampler_uses_longest_route_prefix():
+    sampler = make_traces_sampler(0.1, {"/api/organisations": 0.01, "/api/organisations/bulk": 0.5})
+
+    assert sampler(environ("/api/organisations")) == 0.01
+    assert sampler(environ("/api/organisations/abc/users")) == 0.01
+    assert sampler(environ("/api/organisations/bulk")) == 0.5
+    assert sampler(environ("/api/organisationsx")) == 0.1
+    assert sampler(environ("/auth/login")) == 0.1
+    assert sampler({"parent_sampled": True, **environ("/api/organisations")}) == 1.0
+
+
+def test_sentry_skipped_without_dsn(app):
+    assert app.config['SENTRY_DSN'] is None
+    assert not sentry_sdk.get_client().is_active()
@@ -4,6 +4,7 @@ from logging.config import fileConfig
 from flask import current_app
 
 from alembic import context
+from alembic.operations import MigrateOperation, Operations
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -45,6 +46,80 @@ target_db = current_app.extensions['migrate'].db
 # ... etc.
 
 
+# Online index builds
+# ------------------
+# op.create_index_concurrently() / op.drop_index_concurrently() build and
+# drop indexes without blocking writes to the table. On postgres they run
+# CREATE/DROP INDEX CONCURRENTLY in an autocommit block, since that can't
+# run inside a transaction, and first clear any invalid index a failed
+# concurrent build left behind. Other databases get a plain CREATE INDEX.
+
+
+@Operations.register_operation("create_index_concurrently")
+class CreateIndexConcurrentlyOp(MigrateOperation):
+
+    def __init__(self, index_name, table_name, columns, unique=False):
+        self.index_name = index_name
+        self.table_name = table_name
+        self.columns = columns
+        self.unique = unique
+
+    @classmethod
+    def create_index_concurrently(cls, operations, index_name, table_name, columns, unique=False):
+        return operations.invoke(cls(index_name, table_name, columns, unique=unique))
+
+    def reverse(self):
+        return DropIndexConcurrentlyOp(self.index_name, self.table_name, self.columns, unique=self.unique)
+
+
+@Operations.register_operation("drop_index_concurrently")
+class DropIndexConcurrentlyOp(MigrateOperation):
+
+    def __init__(self, index_name, table_name, columns=None, unique=False):
+        self.index_name = index_name
+        self.table_name = table_name
+        self.columns = columns
+        self.unique = unique
+
+    @classmethod
+    def drop_index_concurrently(cls, operations, index_name, table_name):
+        return operations.invoke(cls(index_name, table_name))
+
+    def reverse(self):
+        return CreateIndexConcurrentlyOp(self.index_name, self.table_name, self.columns, unique=self.unique)
+
+
+def _drop_invalid_index(operations, index_name):
+    invalid = operations.get_bind().exec_driver_sql(
+        "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = %(name)s AND NOT i.indisvalid", {"name": index_name}).first()
+    if invalid:
+        operations.drop_index(index_name, postgresql_concurrently=True, if_exists=True)
+
+
+@Operations.implementation_for(CreateIndexConcurrentlyOp)
+def create_index_concurrently(operations, operation):
+    if operations.get_context().dialect.name != "postgresql":
+        operations.create_index(operation.index_name, operation.table_name, operation.columns,
+                                unique=operation.unique)
+        return
+    with operations.get_context().autocommit_block():
+        if not context.is_offline_mode():
+            _drop_invalid_index(operations, operation.index_name)
+        operations.create_index(operation.index_name, operation.table_name, operation.columns,
+                                unique=operation.unique, postgresql_concurrently=True, if_not_exists=True)
+
+
+@Operations.implementation_for(DropIndexConcurrentlyOp)
+def drop_index_concurrently(operations, operation):
+    if operations.get_context().dialect.name != "postgresql":
+        operations.drop_index(operation.index_name, operation.table_name)
+        return
+    with operations.get_context().autocommit_block():
+        operations.drop_index(operation.index_name, operation.table_name,
+                              postgresql_concurrently=True, if_exists=True)
+
+
 def get_metadata():
     if hasattr(target_db, 'metadatas'):
         return target_db.metadatas[None]
@@ -100,6 +175,9 @@ def run_migrations_online():
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
+            # Each revision commits on its own, so a concurrent
+            # index build only ends its own migration's transaction
+            transaction_per_migration=True,
             **conf_args
         )
 
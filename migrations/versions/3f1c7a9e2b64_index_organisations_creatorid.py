@@ -0,0 +1,29 @@
+"""Index organisations.creatorId for membership lookups
+
+Revision ID: 3f1c7a9e2b64
+Revises: b754d4142fb4
+Create Date: 2026-10-18 09:12:41.208113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c7a9e2b64'
+down_revision = 'b754d4142fb4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The "orgs I belong to" half of the membership UNION is served by
+    # the (users_id, organisations_id) primary key of users_organisations.
+    # The "orgs I created" half needs its own index on creatorId.
+    with op.batch_alter_table('organisations', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_organisations_creatorId'), ['creatorId'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('organisations', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_organisations_creatorId'))
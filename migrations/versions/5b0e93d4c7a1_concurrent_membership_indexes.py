@@ -0,0 +1,31 @@
+"""Index users_organisations by organisation and organisations.name
+
+Revision ID: 5b0e93d4c7a1
+Revises: c4a8e61f0d27
+Create Date: 2026-10-18 15:02:17.408395
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b0e93d4c7a1'
+down_revision = 'c4a8e61f0d27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The (users_id, organisations_id) primary key only serves lookups by
+    # user; listing an organisation's members needs the reverse order.
+    # organisations.creatorId is already indexed by 3f1c7a9e2b64.
+    # Both build concurrently on postgres (see migrations/env.py).
+    op.create_index_concurrently('ix_users_organisations_organisations_id_users_id',
+                                 'users_organisations', ['organisations_id', 'users_id'])
+    op.create_index_concurrently('ix_organisations_name', 'organisations', ['name'])
+
+
+def downgrade():
+    op.drop_index_concurrently('ix_organisations_name', 'organisations')
+    op.drop_index_concurrently('ix_users_organisations_organisations_id_users_id', 'users_organisations')
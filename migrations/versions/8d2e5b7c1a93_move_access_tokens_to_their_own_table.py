@@ -0,0 +1,130 @@
+"""Move users._accessTokens into an append-only access_tokens table
+
+Revision ID: 8d2e5b7c1a93
+Revises: 3f1c7a9e2b64
+Create Date: 2026-10-18 11:47:05.531902
+
+"""
+import logging
+from datetime import datetime, timezone
+
+import jwt
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2e5b7c1a93'
+down_revision = '3f1c7a9e2b64'
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 1000
+
+logger = logging.getLogger('alembic.env')
+
+
+def _claims(token):
+    # Only the payload is needed here; the signature was
+    # checked when the token was issued
+    try:
+        return jwt.decode(token, options={"verify_signature": False})
+    except jwt.DecodeError:
+        return None
+
+
+def _timestamp(claims, key):
+    if key not in claims:
+        return None
+    return datetime.fromtimestamp(claims[key], timezone.utc)
+
+
+def _user_batches(bind, columns):
+    # Keyset pagination over users so memory stays flat
+    last_id = ""
+    while True:
+        rows = bind.execute(sa.text(
+            f'SELECT {columns} FROM users WHERE id > :last_id ORDER BY id LIMIT :limit'
+        ), {"last_id": last_id, "limit": BATCH_SIZE}).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def upgrade():
+    access_tokens = op.create_table('access_tokens',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('userId', sa.String(), nullable=False),
+    sa.Column('jti', sa.String(), nullable=False),
+    sa.Column('token', sa.String(), nullable=False),
+    sa.Column('issued_at', sa.DateTime(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['userId'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('jti')
+    )
+    with op.batch_alter_table('access_tokens', schema=None) as batch_op:
+        batch_op.create_index('ix_access_tokens_userId_issued_at', ['userId', 'issued_at'], unique=False)
+
+    bind = op.get_bind()
+    for users in _user_batches(bind, 'id, "_accessTokens"'):
+        rows, seen = [], set()
+        for user_id, history in users:
+            for entry in history or []:
+                claims = _claims(entry.get('token') or "")
+                if claims is None:
+                    # Nothing can be checked against a token that doesn't decode
+                    logger.warning("Skipping an undecodable access token of user %s", user_id)
+                    continue
+                if not claims.get('jti') or claims['jti'] in seen:
+                    continue
+                seen.add(claims['jti'])
+                rows.append({
+                    'userId': user_id,
+                    'jti': claims['jti'],
+                    'token': entry['token'],
+                    'issued_at': _timestamp(claims, 'iat') or datetime.fromisoformat(entry['datetime']),
+                    'expires_at': _timestamp(claims, 'exp'),
+                })
+        if rows:
+            op.bulk_insert(access_tokens, rows)
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('_accessTokens')
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('_accessTokens', postgresql.JSON(astext_type=sa.Text()), nullable=True))
+
+    # Only the latest token per user is restored, which is
+    # all the JSON column used to hold
+    bind = op.get_bind()
+    users_table = sa.table('users', sa.column('id', sa.String()),
+                           sa.column('_accessTokens', sa.JSON()))
+    for users in _user_batches(bind, 'id'):
+        user_ids = [row[0] for row in users]
+        latest = bind.execute(sa.text(
+            'SELECT "userId", token, issued_at FROM ('
+            '  SELECT "userId", token, issued_at, ROW_NUMBER() OVER ('
+            '    PARTITION BY "userId" ORDER BY issued_at DESC, id DESC) AS position'
+            '  FROM access_tokens WHERE "userId" IN :user_ids'
+            ') AS latest WHERE position = 1'
+        ).bindparams(sa.bindparam('user_ids', expanding=True)), {"user_ids": user_ids}).fetchall()
+        for user_id, token, issued_at in latest:
+            bind.execute(users_table.update().where(users_table.c.id == user_id).values(
+                _accessTokens=[{'user_id': user_id, 'token': token, 'datetime': issued_at.isoformat()}]
+            ))
+
+    bind.execute(users_table.update().where(users_table.c._accessTokens.is_(None))
+                 .values(_accessTokens=[]))
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.alter_column('_accessTokens', nullable=False)
+
+    with op.batch_alter_table('access_tokens', schema=None) as batch_op:
+        batch_op.drop_index('ix_access_tokens_userId_issued_at')
+
+    op.drop_table('access_tokens')
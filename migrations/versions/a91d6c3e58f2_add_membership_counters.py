@@ -0,0 +1,63 @@
+"""Add organisations.memberCount and users.orgCount
+
+Revision ID: a91d6c3e58f2
+Revises: e7f4a2c9b815
+Create Date: 2026-10-18 16:20:48.115027
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a91d6c3e58f2'
+down_revision = 'e7f4a2c9b815'
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 1000
+
+
+def _backfill(bind, table, column, counted_by):
+    # Set-based, one keyset batch of rows per UPDATE. Runs in an
+    # autocommit block, so each batch commits and releases its locks
+    last_id = ""
+    while True:
+        ids = bind.execute(sa.text(
+            f'SELECT id FROM {table} WHERE id > :last_id ORDER BY id LIMIT :limit'
+        ), {"last_id": last_id, "limit": BATCH_SIZE}).scalars().all()
+        if not ids:
+            return
+        bind.execute(sa.text(
+            f'UPDATE {table} SET "{column}" = ('
+            f'  SELECT count(*) FROM users_organisations uo WHERE uo.{counted_by} = {table}.id'
+            f') WHERE {table}.id IN :ids'
+        ).bindparams(sa.bindparam('ids', expanding=True)), {"ids": ids})
+        last_id = ids[-1]
+
+
+def _columns(bind, table):
+    return {c['name'] for c in sa.inspect(bind).get_columns(table)}
+
+
+def upgrade():
+    bind = op.get_bind()
+    # The backfill commits as it goes, so a failed run may have added the columns already
+    if 'memberCount' not in _columns(bind, 'organisations'):
+        with op.batch_alter_table('organisations', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('memberCount', sa.Integer(), server_default='0', nullable=False))
+    if 'orgCount' not in _columns(bind, 'users'):
+        with op.batch_alter_table('users', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('orgCount', sa.Integer(), server_default='0', nullable=False))
+
+    with op.get_context().autocommit_block():
+        _backfill(bind, 'organisations', 'memberCount', 'organisations_id')
+        _backfill(bind, 'users', 'orgCount', 'users_id')
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('orgCount')
+    with op.batch_alter_table('organisations', schema=None) as batch_op:
+        batch_op.drop_column('memberCount')
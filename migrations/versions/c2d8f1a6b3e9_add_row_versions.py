@@ -0,0 +1,88 @@
+"""Add version, updated_on and users.membershipVersion
+
+Revision ID: c2d8f1a6b3e9
+Revises: a91d6c3e58f2
+Create Date: 2026-10-18 17:05:12.402381
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2d8f1a6b3e9'
+down_revision = 'a91d6c3e58f2'
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 1000
+
+
+def _backfill(bind, table):
+    # updated_on starts out as created_on, one keyset batch per UPDATE.
+    # Runs in an autocommit block, so each batch commits and releases its locks
+    last_id = ""
+    while True:
+        ids = bind.execute(sa.text(
+            f'SELECT id FROM {table} WHERE id > :last_id ORDER BY id LIMIT :limit'
+        ), {"last_id": last_id, "limit": BATCH_SIZE}).scalars().all()
+        if not ids:
+            return
+        bind.execute(sa.text(
+            f'UPDATE {table} SET updated_on = created_on WHERE id IN :ids'
+        ).bindparams(sa.bindparam('ids', expanding=True)), {"ids": ids})
+        last_id = ids[-1]
+
+
+def _set_not_null(table):
+    # SET NOT NULL scans the table under ACCESS EXCLUSIVE. On PostgreSQL
+    # a validated CHECK proves the column has no NULLs first, so the
+    # scan happens under VALIDATE's SHARE UPDATE EXCLUSIVE instead and
+    # SET NOT NULL skips it. Each statement commits on its own, so the
+    # brief exclusive locks aren't held across the scan.
+    if op.get_context().dialect.name != 'postgresql':
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('updated_on', existing_type=sa.DateTime(), nullable=False)
+        return
+
+    check = f'ck_{table}_updated_on_not_null'
+    op.execute(f'ALTER TABLE {table} ADD CONSTRAINT {check} CHECK (updated_on IS NOT NULL) NOT VALID')
+    op.execute(f'ALTER TABLE {table} VALIDATE CONSTRAINT {check}')
+    op.alter_column(table, 'updated_on', existing_type=sa.DateTime(), nullable=False)
+    op.drop_constraint(check, table)
+
+
+def _columns(bind, table):
+    return {c['name'] for c in sa.inspect(bind).get_columns(table)}
+
+
+def upgrade():
+    bind = op.get_bind()
+    # The backfill commits as it goes, so a failed run may have added the columns already.
+    # Constant defaults, so adding the NOT NULL columns doesn't rewrite the tables
+    if 'version' not in _columns(bind, 'organisations'):
+        with op.batch_alter_table('organisations', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('updated_on', sa.DateTime(), nullable=True))
+            batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    if 'version' not in _columns(bind, 'users'):
+        with op.batch_alter_table('users', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('updated_on', sa.DateTime(), nullable=True))
+            batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+            batch_op.add_column(sa.Column('membershipVersion', sa.Integer(), server_default='1', nullable=False))
+
+    with op.get_context().autocommit_block():
+        _backfill(bind, 'organisations')
+        _backfill(bind, 'users')
+        _set_not_null('organisations')
+        _set_not_null('users')
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('membershipVersion')
+        batch_op.drop_column('version')
+        batch_op.drop_column('updated_on')
+    with op.batch_alter_table('organisations', schema=None) as batch_op:
+        batch_op.drop_column('version')
+        batch_op.drop_column('updated_on')
@@ -0,0 +1,75 @@
+"""Add users.defaultOrgId pointing at each user's default organisation
+
+Revision ID: e7f4a2c9b815
+Revises: 5b0e93d4c7a1
+Create Date: 2026-10-18 15:41:26.903517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7f4a2c9b815'
+down_revision = '5b0e93d4c7a1'
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 1000
+
+
+def _create_foreign_key(bind):
+    fk = 'fk_users_defaultOrgId_organisations'
+    if op.get_context().dialect.name != 'postgresql':
+        with op.batch_alter_table('users', schema=None) as batch_op:
+            batch_op.create_foreign_key(fk, 'organisations', ['defaultOrgId'], ['id'], ondelete='SET NULL')
+        return
+
+    # Adding the FK NOT VALID only takes brief locks; VALIDATE then
+    # scans users under SHARE UPDATE EXCLUSIVE, which doesn't block
+    # writes. Each commits on its own
+    with op.get_context().autocommit_block():
+        if fk not in {c['name'] for c in sa.inspect(bind).get_foreign_keys('users')}:
+            op.execute(
+                f'ALTER TABLE users ADD CONSTRAINT "{fk}" FOREIGN KEY ("defaultOrgId") '
+                f'REFERENCES organisations (id) ON DELETE SET NULL NOT VALID')
+        op.execute(f'ALTER TABLE users VALIDATE CONSTRAINT "{fk}"')
+
+
+def upgrade():
+    bind = op.get_bind()
+    # The backfill commits as it goes, so a failed run may have added the column already
+    if 'defaultOrgId' not in {c['name'] for c in sa.inspect(bind).get_columns('users')}:
+        with op.batch_alter_table('users', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('defaultOrgId', sa.String(), nullable=True))
+
+    # The default org is the oldest one a user created under the
+    # "<firstName>'s Organisation" name. Batched by keyset over users,
+    # and each batch commits on its own, so row locks are held for one
+    # batch rather than until the end of the migration.
+    with op.get_context().autocommit_block():
+        last_id = ""
+        while True:
+            user_ids = bind.execute(sa.text(
+                'SELECT id FROM users WHERE id > :last_id ORDER BY id LIMIT :limit'
+            ), {"last_id": last_id, "limit": BATCH_SIZE}).scalars().all()
+            if not user_ids:
+                break
+            bind.execute(sa.text(
+                'UPDATE users SET "defaultOrgId" = ('
+                '  SELECT o.id FROM organisations o'
+                '  WHERE o."creatorId" = users.id AND o.name = users."firstName" || :suffix'
+                '  ORDER BY o.created_on, o.id LIMIT 1'
+                ') WHERE users.id IN :user_ids'
+            ).bindparams(sa.bindparam('user_ids', expanding=True)),
+                {"suffix": "'s Organisation", "user_ids": user_ids})
+            last_id = user_ids[-1]
+
+    _create_foreign_key(bind)
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_users_defaultOrgId_organisations', type_='foreignkey')
+        batch_op.drop_column('defaultOrgId')